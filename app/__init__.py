@@ -1,7 +1,14 @@
 from flask import Flask
 from .routes import register_routes
+from .utils.startup import StartupReport, warm_up
 
 def create_app():
+    report = StartupReport()
     app = Flask(__name__)
-    register_routes(app)
+    register_routes(app, report)
+    report.finish()
+    app.config["STARTUP_REPORT"] = report
+    report.log()
+    # Heavy backends load on first use, WARMUP_BACKENDS preloads them
+    warm_up(report=report)
     return app
\ No newline at end of file
@@ -1,62 +1,137 @@
-from flask import Blueprint, request, jsonify
-from app.services.text_align_forcer import force_align_lyrics_with_mfa, force_align_lyrics_with_gentle, force_align_lyrics_with_whisperx
-from textgrid import TextGrid
+from flask import Blueprint, Response, request, jsonify
+from app.services import alignment_cache
+from app.services.aligners import ALIGN_DEFAULT_BACKEND, align_lyrics, backend_stats, backend_version, parse_textgrid_to_json
+from app.services.model_registry import model_registry
+from app.services.timing_format import MSGPACK_MIMETYPE, CompactTimings
+from app.services.whisperx_batcher import batcher_stats
+from app.services.vocal_regions import prepare_vocals_for_alignment
+from app.utils.decoded_audio import DecodedAudio, file_hash
+from app.utils.workspace import create_workspace
 
 align_bp = Blueprint('align', __name__)
 
-def parse_textgrid_to_json(textgrid_path):
-    tg = TextGrid()
-    tg.read(textgrid_path)
-    # Giả sử tier đầu tiên là lyrics
-    tier = tg[0]
-    segments = []
-    for interval in tier:
-        if interval.mark.strip():
-            segments.append({
-                "start": int(interval.minTime * 1000),  # convert to ms
-                "end": int(interval.maxTime * 1000),    # convert to ms
-                "text": interval.mark
-            })
-    return segments
+def _alignment_response(response, include_raw, compact):
+    """
+    JSON by default, compact parallel arrays as msgpack for Accept: application/x-msgpack,
+    or as JSON lists when compact is set.
+    """
+    if request.accept_mimetypes.best_match(['application/json', MSGPACK_MIMETYPE]) == MSGPACK_MIMETYPE:
+        result = Response(CompactTimings.from_alignment(response).pack(), mimetype=MSGPACK_MIMETYPE)
+    elif compact:
+        result = jsonify(CompactTimings.from_alignment(response).to_dict())
+    else:
+        if not include_raw:
+            response = {key: value for key, value in response.items() if key != 'raw'}
+        result = jsonify(response)
+    result.headers['Vary'] = 'Accept'
+    return result
 
 @align_bp.route('/align', methods=['POST'])
 def align():
     """
-    API endpoint to force-align lyrics with audio using MFA.
+    API endpoint to force-align lyrics with audio.
     Expects:
       - audio_file: file (wav or mp3)
       - lyrics: string (lyrics to align)
+      - language: optional, ISO 639-1 code (default "en")
+      - backend: optional, "auto" (cheapest confident backend) or aeneas / gentle / whisperx / mfa;
+        whisperx returns its own transcription's timings and is never picked by auto
+      - vocals_only: optional, 1 to align the separated vocals only
+      - raw: optional, 1 to include the backend's own output
+      - compact: optional, 1 to get the compact arrays as JSON (ignored for msgpack)
+    Returns: {"backend", "confidence", "raw_confidence", "words": [...], "lines": [...]} with times in ms,
+      or with Accept: application/x-msgpack / compact=1 the same timings as compact arrays (see timing_format)
     """
     audio_file = request.files.get('audio_file')
     language = request.form.get('language', 'en')
+    backend = request.form.get('backend') or ALIGN_DEFAULT_BACKEND
+    # vocals_only=1: align the separated vocals with silence cut out
+    vocals_only = request.form.get('vocals_only', '').lower() in ('1', 'true', 'yes')
+    include_raw = request.form.get('raw', '').lower() in ('1', 'true', 'yes')
+    compact = request.form.get('compact', '').lower() in ('1', 'true', 'yes')
 
     lyrics = request.form.get('lyrics')
     if not audio_file or not lyrics:
         return jsonify({'error': 'Missing audio_file or lyrics'}), 400
 
-    # Đường dẫn model và dictionary (bạn cần chỉnh lại cho phù hợp hệ thống của bạn)
-    acoustic_model_path = "/path/to/acoustic_model.zip"
-    dictionary_path = "/path/to/dictionary.dict"
-
-    # textgrid_path, error = force_align_lyrics_with_mfa(
-    #     lyrics,
-    #     audio_file,
-    #     acoustic_model_path,
-    #     dictionary_path
-    # )
-    
-    result, error = force_align_lyrics_with_gentle(
-        lyrics,
-        audio_file
-    )
-
-    # result, error = force_align_lyrics_with_whisperx(
-    #     audio_file,
-    #     language=language
-    # )
+    with create_workspace() as workspace:
+        audio_path = workspace.file_path(audio_file.filename, default="input")
+        audio_file.save(audio_path)
+
+        # Same upload + lyrics + settings + backend version: answer from the cache.
+        # Keyed on the raw bytes so a cache hit never has to decode the track.
+        version = backend_version(backend)
+        cache_key = alignment_cache.cache_key(
+            file_hash(audio_path), lyrics, language, backend, version,
+            options='vocals_only' if vocals_only else ''
+        )
+        response = alignment_cache.lookup(cache_key)
+        if response is not None:
+            return _alignment_response(dict(response, cached=True), include_raw, compact)
+
+        timeline = None
+        if vocals_only:
+            try:
+                # Decode up front so an unreadable upload is a 400, not a 500
+                audio = DecodedAudio.from_file(audio_path)
+                audio.samples
+            except Exception:
+                return jsonify({'error': 'Could not decode audio_file'}), 400
+            audio_path, timeline, error = prepare_vocals_for_alignment(audio, workspace)
+            if error:
+                return jsonify({'error': error}), 500
+
+        result, error, attempts = align_lyrics(lyrics, audio_path, workspace, language=language, backend=backend)
 
     if error:
-        return jsonify({'error': error}), 500
+        status = 400 if error.startswith('Unknown backend') else 500
+        return jsonify({'error': error, 'attempts': attempts}), status
+
+    response = result.to_dict(include_raw=True)
+    response['attempts'] = attempts
+    if timeline is not None:
+        # Times come back relative to the voiced audio, map them onto the track
+        response['words'] = timeline.remap(response['words'], scale=1000)
+        response['lines'] = timeline.remap(response['lines'], scale=1000)
+        response['raw'] = timeline.remap(response['raw'])
+        response['vocals_only'] = timeline.to_dict()
+    alignment_cache.store(cache_key, response, backend, version)
+
+    return _alignment_response(dict(response, cached=False), include_raw, compact)
+
+
+@align_bp.route('/align/backends', methods=['GET'])
+def align_backends():
+    """
+    Availability, relative cost and latency (p50 / p95 over recent calls) per backend.
+    """
+    return jsonify(backend_stats())
 
-    # Parse TextGrid thành JSON
-    return jsonify(result)
\ No newline at end of file
+
+@align_bp.route('/align/models', methods=['GET'])
+def align_models():
+    """
+    Resident alignment models with their size, load time and hit counts,
+    plus WhisperX batching counters.
+    """
+    stats = model_registry.stats()
+    stats['batchers'] = batcher_stats()
+    return jsonify(stats)
+
+
+
+@align_bp.route('/align/cache', methods=['GET'])
+def align_cache_stats():
+    return jsonify(alignment_cache.cache_stats())
+
+
+@align_bp.route('/align/cache', methods=['DELETE'])
+def align_cache_invalidate():
+    """
+    Drop cached alignments. Query: backend (default: all), stale=1 to only drop
+    entries computed with an older version of that backend.
+    """
+    backend = request.args.get('backend')
+    keep_version = backend_version(backend) if backend and request.args.get('stale') == '1' else None
+    removed = alignment_cache.invalidate(backend, keep_version)
+    return jsonify({'removed': removed})
\ No newline at end of file
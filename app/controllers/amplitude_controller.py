@@ -1,8 +1,23 @@
 from flask import Blueprint, request, jsonify
+import soundfile as sf
 from app.services.aplitude_processor import compute_amplitude
+from app.services.amplitude_pyramid import get_amplitude_pyramid, load_cached_pyramid
+from app.utils.decoded_audio import DecodedAudio
+from app.utils.workspace import create_workspace
 
 amplitude_bp = Blueprint('amplitude', __name__)
 
+def _check_decodable(audio):
+    """
+    Raise when the upload cannot be decoded. Formats soundfile reads only need
+    their header checked, they are streamed later; anything else is decoded now
+    and the samples are reused by the amplitude stages.
+    """
+    try:
+        sf.info(audio.path)
+    except RuntimeError:
+        audio.samples
+
 @amplitude_bp.route('/amplitude', methods=['POST'])
 def amplitude():
     if 'file' not in request.files:
@@ -10,5 +25,37 @@ def amplitude():
     file = request.files['file']
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
-    rms_list = compute_amplitude(file)
-    return jsonify({'rms': rms_list})
\ No newline at end of file
+    with create_workspace() as workspace:
+        # On disk, long tracks are read block by block instead of decoded whole
+        audio_path = workspace.file_path(file.filename, default="input")
+        file.save(audio_path)
+        audio = DecodedAudio.from_file(audio_path)
+        try:
+            _check_decodable(audio)
+        except Exception:
+            return jsonify({'error': 'Could not decode file'}), 400
+        rms_list = compute_amplitude(audio)
+        # Precompute every zoom level so GET /amplitude/<audio_hash> never decodes again
+        audio_hash, _ = get_amplitude_pyramid(audio)
+    return jsonify({'rms': rms_list, 'audio_hash': audio_hash})
+
+@amplitude_bp.route('/amplitude/<audio_hash>', methods=['GET'])
+def amplitude_window(audio_hash):
+    """
+    Waveform bars for a previously uploaded track.
+    Query: points (default 100), start / end in seconds (default whole track).
+    """
+    pyramid = load_cached_pyramid(audio_hash)
+    if pyramid is None:
+        return jsonify({'error': 'Unknown audio_hash, upload the track to /amplitude first'}), 404
+    try:
+        points = int(request.args.get('points', 100))
+        start = request.args.get('start', type=float)
+        end = request.args.get('end', type=float)
+    except ValueError:
+        return jsonify({'error': 'Invalid points/start/end'}), 400
+    if points < 1 or points > 10000:
+        return jsonify({'error': 'points must be between 1 and 10000'}), 400
+    envelope = pyramid.envelope(points, start, end)
+    envelope['duration'] = pyramid.duration
+    return jsonify(envelope)
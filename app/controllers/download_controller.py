@@ -0,0 +1,14 @@
+from flask import Blueprint, jsonify, send_file
+from app.services.download_store import resolve
+
+downloads_bp = Blueprint('downloads', __name__)
+
+@downloads_bp.route('/downloads/<token>', methods=['GET'])
+def download(token):
+    """
+    Serve a short-lived stem link created with delivery=urls.
+    """
+    file_path = resolve(token)
+    if file_path is None:
+        return jsonify({'error': 'Download link expired or not found'}), 404
+    return send_file(file_path, as_attachment=True, conditional=True)
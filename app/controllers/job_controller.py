@@ -0,0 +1,14 @@
+from flask import Blueprint, jsonify
+from app.services.job_manager import job_manager
+
+jobs_bp = Blueprint('jobs', __name__)
+
+@jobs_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Report progress of a background job, and its result once it succeeded.
+    """
+    job = job_manager.snapshot(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job), 200
@@ -1,14 +1,41 @@
-import base64
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify, url_for
 import os
 import json
-from app.services.vocal_separater import spleeter_separate, zip_audio_files
-from app.services.aplitude_processor import detect_first_word, compute_amplitude
-from app.services.text_align_forcer import align_timestamps_with_amplitude
-import concurrent.futures
+from app.services.karaoke_pipeline import (
+    run_karaoke_pipeline, KaraokeProcessingError, KARAOKE_STAGES, DELIVERY_MODES
+)
+from app.services.job_manager import job_manager
+from app.services.lyric_timing import coerce_timestamp_lyrics
+from app.services.vocal_separater import stream_zip_files
+from app.utils.workspace import create_workspace
+from app.utils.logger import get_logger
+
+log = get_logger("Karaoke")
 
 karaoke_bp = Blueprint('karaoke', __name__)
 
+def _wants_async():
+    value = request.args.get('async') or request.form.get('async') or ''
+    return value.lower() in {'1', 'true', 'yes'}
+
+def _stream_response(payload, workspace):
+    """
+    Stream result.json followed by the stems as a stored (uncompressed) zip,
+    without ever holding the archive in memory.
+    """
+    stems = payload.pop("stems")
+    entries = [("result.json", current_app.json.dumps(payload).encode("utf-8"))]
+    entries.extend((os.path.basename(path), path) for path in stems.values())
+
+    response = Response(
+        stream_zip_files(entries),
+        mimetype="application/zip",
+        headers={"Content-Disposition": "attachment; filename=karaoke_result.zip"}
+    )
+    # Runs when the server closes the response, also if the client left before the first chunk
+    response.call_on_close(workspace.cleanup)
+    return response
+
 @karaoke_bp.route('/karaoke_process', methods=['POST'])
 def process_karaoke():
     """
@@ -17,120 +44,91 @@ def process_karaoke():
     - Split sounds using Spleeter.
     - Process amplitude using Librosa.
     - Align the first timestamp of lyrics with amplitude.
+
+    With async=true (query or form field) the request returns 202 with a job id
+    right after the upload is saved; poll GET /jobs/<job_id> for progress and result.
+
+    delivery (query or form field) selects how stems are returned:
+    - base64 (default): zip embedded in the JSON body as "zip_file"
+    - urls: JSON with short-lived /downloads/<token> links per stem
+    - stream: zip streamed as the response body, result.json first (not with async)
     """
     try:
-        print("[Step 1] Extracting audio file and timestamp lyrics from request...")
+        log.debug("[Step 1] Extracting audio file and timestamp lyrics from request")
         # Step 1: Extract audio file and timestamp lyrics from request
         audio_file = request.files.get('audioFile')
         timestamp_lyrics_raw = request.form.get('timestampLyrics') 
 
-        print("Type of timestamp_lyrics_raw:", type(timestamp_lyrics_raw))
-        print("Value of timestamp_lyrics_raw:", timestamp_lyrics_raw)
-
         # Check if timestamp_lyrics_raw is None
         if timestamp_lyrics_raw is None:
-            print("[Step 1] Error: Missing timestamp lyrics")
+            log.warning("[Step 1] Missing timestamp lyrics")
             return jsonify({"error": "Missing timestamp lyrics"}), 400
 
-        # Print the uploaded file details
-        if audio_file:
-            print("[Step 1] Uploaded file name:", audio_file.filename)
-        else:
-            print("[Step 1] Error: No audio file uploaded.")
+        if not audio_file:
+            log.warning("[Step 1] No audio file uploaded")
             return jsonify({"error": "Missing audio file"}), 400
 
-        print("[Step 2] Converting timestamp lyrics from JSON string to Python list...")
-        # Convert timestamp_lyrics from JSON string to Python list
+        # Convert timestamp_lyrics from a JSON string to TimestampLyric objects
         try:
-            timestamp_lyrics = json.loads(timestamp_lyrics_raw)
-            print("[Step 2] Converted Timestamp Lyrics:", timestamp_lyrics)
+            timestamp_lyrics = coerce_timestamp_lyrics(json.loads(timestamp_lyrics_raw))
         except json.JSONDecodeError:
-            print("[Step 2] Error: Invalid JSON format for timestamp lyrics")
+            log.warning("[Step 2] Invalid JSON format for timestamp lyrics")
             return jsonify({"error": "Invalid JSON format for timestamp lyrics"}), 400
+        except ValueError as e:
+            log.warning("[Step 2] Invalid timestamp lyrics", error=str(e))
+            return jsonify({"error": str(e)}), 400
+        log.debug("[Step 2] Converted timestamp lyrics", lines=len(timestamp_lyrics))
+
+        delivery = (request.args.get('delivery') or request.form.get('delivery') or 'base64').lower()
+        if delivery not in DELIVERY_MODES:
+            return jsonify({"error": f"Unsupported delivery mode: {delivery}"}), 400
+        if delivery == "stream" and _wants_async():
+            return jsonify({"error": "delivery=stream cannot be combined with async, use urls"}), 400
+
+        # Every request gets its own scratch directory, removed on success or failure
+        workspace = create_workspace()
+        with workspace:
+            temp_audio_path = workspace.file_path(audio_file.filename)
+            audio_file.save(temp_audio_path)
+            log.debug("[Step 3] Audio file saved", path=temp_audio_path)
+            # From here on the pipeline (or the stream) owns the workspace
+            workspace.detach()
+
+        if _wants_async():
+            job = job_manager.submit(
+                run_karaoke_pipeline,
+                workspace,
+                temp_audio_path,
+                timestamp_lyrics,
+                delivery=delivery,
+                total_stages=len(KARAOKE_STAGES),
+                initial_stage=3,
+            )
+            if job is None:
+                workspace.cleanup()
+                return jsonify({"error": "Too many queued karaoke jobs"}), 503
+            log.info("[Step 3] Queued karaoke job", job_id=job.id)
+            return jsonify({
+                "job_id": job.id,
+                "status_url": url_for("jobs.get_job", job_id=job.id)
+            }), 202
+
+        try:
+            payload = run_karaoke_pipeline(workspace, temp_audio_path, timestamp_lyrics, delivery=delivery)
+        except KaraokeProcessingError as e:
+            return jsonify({"error": str(e)}), e.status_code
+
+        if delivery == "stream":
+            try:
+                return _stream_response(payload, workspace)
+            except Exception:
+                workspace.cleanup()
+                raise
 
-        print("[Step 3] Saving audio file temporarily...")
-        # Save audio file temporarily
-        temp_audio_path = f"./temp/{audio_file.filename}"
-        os.makedirs("./temp", exist_ok=True)
-        audio_file.save(temp_audio_path)
-
-        print("[Step 3] Audio file saved at:", temp_audio_path)
-
-        print("[Step 4] Splitting sounds using Spleeter...")
-        # Step 2: Split sounds using Spleeter
-        output_dir = "./temp/spleeter_output"
-        os.makedirs(output_dir, exist_ok=True)
-        
-        result = spleeter_separate(temp_audio_path, "2", output_dir)
-        
-        if not result or "vocals" not in result:
-            print("[Step 4] Error: Failed to process audio")
-            return jsonify({"error": "Failed to process audio"}), 500
-
-        vocals_path = result["vocals"]
-        print("[Step 4] Vocal Path:", vocals_path)
-
-        print("[Step 5] Processing amplitude and detecting first word in parallel...")
-        # Step 3 & 4: Process amplitude and detect first word in parallel
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            future_amplitude = executor.submit(compute_amplitude, temp_audio_path, 100)
-            future_first_word = executor.submit(detect_first_word, vocals_path)
-
-            computed_amplitude = future_amplitude.result()
-            first_word_segment = future_first_word.result()
-
-        # print("[Step 5] Computed Amplitude:", computed_amplitude)
-        # print("[Step 5] First Word Segment:", first_word_segment)
-
-        if not first_word_segment:
-            print("[Step 5] Error: No valid word detected in vocals")
-            return jsonify({"error": "No valid word detected in vocals"}), 400
-
-        print("[Step 6] Aligning the first timestamp of lyrics with amplitude...")
-        # Step 5: Align the first timestamp of lyrics with amplitude
-        adjusted_timestamp = align_timestamps_with_amplitude(
-            first_word_segment=first_word_segment,
-            timestamp_lyrics=timestamp_lyrics,  # Pass the parsed list
-            allow_difference=0.10
-        )
-        # print("[Step 6] Adjusted Timestamp:", adjusted_timestamp)
-
-        print("[Step 7] Zipping the result files...")
-        # Step 6: Zip the result files
-        zip_path = os.path.join(output_dir, "karaoke_result.zip")
-        zip_audio_files(result, zip_path)
-
-        # Ensure zip_path is valid
-        if not os.path.exists(zip_path):
-            print("[Step 7] Error: Failed to create zip file")
-            return jsonify({"error": "Failed to create zip file"}), 500
-
-        with open(zip_path, "rb") as f:
-            zip_base64 = base64.b64encode(f.read()).decode('utf-8')
-
-        print("[Step 8] Cleaning up temporary files...")
-        # Step 7: Clean up temporary files
-        os.remove(temp_audio_path)
-        for root, dirs, files in os.walk(output_dir, topdown=False):
-            for file in files:
-                os.remove(os.path.join(root, file))
-            for dir in dirs:
-                os.rmdir(os.path.join(root, dir))
-        os.rmdir(output_dir)
-
-        print("[Step 9] Returning results...")
-        # Return results
-
-        print("[Debug] Type of computed_amplitude:", type(computed_amplitude))
-
-        return jsonify({
-            "adjusted_timestamp": adjusted_timestamp,
-            "computed_amplitude": computed_amplitude,
-            "zip_file": zip_base64
-        }), 200
+        return jsonify(payload), 200
 
     except Exception as e:
-        print("[Error] Exception occurred:", str(e))
+        log.error("Exception occurred", exc_info=True, error=str(e))
         return jsonify({"error": str(e)}), 500
 
 
@@ -0,0 +1,55 @@
+from flask import Blueprint, Response, request, jsonify
+from app.services.lrc_parser import alignment_to_lrc, parse_lrc, to_lrc
+
+lrc_bp = Blueprint('lrc', __name__)
+
+def _lrc_text():
+    lrc_file = request.files.get('lrc_file')
+    if lrc_file:
+        return lrc_file.read().decode('utf-8-sig', errors='replace')
+    if request.form.get('lrc'):
+        return request.form['lrc']
+    if request.is_json:
+        return (request.get_json(silent=True) or {}).get('lrc', '')
+    return request.get_data(as_text=True)
+
+@lrc_bp.route('/lrc/parse', methods=['POST'])
+def parse():
+    """
+    Parse LRC / enhanced LRC.
+    Expects: lrc_file (file), lrc (form or JSON field) or the raw LRC as the body.
+    Query: apply_offset=0 keeps times as written.
+    Returns: {"metadata", "offset_ms", "lines": [{start, end, text, words}]} in seconds
+    """
+    lrc_text = _lrc_text()
+    if not lrc_text.strip():
+        return jsonify({'error': 'Missing LRC content'}), 400
+    apply_offset = request.args.get('apply_offset', '1') != '0'
+    return jsonify(parse_lrc(lrc_text, apply_offset=apply_offset).to_dict())
+
+@lrc_bp.route('/lrc/export', methods=['POST'])
+def export():
+    """
+    Write LRC from timings.
+    Expects JSON:
+      - alignment: /align result ({"words", "lines"} in ms), or
+      - lines: [{start, text, words: [{start, text}]}] in seconds (e.g. /lrc/parse output)
+      - lyrics: optional, lyrics the alignment was made from (splits word-only results into lines)
+      - metadata: optional, {"ti": ..., "ar": ...}
+      - enhanced: optional, word tags <mm:ss.xx> (default true)
+      - offset_applied: optional, lines already include the metadata offset, as
+        /lrc/parse returns them by default (default true, the offset tag is dropped)
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not (data.get('alignment') or data.get('lines')):
+        return jsonify({'error': 'Missing alignment or lines'}), 400
+    enhanced = bool(data.get('enhanced', True))
+    metadata = data.get('metadata') or {}
+    try:
+        if data.get('alignment'):
+            lrc_text = alignment_to_lrc(data['alignment'], data.get('lyrics'), metadata, enhanced)
+        else:
+            lrc_text = to_lrc(data['lines'], metadata, enhanced, bool(data.get('offset_applied', True)))
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid timings: {e}'}), 400
+    return Response(lrc_text, mimetype='text/plain')
\ No newline at end of file
@@ -1,5 +1,6 @@
 from flask import Blueprint, request, jsonify
-from app.services.song_infor_fetcher import fetch_lyrics_from_genius
+from app.services.song_infor_fetcher import fetch_lyrics_from_genius, reset_title_index, search_titles
+from app.services.lyrics_cache import lyrics_cache
 
 lyrics_bp = Blueprint('lyrics', __name__)
 
@@ -11,4 +12,29 @@ def get_lyrics():
     result, error = fetch_lyrics_from_genius(query)
     if error:
         return jsonify({'error': error}), 404
-    return jsonify(result)
\ No newline at end of file
+    return jsonify(result)
+
+@lyrics_bp.route('/lyrics/search', methods=['GET'])
+def search_lyrics_titles():
+    """
+    Known titles matching a query, best first, from the local index only.
+    Query: query, limit (default 10)
+    """
+    query = request.args.get('query', '')
+    if not query:
+        return jsonify({'error': 'Missing query'}), 400
+    limit = request.args.get('limit', 10, type=int)
+    return jsonify(search_titles(query, limit=max(1, min(limit, 50))))
+
+@lyrics_bp.route('/lyrics/cache', methods=['GET'])
+def lyrics_cache_stats():
+    return jsonify(lyrics_cache.stats())
+
+@lyrics_bp.route('/lyrics/cache', methods=['DELETE'])
+def lyrics_cache_clear():
+    """
+    Drop cached queries and lyrics, and the title index learnt from them.
+    """
+    removed = lyrics_cache.clear()
+    reset_title_index()
+    return jsonify({'removed': removed})
\ No newline at end of file
@@ -18,21 +18,12 @@ import os
 import zipfile
 from werkzeug.utils import secure_filename
 from app.services.vocal_separater import spleeter_separate
-from pydub import AudioSegment
 
 sound_bp = Blueprint("sound", __name__)
 
 ALLOWED_EXTENSIONS = {"mp3", "wav", "flac", "ogg"}
 MAX_FILE_SIZE_MB = 20  # adjust as needed
 
-def convert_wav_to_mp3(wav_path):
-    mp3_path = wav_path.replace(".wav", ".mp3")
-    audio = AudioSegment.from_wav(wav_path)
-    audio.export(mp3_path, format="mp3")
-    return mp3_path
-
-# Example usage after spleeter_separate:
-
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -63,14 +54,8 @@ def separate_sound():
         input_path = os.path.join(tmpdir, filename)
         file.save(input_path)
 
-        # Run spleeter
+        # Run spleeter (stems come back as .mp3, served from the stem cache when possible)
         result = spleeter_separate(input_path, stems=stems, output_dir=tmpdir)
-        
-        if result:
-            for stem, wav_path in result.items():
-                if wav_path:
-                    mp3_path = convert_wav_to_mp3(wav_path)
-                    result[stem] = mp3_path
 
         if not result:
             return jsonify({"success": False, "message": "Separation failed"}), 500
@@ -85,7 +70,7 @@ def separate_sound():
         zip_path = os.path.join(tmpdir, "separated_stems.zip")
         with zipfile.ZipFile(zip_path, "w") as zipf:
             for stem, path in files_to_zip:
-                arcname = f"{stem}.wav"
+                arcname = f"{stem}{os.path.splitext(path)[1]}"
                 zipf.write(path, arcname=arcname)
 
         return send_file(zip_path, as_attachment=True, download_name="separated_stems.zip")
@@ -1,12 +1,23 @@
-from app.controllers.align_controller import align_bp
-from app.controllers.lyrics_controller import lyrics_bp
-from app.controllers.amplitude_controller import amplitude_bp
-from app.controllers.transcription_controller import transcription_bp
-from app.controllers.karaoke_controller import karaoke_bp
+import importlib
 
-def register_routes(app):
-    app.register_blueprint(align_bp)
-    app.register_blueprint(lyrics_bp)
-    app.register_blueprint(amplitude_bp)
-    app.register_blueprint(transcription_bp)
-    app.register_blueprint(karaoke_bp)
\ No newline at end of file
+# Blueprints are imported one by one so the startup report can time each of them
+BLUEPRINTS = [
+    ("app.controllers.align_controller", "align_bp"),
+    ("app.controllers.lyrics_controller", "lyrics_bp"),
+    ("app.controllers.amplitude_controller", "amplitude_bp"),
+    ("app.controllers.transcription_controller", "transcription_bp"),
+    ("app.controllers.karaoke_controller", "karaoke_bp"),
+    ("app.controllers.sound_controller", "sound_bp"),
+    ("app.controllers.job_controller", "jobs_bp"),
+    ("app.controllers.download_controller", "downloads_bp"),
+    ("app.controllers.lrc_controller", "lrc_bp"),
+]
+
+def register_routes(app, report=None):
+    for module_name, blueprint_name in BLUEPRINTS:
+        if report is None:
+            module = importlib.import_module(module_name)
+        else:
+            with report.step(module_name):
+                module = importlib.import_module(module_name)
+        app.register_blueprint(getattr(module, blueprint_name))
\ No newline at end of file
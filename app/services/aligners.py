@@ -0,0 +1,469 @@
+import abc
+import bisect
+import importlib.metadata
+import importlib.util
+import os
+import shutil
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+from textgrid import TextGrid
+from werkzeug.datastructures import FileStorage
+
+from app.services.gentle_client import get_gentle_client
+from app.services.lrc_parser import split_words_by_lyrics
+from app.services.mfa_runtime import mfa_runtime_stats
+from app.services.text_align_forcer import (
+    force_align_lyrics_with_aeneas,
+    force_align_lyrics_with_gentle,
+    force_align_lyrics_with_mfa,
+    force_align_lyrics_with_whisperx,
+    WHISPERX_COMPUTE_TYPE,
+    WHISPERX_MODEL_NAME,
+)
+
+# Backends tried by backend=auto, cheapest first, until one is confident enough.
+# Only backends that align the given lyrics take part (not whisperx, see WhisperXAligner)
+ALIGN_FALLBACK_CHAIN = [
+    name.strip() for name in os.getenv("ALIGN_FALLBACK_CHAIN", "aeneas,gentle,mfa").split(",") if name.strip()
+]
+ALIGN_MIN_CONFIDENCE = float(os.getenv("ALIGN_MIN_CONFIDENCE", "0.6"))
+# Raw confidence range per backend, "name=low:high,...". A raw score at low maps
+# to 0 and at high to 1, so auto mode compares backends on one scale
+ALIGN_CONFIDENCE_RANGES = {
+    name.strip(): tuple(float(bound) for bound in bounds.split(":"))
+    for name, _, bounds in (
+        item.partition("=") for item in os.getenv("ALIGN_CONFIDENCE_RANGES", "").split(",") if "=" in item
+    )
+}
+ALIGN_DEFAULT_BACKEND = os.getenv("ALIGN_DEFAULT_BACKEND", "auto")
+
+MFA_BIN = os.getenv("MFA_BIN", "mfa")
+MFA_ACOUSTIC_MODEL = os.getenv("MFA_ACOUSTIC_MODEL", "")
+MFA_DICTIONARY = os.getenv("MFA_DICTIONARY", "")
+# Marks MFA writes instead of a word it could not place
+MFA_NON_WORDS = {"<unk>", "<eps>", "spn", "sil", "sp"}
+# MFA word durations outside this range (ms) are counted as misaligned
+MFA_MIN_WORD_MS = 30
+MFA_MAX_WORD_MS = 5000
+# Gentle runs remotely, bump this when the Gentle servers are upgraded
+GENTLE_VERSION = os.getenv("GENTLE_VERSION", "1")
+
+# ISO 639-1 codes used by the API -> ISO 639-3 codes expected by aeneas
+AENEAS_LANGUAGES = {"en": "eng", "vi": "vie", "fr": "fra", "de": "deu", "es": "spa", "ja": "jpn", "ko": "kor", "zh": "cmn"}
+
+LATENCY_WINDOW = 200
+
+
+@lru_cache(maxsize=None)
+def _package_version(package):
+    try:
+        return importlib.metadata.version(package)
+    except importlib.metadata.PackageNotFoundError:
+        return "missing"
+
+
+def _file_version(path):
+    try:
+        return f"{os.path.basename(path)}@{int(os.path.getmtime(path))}"
+    except OSError:
+        return "missing"
+
+
+def _ms(seconds):
+    return int(round(float(seconds) * 1000))
+
+
+def parse_textgrid_to_json(textgrid_path):
+    tg = TextGrid()
+    tg.read(textgrid_path)
+    # Giả sử tier đầu tiên là lyrics
+    tier = tg[0]
+    segments = []
+    for interval in tier:
+        if interval.mark.strip():
+            segments.append({
+                "start": int(interval.minTime * 1000),  # convert to ms
+                "end": int(interval.maxTime * 1000),    # convert to ms
+                "text": interval.mark
+            })
+    return segments
+
+
+@dataclass
+class AlignmentResult:
+    """
+    Backend independent alignment. Words and lines are
+    {"start": ms, "end": ms, "text": str, "confidence": float | None}, their
+    confidences are the backend's own. confidence is calibrated across backends,
+    raw_confidence is the backend's score before calibration.
+    """
+    backend: str
+    words: list = field(default_factory=list)
+    lines: list = field(default_factory=list)
+    confidence: float = 0.0
+    seconds: float = 0.0
+    raw: object = None
+    raw_confidence: float = None
+
+    def to_dict(self, include_raw=False):
+        result = {
+            "backend": self.backend,
+            "confidence": round(self.confidence, 3),
+            "raw_confidence": round(self.raw_confidence, 3) if self.raw_confidence is not None else None,
+            "seconds": round(self.seconds, 3),
+            "words": self.words,
+            "lines": self.lines,
+        }
+        if include_raw:
+            result["raw"] = self.raw
+        return result
+
+
+class Aligner(abc.ABC):
+    """
+    One alignment backend. align() gets a fresh FileStorage of the audio, so a
+    fallback chain can hand the same upload to several backends.
+    """
+    name = ""
+    # Relative cost, auto mode tries cheaper backends first
+    cost = 0
+    # Bump when this backend's normalised output changes, it invalidates cached alignments
+    version = "2"
+    # False for backends that ignore the lyrics, they are never picked by auto mode
+    aligns_lyrics = True
+    # Raw confidence mapped to 0 and 1, overridden by ALIGN_CONFIDENCE_RANGES
+    confidence_range = (0.0, 1.0)
+
+    def available(self):
+        return True
+
+    def backend_version(self):
+        return self.version
+
+    def calibrate(self, raw_confidence):
+        """
+        Map this backend's raw confidence onto the shared [0, 1] scale.
+        """
+        low, high = ALIGN_CONFIDENCE_RANGES.get(self.name, self.confidence_range)
+        if high <= low:
+            return 1.0 if raw_confidence >= high else 0.0
+        return min(1.0, max(0.0, (raw_confidence - low) / (high - low)))
+
+    @abc.abstractmethod
+    def align(self, lyrics, audio_file, language, workspace):
+        """
+        Returns:
+            tuple: (AlignmentResult, None) or (None, error message), the result
+                carrying the backend's raw confidence.
+        """
+
+
+class AeneasAligner(Aligner):
+    name = "aeneas"
+    cost = 1
+    # The share of plausible lines is high even for a poor alignment
+    confidence_range = (0.5, 1.0)
+
+    def available(self):
+        return importlib.util.find_spec("aeneas") is not None
+
+    def backend_version(self):
+        return f"{self.version}:aeneas-{_package_version('aeneas')}"
+
+    def align(self, lyrics, audio_file, language, workspace):
+        raw, error = force_align_lyrics_with_aeneas(
+            lyrics, audio_file, language=AENEAS_LANGUAGES.get(language, language), output_format="json"
+        )
+        if error:
+            return None, error
+        lines = []
+        for fragment in raw.get("fragments", []):
+            text = " ".join(fragment.get("lines", [])).strip()
+            if text:
+                lines.append({"start": _ms(fragment["begin"]), "end": _ms(fragment["end"]), "text": text, "confidence": None})
+        # Aeneas has no scores, a collapsed (near zero length) line means it lost track
+        plausible = sum(1 for line in lines if line["end"] - line["start"] >= 200)
+        confidence = plausible / len(lines) if lines else 0.0
+        return AlignmentResult(self.name, lines=lines, confidence=confidence, raw=raw), None
+
+
+class GentleAligner(Aligner):
+    name = "gentle"
+    cost = 2
+    # Share of words Gentle found, sung audio rarely gets all of them
+    confidence_range = (0.3, 0.9)
+
+    def backend_version(self):
+        return f"{self.version}:gentle-{GENTLE_VERSION}"
+
+    def align(self, lyrics, audio_file, language, workspace):
+        raw, error = force_align_lyrics_with_gentle(lyrics, audio_file)
+        if error:
+            return None, error
+        transcript = raw.get("transcript", lyrics)
+        line_starts = [0] + [i + 1 for i, char in enumerate(transcript) if char == "\n"]
+        line_texts = transcript.split("\n")
+
+        words = []
+        by_line = {}
+        gentle_words = raw.get("words", [])
+        for word in gentle_words:
+            if word.get("case") != "success":
+                continue
+            entry = {"start": _ms(word["start"]), "end": _ms(word["end"]), "text": word.get("word", ""), "confidence": 1.0}
+            words.append(entry)
+            line = bisect.bisect_right(line_starts, word.get("startOffset", 0)) - 1
+            by_line.setdefault(line, []).append(entry)
+
+        lines = []
+        for line, entries in sorted(by_line.items()):
+            lines.append({
+                "start": entries[0]["start"],
+                "end": entries[-1]["end"],
+                "text": line_texts[line].strip(),
+                "confidence": len(entries) / max(1, len(line_texts[line].split())),
+            })
+        confidence = len(words) / len(gentle_words) if gentle_words else 0.0
+        return AlignmentResult(self.name, words=words, lines=lines, confidence=confidence, raw=raw), None
+
+
+class WhisperXAligner(Aligner):
+    """
+    Timings of WhisperX's own transcription: the lyrics are not used, so the
+    words and lines may differ from them. Only used when asked for by name.
+    """
+    name = "whisperx"
+    cost = 3
+    aligns_lyrics = False
+    # Mean wav2vec2 word score, rarely above 0.9 even on clean speech
+    confidence_range = (0.2, 0.8)
+
+    def available(self):
+        return importlib.util.find_spec("whisperx") is not None
+
+    def backend_version(self):
+        return (f"{self.version}:whisperx-{_package_version('whisperx')}:"
+                f"{WHISPERX_MODEL_NAME}:{WHISPERX_COMPUTE_TYPE}")
+
+    def align(self, lyrics, audio_file, language, workspace):
+        raw, error = force_align_lyrics_with_whisperx(audio_file, language=language)
+        if error:
+            return None, error
+        words = []
+        lines = []
+        for segment in raw.get("segments", []):
+            segment_words = [
+                {"start": _ms(w["start"]), "end": _ms(w["end"]), "text": w.get("word", ""), "confidence": w.get("score")}
+                for w in segment.get("words", [])
+                if "start" in w and "end" in w
+            ]
+            words.extend(segment_words)
+            scores = [w["confidence"] for w in segment_words if w["confidence"] is not None]
+            lines.append({
+                "start": _ms(segment["start"]),
+                "end": _ms(segment["end"]),
+                "text": segment.get("text", "").strip(),
+                "confidence": sum(scores) / len(scores) if scores else None,
+            })
+        scores = [w["confidence"] for w in words if w["confidence"] is not None]
+        confidence = sum(scores) / len(scores) if scores else 0.0
+        return AlignmentResult(self.name, words=words, lines=lines, confidence=confidence, raw=raw), None
+
+
+class MFAAligner(Aligner):
+    name = "mfa"
+    cost = 4
+    version = "3"
+    # MFA places every word it is given, the share of plausible ones stays high
+    confidence_range = (0.5, 1.0)
+
+    def available(self):
+        return (
+            shutil.which(MFA_BIN) is not None
+            and os.path.exists(MFA_ACOUSTIC_MODEL)
+            and os.path.exists(MFA_DICTIONARY)
+        )
+
+    def backend_version(self):
+        return f"{self.version}:{_file_version(MFA_ACOUSTIC_MODEL)}:{_file_version(MFA_DICTIONARY)}"
+
+    def align(self, lyrics, audio_file, language, workspace):
+        textgrid_path, error = force_align_lyrics_with_mfa(
+            lyrics, audio_file, MFA_ACOUSTIC_MODEL, MFA_DICTIONARY, mfa_bin=MFA_BIN,
+            output_dir=workspace.subdir("mfa")
+        )
+        if error:
+            return None, error
+        words = []
+        for entry in parse_textgrid_to_json(textgrid_path):
+            # Unknown words keep their slot, the lines are split by word count.
+            # Squeezed to a few frames or stretched over a long gap means MFA lost track
+            plausible = (
+                entry["text"].strip().lower() not in MFA_NON_WORDS
+                and MFA_MIN_WORD_MS <= entry["end"] - entry["start"] <= MFA_MAX_WORD_MS
+            )
+            words.append(dict(entry, confidence=1.0 if plausible else 0.0))
+
+        lines = []
+        for text, chunk in split_words_by_lyrics(words, lyrics):
+            lines.append({
+                "start": chunk[0]["start"],
+                "end": chunk[-1]["end"],
+                "text": text,
+                "confidence": sum(w["confidence"] for w in chunk) / len(chunk),
+            })
+        lyric_words = len(lyrics.split())
+        confidence = min(1.0, sum(w["confidence"] for w in words) / lyric_words) if lyric_words else 0.0
+        return AlignmentResult(self.name, words=words, lines=lines, confidence=confidence), None
+
+
+ALIGNERS = {aligner.name: aligner for aligner in (AeneasAligner(), GentleAligner(), WhisperXAligner(), MFAAligner())}
+
+
+class _BackendMetrics:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.accepted = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def to_dict(self):
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 3) if latencies else None
+
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "accepted": self.accepted,
+            "p50_seconds": percentile(0.5),
+            "p95_seconds": percentile(0.95),
+        }
+
+
+_metrics = {name: _BackendMetrics() for name in ALIGNERS}
+_metrics_lock = threading.Lock()
+
+
+def _run(aligner, lyrics, audio_path, language, workspace):
+    started = time.perf_counter()
+    with open(audio_path, "rb") as stream:
+        audio_file = FileStorage(stream=stream, filename=os.path.basename(audio_path))
+        try:
+            result, error = aligner.align(lyrics, audio_file, language, workspace)
+        except Exception as e:
+            result, error = None, f"{aligner.name} align failed: {e}"
+    seconds = time.perf_counter() - started
+    with _metrics_lock:
+        metrics = _metrics[aligner.name]
+        metrics.calls += 1
+        metrics.latencies.append(seconds)
+        if error:
+            metrics.errors += 1
+    if result is not None:
+        result.seconds = seconds
+        result.raw_confidence = result.confidence
+        result.confidence = aligner.calibrate(result.confidence)
+    return result, error
+
+
+def _auto_chain():
+    return sorted(
+        (
+            ALIGNERS[name] for name in ALIGN_FALLBACK_CHAIN
+            if name in ALIGNERS and ALIGNERS[name].aligns_lyrics and ALIGNERS[name].available()
+        ),
+        key=lambda aligner: aligner.cost,
+    )
+
+
+def backend_version(backend=None):
+    """
+    Version string of a backend for cache keys. For "auto" it covers every
+    backend of the chain and the confidence threshold.
+    """
+    backend = backend or ALIGN_DEFAULT_BACKEND
+    if backend == "auto":
+        chain = ",".join(
+            f"{aligner.name}={aligner.backend_version()}~{ALIGN_CONFIDENCE_RANGES.get(aligner.name, aligner.confidence_range)}"
+            for aligner in _auto_chain()
+        )
+        return f"auto:{chain}@{ALIGN_MIN_CONFIDENCE}"
+    aligner = ALIGNERS.get(backend)
+    return aligner.backend_version() if aligner else ""
+
+
+def align_lyrics(lyrics, audio_path, workspace, language="en", backend=None, min_confidence=ALIGN_MIN_CONFIDENCE):
+    """
+    Align lyrics with one backend, or with the cheapest adequate one (backend="auto").
+
+    Args:
+        lyrics (str): Lyrics, one line per line.
+        audio_path (str): Audio file inside the request workspace.
+        workspace (Workspace): Scratch directory of the request.
+        language (str): ISO 639-1 language code.
+        backend (str | None): "auto", or a name in ALIGNERS. Defaults to ALIGN_DEFAULT_BACKEND.
+        min_confidence (float): Auto mode stops at the first result at least this confident.
+
+    Returns:
+        tuple: (AlignmentResult | None, error | None, attempts), attempts being
+            [{"backend", "seconds", "confidence", "raw_confidence", "error"}] in the order tried.
+    """
+    backend = backend or ALIGN_DEFAULT_BACKEND
+    if backend == "auto":
+        chain = _auto_chain()
+    elif backend in ALIGNERS:
+        chain = [ALIGNERS[backend]]
+    else:
+        return None, f"Unknown backend: {backend}", []
+    if not chain:
+        return None, "No alignment backend available", []
+
+    best = None
+    errors = []
+    attempts = []
+    for aligner in chain:
+        result, error = _run(aligner, lyrics, audio_path, language, workspace)
+        attempts.append({
+            "backend": aligner.name,
+            "seconds": round(result.seconds, 3) if result else None,
+            "confidence": round(result.confidence, 3) if result else None,
+            "raw_confidence": round(result.raw_confidence, 3) if result else None,
+            "error": error,
+        })
+        if error:
+            errors.append(error)
+            continue
+        if best is None or result.confidence > best.confidence:
+            best = result
+        if result.confidence >= min_confidence:
+            break
+
+    if best is None:
+        return None, " | ".join(errors), attempts
+    with _metrics_lock:
+        _metrics[best.backend].accepted += 1
+    return best, None, attempts
+
+
+def backend_stats():
+    """
+    Returns:
+        dict: Per backend availability, cost, whether auto mode uses it and latency metrics.
+    """
+    with _metrics_lock:
+        stats = {
+            name: dict(
+                _metrics[name].to_dict(), available=aligner.available(), cost=aligner.cost,
+                auto=aligner.aligns_lyrics and name in ALIGN_FALLBACK_CHAIN,
+            )
+            for name, aligner in ALIGNERS.items()
+        }
+    stats["gentle"]["instances"] = get_gentle_client().stats()
+    stats["mfa"]["runtimes"] = mfa_runtime_stats()
+    return stats
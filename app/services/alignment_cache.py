@@ -0,0 +1,220 @@
+import hashlib
+import json
+import os
+import re
+import secrets
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from app.utils.logger import get_logger
+
+log = get_logger("Cache")
+
+ALIGN_CACHE_DIR = os.getenv("ALIGN_CACHE_DIR", "./cache/alignments")
+ALIGN_CACHE_MAX_BYTES = int(os.getenv("ALIGN_CACHE_MAX_MB", "256")) * 1024 * 1024
+ALIGN_CACHE_MEMORY_ITEMS = int(os.getenv("ALIGN_CACHE_MEMORY_ITEMS", "256"))
+
+# The disk budget is checked every this many stores, not on each one
+EVICT_EVERY = 32
+
+_KEY_RE = re.compile(r"^[0-9a-f]{64}$")
+
+_memory = OrderedDict()
+_lock = threading.Lock()
+_stats = {"hits": 0, "memory_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+_stores_since_evict = 0
+
+
+def normalize_lyrics(lyrics):
+    """
+    Lyrics as the aligners see them: NFC, whitespace collapsed, blank lines dropped.
+    Case and punctuation are kept, they end up in the returned word texts.
+    """
+    lines = (" ".join(line.split()) for line in unicodedata.normalize("NFC", lyrics or "").splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def lyrics_hash(lyrics):
+    return hashlib.sha256(normalize_lyrics(lyrics).encode("utf-8")).hexdigest()
+
+
+def cache_key(audio_hash, lyrics, language, backend, version, options=""):
+    """
+    Args:
+        audio_hash (str): decoded_audio.file_hash() of the upload.
+        lyrics (str): Lyrics as sent by the client.
+        language (str): Language code.
+        backend (str): Requested backend ("auto" or a backend name).
+        version (str): Backend version, entries of an older version never match.
+        options (str): Anything else that changes the result (e.g. vocals_only).
+
+    Returns:
+        str: Hex key of the entry.
+    """
+    parts = [audio_hash, lyrics_hash(lyrics), language or "", backend or "", version or "", options or ""]
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+
+def _entry_path(key):
+    return os.path.join(ALIGN_CACHE_DIR, key[:2], f"{key}.json")
+
+
+def _remember_locked(key, entry):
+    _memory[key] = entry
+    _memory.move_to_end(key)
+    while len(_memory) > ALIGN_CACHE_MEMORY_ITEMS:
+        _memory.popitem(last=False)
+
+
+def lookup(key):
+    """
+    Returns:
+        dict | None: The cached alignment response, or None on a miss.
+    """
+    if not _KEY_RE.match(key or ""):
+        return None
+    with _lock:
+        entry = _memory.get(key)
+        if entry is not None:
+            _memory.move_to_end(key)
+            _stats["hits"] += 1
+            _stats["memory_hits"] += 1
+            return entry["result"]
+
+    path = _entry_path(key)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+        # Bump the access time used for LRU ordering on disk
+        os.utime(path, None)
+    except (OSError, ValueError):
+        with _lock:
+            _stats["misses"] += 1
+        return None
+
+    with _lock:
+        _remember_locked(key, entry)
+        _stats["hits"] += 1
+    return entry["result"]
+
+
+def store(key, result, backend, version):
+    """
+    Save an alignment response in memory and on disk.
+
+    Args:
+        key (str): Result of cache_key().
+        result (dict): JSON-serialisable alignment response.
+        backend (str): Backend the key was built for, used by invalidate().
+        version (str): Backend version the key was built for.
+    """
+    global _stores_since_evict
+    entry = {"backend": backend, "version": version, "created": time.time(), "result": result}
+    with _lock:
+        _remember_locked(key, entry)
+        _stats["stores"] += 1
+
+    path = _entry_path(key)
+    tmp_path = f"{path}.tmp-{secrets.token_hex(4)}"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except (OSError, TypeError, ValueError) as e:
+        log.error("Error storing alignment in cache", error=str(e))
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return
+
+    with _lock:
+        _stores_since_evict += 1
+        if _stores_since_evict >= EVICT_EVERY:
+            _stores_since_evict = 0
+            _evict_locked()
+
+
+def _list_entries():
+    entries = []
+    if not os.path.isdir(ALIGN_CACHE_DIR):
+        return entries
+    for root, _, files in os.walk(ALIGN_CACHE_DIR):
+        for name in files:
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                entries.append((os.path.getmtime(path), os.path.getsize(path), path))
+            except OSError:
+                pass
+    return entries
+
+
+def _evict_locked():
+    entries = _list_entries()
+    total = sum(size for _, size, _ in entries)
+    # Least recently used first
+    for _, size, path in sorted(entries):
+        if total <= ALIGN_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        _memory.pop(os.path.basename(path)[:-len(".json")], None)
+        total -= size
+        _stats["evictions"] += 1
+
+
+def invalidate(backend=None, keep_version=None):
+    """
+    Drop cached alignments of a backend (all backends if None), optionally
+    keeping those computed with keep_version.
+
+    Returns:
+        int: Number of entries removed from disk.
+    """
+    removed = 0
+    with _lock:
+        for key in [k for k, e in _memory.items() if _matches(e, backend, keep_version)]:
+            del _memory[key]
+        for _, _, path in _list_entries():
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                entry = {}
+            if _matches(entry, backend, keep_version):
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+    return removed
+
+
+def _matches(entry, backend, keep_version):
+    if backend is not None and entry.get("backend") != backend:
+        return False
+    return keep_version is None or entry.get("version") != keep_version
+
+
+def cache_stats():
+    """
+    Returns:
+        dict: Hit/miss/store/eviction counters plus current entry count and size.
+    """
+    with _lock:
+        entries = _list_entries()
+        stats = dict(_stats)
+        stats["memory_entries"] = len(_memory)
+    stats["entries"] = len(entries)
+    stats["bytes"] = sum(size for _, size, _ in entries)
+    stats["max_bytes"] = ALIGN_CACHE_MAX_BYTES
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
@@ -0,0 +1,307 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import soundfile as sf
+
+from app.utils.decoded_audio import as_decoded
+from app.utils.logger import get_logger
+
+log = get_logger("Amplitude")
+
+AMPLITUDE_CACHE_DIR = os.getenv("AMPLITUDE_CACHE_DIR", "./cache/amplitude")
+AMPLITUDE_CACHE_MAX_BYTES = int(os.getenv("AMPLITUDE_CACHE_MAX_MB", "512")) * 1024 * 1024
+AMPLITUDE_MEMORY_ITEMS = int(os.getenv("AMPLITUDE_MEMORY_ITEMS", "64"))
+
+# The disk budget is checked every this many stores, not on each one
+EVICT_EVERY = 32
+
+# Samples per bucket at the finest level (~11.6 ms at 44.1 kHz)
+BASE_BLOCK = 512
+# Level-0 buckets read per block when building from a file
+STREAM_BLOCKS = 512
+
+_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+_memory = OrderedDict()
+_lock = threading.Lock()
+_stores_since_evict = 0
+
+
+class AmplitudePyramid:
+    """
+    Min/max/RMS envelope of a track at every power-of-two resolution.
+
+    Level 0 has one bucket per BASE_BLOCK samples, each next level merges pairs
+    of buckets. Values are stored as float16, so a 4 minute song takes ~200 KB
+    for all levels, and any zoom level or time window is answered in
+    O(target_points) without decoding the audio again.
+    """
+
+    def __init__(self, levels, sr, block_size=BASE_BLOCK, duration=None):
+        self.levels = levels  # list of (mins, maxs, rms) float16 arrays
+        self.sr = sr
+        self.block_size = block_size
+        self.duration = duration if duration is not None else len(levels[0][0]) * block_size / sr
+
+    @classmethod
+    def build(cls, audio, block_size=BASE_BLOCK):
+        """
+        Args:
+            audio (str | DecodedAudio): Audio to summarise.
+            block_size (int): Samples per level-0 bucket.
+
+        Returns:
+            AmplitudePyramid
+        """
+        decoded = as_decoded(audio)
+        y = decoded.mono()
+        mins, maxs, mean_sq = _level0(y, block_size)
+        return cls._from_level0(mins, maxs, mean_sq, decoded.sr, block_size, len(y) / decoded.sr)
+
+    @classmethod
+    def build_from_file(cls, path, block_size=BASE_BLOCK):
+        """
+        Same as build() but reads the file block by block, only the level-0
+        buckets are held in memory.
+
+        Raises:
+            RuntimeError: soundfile cannot read the file (e.g. an mp3 with an
+                old libsndfile), build() decodes it instead.
+        """
+        chunks = []
+        n_samples = 0
+        with sf.SoundFile(path) as f:
+            sr = f.samplerate
+            carry = np.zeros(0, dtype=np.float32)
+            while True:
+                block = f.read(block_size * STREAM_BLOCKS, dtype="float32", always_2d=True)
+                if len(block) == 0:
+                    break
+                n_samples += len(block)
+                y = np.concatenate([carry, block.mean(axis=1)])
+                whole = len(y) // block_size * block_size
+                if whole:
+                    chunks.append(_level0(y[:whole], block_size))
+                carry = y[whole:]
+            if len(carry) or not chunks:
+                chunks.append(_level0(carry, block_size))
+        mins, maxs, mean_sq = (np.concatenate(parts) for parts in zip(*chunks))
+        return cls._from_level0(mins, maxs, mean_sq, sr, block_size, n_samples / sr)
+
+    @classmethod
+    def _from_level0(cls, mins, maxs, mean_sq, sr, block_size, duration):
+        levels = []
+        while True:
+            levels.append((
+                mins.astype(np.float16),
+                maxs.astype(np.float16),
+                np.sqrt(mean_sq).astype(np.float16),
+            ))
+            if len(mins) == 1:
+                break
+            if len(mins) % 2:
+                mins = np.append(mins, mins[-1])
+                maxs = np.append(maxs, maxs[-1])
+                mean_sq = np.append(mean_sq, mean_sq[-1])
+            mins = np.minimum(mins[0::2], mins[1::2])
+            maxs = np.maximum(maxs[0::2], maxs[1::2])
+            mean_sq = (mean_sq[0::2] + mean_sq[1::2]) / 2
+
+        return cls(levels, sr, block_size, duration)
+
+    def bucket_seconds(self, level):
+        return self.block_size * (2 ** level) / self.sr
+
+    def envelope(self, target_points=100, start=None, end=None):
+        """
+        Envelope of [start, end] seconds with at most target_points buckets.
+
+        Args:
+            target_points (int): Number of bars wanted.
+            start (float | None): Window start in seconds, defaults to 0.
+            end (float | None): Window end in seconds, defaults to the track end.
+
+        Returns:
+            dict: {"start", "end", "min": [...], "max": [...], "rms": [...]}
+        """
+        target_points = max(1, int(target_points))
+        start = max(0.0, float(start or 0.0))
+        end = self.duration if end is None else min(float(end), self.duration)
+        if end <= start:
+            return {"start": start, "end": start, "min": [], "max": [], "rms": []}
+
+        # Coarsest level that still has at least target_points buckets in the window
+        level = 0
+        while (level + 1 < len(self.levels)
+               and (end - start) / self.bucket_seconds(level + 1) >= target_points):
+            level += 1
+
+        bucket = self.bucket_seconds(level)
+        mins, maxs, rms = self.levels[level]
+        i0 = min(int(start / bucket), len(mins) - 1)
+        i1 = max(i0 + 1, min(int(np.ceil(end / bucket)), len(mins)))
+        n = i1 - i0
+
+        if n <= target_points:
+            out_min, out_max = mins[i0:i1], maxs[i0:i1]
+            out_rms = rms[i0:i1]
+        else:
+            # n < 2 * target_points here, so this touches O(target_points) values
+            edges = np.linspace(0, n, target_points + 1).astype(np.int64)
+            starts = edges[:-1]
+            counts = np.diff(edges)
+            out_min = np.minimum.reduceat(mins[i0:i1], starts)
+            out_max = np.maximum.reduceat(maxs[i0:i1], starts)
+            sq = np.add.reduceat(np.square(rms[i0:i1], dtype=np.float32), starts)
+            out_rms = np.sqrt(sq / counts)
+
+        return {
+            "start": i0 * bucket,
+            "end": min(i1 * bucket, self.duration),
+            "min": np.asarray(out_min, dtype=np.float32).tolist(),
+            "max": np.asarray(out_max, dtype=np.float32).tolist(),
+            "rms": np.asarray(out_rms, dtype=np.float32).tolist(),
+        }
+
+    def save(self, path):
+        offsets = np.cumsum([0] + [len(level[0]) for level in self.levels])
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            mins=np.concatenate([level[0] for level in self.levels]),
+            maxs=np.concatenate([level[1] for level in self.levels]),
+            rms=np.concatenate([level[2] for level in self.levels]),
+            offsets=offsets,
+            meta=np.array([self.sr, self.block_size, self.duration], dtype=np.float64),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            offsets = data["offsets"]
+            mins, maxs, rms = data["mins"], data["maxs"], data["rms"]
+            sr, block_size, duration = data["meta"]
+        levels = [
+            (mins[a:b], maxs[a:b], rms[a:b]) for a, b in zip(offsets[:-1], offsets[1:])
+        ]
+        return cls(levels, int(sr), int(block_size), float(duration))
+
+
+def _level0(y, block_size):
+    """
+    (mins, maxs, mean squares) of each block_size samples of y.
+    """
+    n_blocks = max(1, -(-len(y) // block_size))
+    # Pad the last partial block with its final sample, this keeps min/max exact
+    padded = np.pad(y, (0, n_blocks * block_size - len(y)), mode="edge") if len(y) else np.zeros(block_size)
+    blocks = padded.reshape(n_blocks, block_size)
+    return blocks.min(axis=1), blocks.max(axis=1), np.mean(np.square(blocks, dtype=np.float64), axis=1)
+
+
+def _cache_path(audio_hash):
+    return os.path.join(AMPLITUDE_CACHE_DIR, f"{audio_hash}.npz")
+
+
+def _remember(audio_hash, pyramid):
+    with _lock:
+        _memory[audio_hash] = pyramid
+        _memory.move_to_end(audio_hash)
+        while len(_memory) > AMPLITUDE_MEMORY_ITEMS:
+            _memory.popitem(last=False)
+
+
+def load_cached_pyramid(audio_hash):
+    """
+    Returns:
+        AmplitudePyramid | None: Pyramid from memory or disk, None if never built.
+    """
+    if not _HASH_RE.match(audio_hash or ""):
+        return None
+    with _lock:
+        pyramid = _memory.get(audio_hash)
+        if pyramid is not None:
+            _memory.move_to_end(audio_hash)
+            return pyramid
+    path = _cache_path(audio_hash)
+    try:
+        pyramid = AmplitudePyramid.load(path)
+    except (OSError, ValueError, KeyError):
+        return None
+    try:
+        # mtime is the last use, eviction drops the oldest first
+        os.utime(path, None)
+    except OSError:
+        pass
+    _remember(audio_hash, pyramid)
+    return pyramid
+
+
+def _evict_locked():
+    """
+    Remove the least recently used pyramids until the disk cache fits
+    AMPLITUDE_CACHE_MAX_BYTES.
+    """
+    entries = []
+    try:
+        names = os.listdir(AMPLITUDE_CACHE_DIR)
+    except OSError:
+        return
+    for name in names:
+        if not name.endswith(".npz") or ".tmp" in name:
+            continue
+        path = os.path.join(AMPLITUDE_CACHE_DIR, name)
+        try:
+            entries.append((os.path.getmtime(path), os.path.getsize(path), path))
+        except OSError:
+            pass
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= AMPLITUDE_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        _memory.pop(os.path.basename(path)[:-len(".npz")], None)
+        total -= size
+
+
+def get_amplitude_pyramid(audio):
+    """
+    Pyramid for a track, built and stored on first request.
+
+    Args:
+        audio (str | DecodedAudio): Track. It is keyed on a hash of the file and,
+            unless already decoded, read block by block on a cache miss.
+
+    Returns:
+        tuple: (audio_hash, AmplitudePyramid)
+    """
+    global _stores_since_evict
+    decoded = as_decoded(audio)
+    audio_hash = decoded.source_hash()
+    pyramid = load_cached_pyramid(audio_hash)
+    if pyramid is None:
+        if not decoded.is_decoded and isinstance(decoded.path, str):
+            try:
+                pyramid = AmplitudePyramid.build_from_file(decoded.path)
+            except RuntimeError as e:
+                log.warning("Streaming pyramid failed, decoding whole file", path=decoded.path, error=str(e))
+        if pyramid is None:
+            pyramid = AmplitudePyramid.build(decoded)
+        try:
+            os.makedirs(AMPLITUDE_CACHE_DIR, exist_ok=True)
+            pyramid.save(_cache_path(audio_hash))
+        except OSError as e:
+            log.error("Error saving amplitude pyramid", error=str(e))
+        _remember(audio_hash, pyramid)
+        with _lock:
+            _stores_since_evict += 1
+            if _stores_since_evict >= EVICT_EVERY:
+                _stores_since_evict = 0
+                _evict_locked()
+    return audio_hash, pyramid
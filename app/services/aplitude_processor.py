@@ -1,123 +1,284 @@
 import os
 import tempfile
+from dataclasses import dataclass
 import librosa
 import numpy as np
+import soundfile as sf
+from numpy.lib.stride_tricks import sliding_window_view
+from app.utils.decoded_audio import DecodedAudio, as_decoded
+from app.utils.logger import get_logger
 
-def compute_amplitude(file_path, target_points=100):
+log = get_logger("Amplitude")
+
+# Sample rate used for word detection (librosa.load default)
+ANALYSIS_SR = 22050
+
+# librosa.feature.rms framing
+FRAME_LENGTH = 2048
+HOP_LENGTH = 512
+
+# Files at least this long are analysed block by block instead of being decoded whole
+STREAMING_MIN_SECONDS = float(os.getenv("AMPLITUDE_STREAMING_MIN_SECONDS", "1200"))
+STREAM_BLOCK_SAMPLES = 1 << 18  # ~6 s at 44.1 kHz
+
+@dataclass
+class RmsEnvelope:
     """
-    Nhận file_storage (từ Flask request.files['file']) và trả về list RMS đã downsample.
+    RMS envelope of a signal plus what is needed to map frames back to seconds.
     """
-    # Save the uploaded file to a temporary location
+    values: np.ndarray
+    sr: int
+    samples_per_frame: float
 
-    try:
-        y, sr = librosa.load(file_path, sr=None)
-        rms = librosa.feature.rms(y=y)[0]
-        # Downsample RMS to target_points for wave bar
-        if len(rms) > target_points:
-            rms_downsampled = np.interp(
-                np.linspace(0, len(rms) - 1, target_points),
-                np.arange(len(rms)),
-                rms
-            )
+    def times(self):
+        return np.arange(len(self.values)) * self.samples_per_frame / self.sr
+
+def compute_rms_envelope(audio, sr=ANALYSIS_SR):
+    """
+    Tính RMS envelope một lần để dùng lại cho compute_amplitude / detect_words.
+
+    Args:
+        audio (str | DecodedAudio): Đường dẫn đến tệp âm thanh hoặc âm thanh đã giải mã.
+        sr (int | None): Tần số lấy mẫu để phân tích, None giữ tần số gốc.
+
+    Returns:
+        RmsEnvelope: Giá trị RMS theo frame.
+    """
+    decoded = as_decoded(audio)
+    y = decoded.mono(sr)
+    rms = librosa.feature.rms(y=y)[0]
+    return RmsEnvelope(values=rms, sr=sr or decoded.sr, samples_per_frame=len(y) / len(rms))
+
+def _stream_rms_frames(path, frame_length=FRAME_LENGTH, hop_length=HOP_LENGTH, block_samples=STREAM_BLOCK_SAMPLES):
+    """
+    Decode a file block by block and yield its RMS frames in chunks.
+
+    Framing matches librosa.feature.rms(center=True): frame i is centred on
+    sample i * hop_length with frame_length // 2 zeros padded at both ends.
+    Only one block plus one frame of samples is held in memory at a time.
+    """
+    half = frame_length // 2
+    with sf.SoundFile(path) as f:
+        buf = np.zeros(half, dtype=np.float32)
+        while True:
+            block = f.read(block_samples, dtype="float32", always_2d=True)
+            eof = len(block) == 0
+            tail = np.zeros(half, dtype=np.float32) if eof else block.mean(axis=1)
+            buf = np.concatenate([buf, tail])
+
+            if len(buf) >= frame_length:
+                available = (len(buf) - frame_length) // hop_length + 1
+                frames = sliding_window_view(buf, frame_length)[::hop_length][:available]
+                yield np.sqrt(np.mean(np.square(frames), axis=1))
+                buf = buf[available * hop_length:]
+
+            if eof:
+                break
+
+
+class _StreamingDownsampler:
+    """
+    np.interp(np.linspace(0, n - 1, target), np.arange(n), rms) evaluated chunk
+    by chunk, so the full RMS array never has to exist.
+    """
+
+    def __init__(self, n_frames, target_points):
+        self.positions = np.linspace(0, n_frames - 1, target_points)
+        self.out = np.zeros(target_points)
+        self.done = 0
+        self.offset = 0
+        self.prev = None
+
+    def feed(self, chunk):
+        if len(chunk) == 0:
+            return
+        if self.prev is None:
+            values, base = chunk, self.offset
         else:
-            rms_downsampled = rms
-        rms_list = rms_downsampled.tolist()
-        
-    finally:
-        pass
+            # The previous chunk's last frame is the left neighbour of this chunk
+            values, base = np.concatenate([[self.prev], chunk]), self.offset - 1
+        last_index = self.offset + len(chunk) - 1
+        end = np.searchsorted(self.positions, last_index, side="right")
+        if end > self.done:
+            self.out[self.done:end] = np.interp(
+                self.positions[self.done:end] - base, np.arange(len(values)), values
+            )
+            self.done = end
+        self.prev = chunk[-1]
+        self.offset += len(chunk)
 
-    return rms_list
+    def finish(self):
+        # The header frame count can be slightly off for compressed formats
+        if self.done < len(self.out) and self.prev is not None:
+            self.out[self.done:] = self.prev
+        return self.out
 
 
-def detect_words(audio_path, threshold=0.02, min_duration=0.2):
+def _streaming_path(audio, streaming):
     """
-    Phát hiện các đoạn âm thanh (có thể là từ) dựa trên biên độ.
+    File path to analyse in streaming mode, or None to decode the whole file.
+    streaming=None streams files longer than STREAMING_MIN_SECONDS.
+    """
+    if streaming is False:
+        return None
+    if isinstance(audio, DecodedAudio):
+        # Already decoded samples are cheaper to reuse than to stream again
+        path = None if audio.is_decoded else audio.path
+    else:
+        path = audio
+    if not isinstance(path, str):
+        return None
+    if streaming:
+        return path
+    try:
+        return path if sf.info(path).duration >= STREAMING_MIN_SECONDS else None
+    except RuntimeError:
+        return None
+
+
+def compute_rms_envelope_streaming(path, sr=ANALYSIS_SR):
+    """
+    compute_rms_envelope() without decoding the whole file: samples are read
+    block by block and only the RMS values (one float per hop) are kept.
 
     Args:
-        audio_path (str): Đường dẫn đến tệp âm thanh.
+        path (str): Đường dẫn đến tệp âm thanh (định dạng soundfile đọc được).
+        sr (int | None): Tần số phân tích; frame/hop được co giãn theo tần số gốc
+            thay vì resample, None giữ tần số gốc.
+
+    Returns:
+        RmsEnvelope: Giá trị RMS theo frame.
+    """
+    native_sr = sf.info(path).samplerate
+    scale = native_sr / sr if sr else 1.0
+    hop_length = max(1, int(round(HOP_LENGTH * scale)))
+    frame_length = max(hop_length, int(round(FRAME_LENGTH * scale)))
+    chunks = list(_stream_rms_frames(path, frame_length, hop_length))
+    values = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.float32)
+    return RmsEnvelope(values=values, sr=native_sr, samples_per_frame=hop_length)
+
+
+def _compute_amplitude_streaming(path, target_points):
+    info = sf.info(path)
+    n_frames = 1 + info.frames // HOP_LENGTH
+    if n_frames <= target_points:
+        return np.concatenate(list(_stream_rms_frames(path))).tolist()
+
+    downsampler = _StreamingDownsampler(n_frames, target_points)
+    for chunk in _stream_rms_frames(path):
+        downsampler.feed(chunk)
+    return downsampler.finish().tolist()
+
+
+def compute_amplitude(audio, target_points=100, envelope=None, streaming=None):
+    """
+    Nhận file_storage (từ Flask request.files['file']), đường dẫn hoặc DecodedAudio
+    và trả về list RMS đã downsample.
+    Có thể truyền envelope (RmsEnvelope) đã tính sẵn để không phải tính lại.
+    streaming=True (hoặc None với file dài) đọc file theo từng block, bộ nhớ
+    không phụ thuộc độ dài bài hát.
+    """
+    if envelope is None:
+        path = _streaming_path(audio, streaming)
+        if path is not None:
+            try:
+                return _compute_amplitude_streaming(path, target_points)
+            except RuntimeError as e:
+                log.warning("Streaming RMS failed, decoding whole file", path=path, error=str(e))
+        envelope = compute_rms_envelope(audio, sr=None)
+    rms = envelope.values
+
+    # Downsample RMS to target_points for wave bar
+    if len(rms) > target_points:
+        rms_downsampled = np.interp(
+            np.linspace(0, len(rms) - 1, target_points),
+            np.arange(len(rms)),
+            rms
+        )
+    else:
+        rms_downsampled = rms
+
+    return rms_downsampled.tolist()
+
+
+def detect_segments(envelope, threshold=0.02, min_duration=0.2):
+    """
+    Tìm tất cả các đoạn có RMS > threshold trong một lượt, không dùng vòng lặp Python.
+
+    Args:
+        envelope (RmsEnvelope): RMS envelope của âm thanh.
         threshold (float): Ngưỡng biên độ để phát hiện âm thanh.
         min_duration (float): Thời gian tối thiểu (giây) để một đoạn được coi là hợp lệ.
 
     Returns:
-        list: Danh sách các đoạn âm thanh (start, end) tính bằng giây.
+        np.ndarray: Mảng (n, 2) các đoạn (start, end) tính bằng giây.
     """
-    # Load audio file
-    y, sr = librosa.load(audio_path)
+    rms = envelope.values
+    if len(rms) == 0:
+        return np.empty((0, 2))
 
-    # Calculate RMS (Root Mean Square) for amplitude
-    rms = librosa.feature.rms(y=y)[0]
+    times = envelope.times()
 
-    # Convert RMS frames to time
-    frame_length = len(y) / len(rms)  # Number of samples per RMS frame
-    times = np.arange(len(rms)) * frame_length / sr
-
-    # Detect segments where RMS > threshold
-    segments = []
-    start = None
-    for i, value in enumerate(rms):
-        if value > threshold:
-            if start is None:
-                start = times[i]  # Start of a segment
-        else:
-            if start is not None:
-                end = times[i]  # End of a segment
-                # Only keep segments longer than min_duration
-                if end - start >= min_duration:
-                    segments.append((start, end))
-                start = None
+    # +1 where a voiced run starts, -1 on the first frame after it ends
+    active = (rms > threshold).astype(np.int8)
+    edges = np.diff(active, prepend=0, append=0)
+    start_idx = np.flatnonzero(edges == 1)
+    end_idx = np.flatnonzero(edges == -1)
 
-    # Handle case where audio ends with a segment
-    if start is not None:
-        end = times[-1]
-        if end - start >= min_duration:
-            segments.append((start, end))
+    starts = times[start_idx]
+    # A run that lasts until the end of the audio ends on the last frame
+    ends = times[np.minimum(end_idx, len(rms) - 1)]
 
-    return segments
+    keep = ends - starts >= min_duration
+    return np.column_stack((starts[keep], ends[keep]))
 
 
-def detect_first_word(audio_path, threshold=0.02, min_duration=0.2):
+def detect_words(audio, threshold=0.02, min_duration=0.2, envelope=None, streaming=None):
     """
-    Phát hiện từ đầu tiên dựa trên biên độ của âm thanh.
+    Phát hiện các đoạn âm thanh (có thể là từ) dựa trên biên độ.
 
     Args:
-        audio_path (str): Đường dẫn đến tệp âm thanh.
+        audio (str | DecodedAudio): Đường dẫn đến tệp âm thanh hoặc âm thanh đã giải mã.
         threshold (float): Ngưỡng biên độ để phát hiện âm thanh.
         min_duration (float): Thời gian tối thiểu (giây) để một đoạn được coi là hợp lệ.
+        envelope (RmsEnvelope | None): RMS envelope đã tính sẵn (bỏ qua audio nếu có).
+        streaming (bool | None): Đọc file theo từng block (None: tự động với file dài).
 
     Returns:
-        tuple: Thời gian bắt đầu và kết thúc của từ đầu tiên (start, end) tính bằng giây.
+        list: Danh sách các đoạn âm thanh (start, end) tính bằng giây.
     """
-    # Load audio file
-    y, sr = librosa.load(audio_path)
+    if envelope is None:
+        path = _streaming_path(audio, streaming)
+        if path is not None:
+            try:
+                envelope = compute_rms_envelope_streaming(path)
+            except RuntimeError as e:
+                log.warning("Streaming RMS failed, decoding whole file", path=path, error=str(e))
+    if envelope is None:
+        envelope = compute_rms_envelope(audio)
 
-    # Calculate RMS (Root Mean Square) for amplitude
-    rms = librosa.feature.rms(y=y)[0]
+    segments = detect_segments(envelope, threshold, min_duration)
+    return [tuple(segment) for segment in segments.tolist()]
 
-    # Convert RMS frames to time
-    frame_length = len(y) / len(rms)  # Number of samples per RMS frame
-    times = np.arange(len(rms)) * frame_length / sr
 
-    # Detect the first segment where RMS > threshold
-    start = None
-    for i, value in enumerate(rms):
-        if value > threshold:
-            if start is None:
-                start = times[i]  # Start of the first segment
-        else:
-            if start is not None:
-                end = times[i]  # End of the first segment
-                # Only keep the first segment longer than min_duration
-                if end - start >= min_duration:
-                    return (start, end)
-                start = None
-
-    # Handle case where audio ends with a segment
-    if start is not None:
-        end = times[-1]
-        if end - start >= min_duration:
-            return (start, end)
-
-    return None  # 
+def detect_first_word(audio, threshold=0.02, min_duration=0.2, envelope=None, streaming=None):
+    """
+    Phát hiện từ đầu tiên dựa trên biên độ của âm thanh.
+
+    Args:
+        audio (str | DecodedAudio): Đường dẫn đến tệp âm thanh hoặc âm thanh đã giải mã.
+        threshold (float): Ngưỡng biên độ để phát hiện âm thanh.
+        min_duration (float): Thời gian tối thiểu (giây) để một đoạn được coi là hợp lệ.
+        envelope (RmsEnvelope | None): RMS envelope đã tính sẵn (bỏ qua audio nếu có).
+        streaming (bool | None): Đọc file theo từng block (None: tự động với file dài).
+
+    Returns:
+        tuple: Thời gian bắt đầu và kết thúc của từ đầu tiên (start, end) tính bằng giây.
+    """
+    segments = detect_words(audio, threshold, min_duration, envelope=envelope, streaming=streaming)
+    if segments:
+        return segments[0]
+    return None
 
 # Example usage
 audio_file = "/home/cao-le/Music/vocals.wav"
@@ -0,0 +1,62 @@
+import os
+import secrets
+import shutil
+import time
+
+DOWNLOAD_DIR = os.path.abspath(os.getenv("DOWNLOAD_DIR", "./temp/downloads"))
+DOWNLOAD_TTL_SECONDS = int(os.getenv("DOWNLOAD_TTL_SECONDS", "600"))
+DOWNLOAD_URL_PREFIX = os.getenv("DOWNLOAD_URL_PREFIX", "/downloads")
+
+
+def publish(file_path, download_name=None):
+    """
+    Move a file into the download area behind an unguessable token.
+    State lives on disk only, so any app process can serve the link.
+
+    Args:
+        file_path (str): File to publish, it is moved (not copied).
+        download_name (str | None): File name presented to the client.
+
+    Returns:
+        str: Download URL path, e.g. /downloads/<token>.
+    """
+    purge_expired()
+    token = secrets.token_urlsafe(16)
+    token_dir = os.path.join(DOWNLOAD_DIR, token)
+    os.makedirs(token_dir, exist_ok=True)
+    shutil.move(file_path, os.path.join(token_dir, download_name or os.path.basename(file_path)))
+    return f"{DOWNLOAD_URL_PREFIX}/{token}"
+
+
+def resolve(token):
+    """
+    Returns:
+        str | None: Path of the published file, None if unknown or expired.
+    """
+    if not token or os.sep in token or token.startswith("."):
+        return None
+    token_dir = os.path.join(DOWNLOAD_DIR, token)
+    try:
+        if time.time() - os.path.getmtime(token_dir) > DOWNLOAD_TTL_SECONDS:
+            shutil.rmtree(token_dir, ignore_errors=True)
+            return None
+        names = os.listdir(token_dir)
+    except OSError:
+        return None
+    return os.path.join(token_dir, names[0]) if names else None
+
+
+def purge_expired():
+    """
+    Remove published files older than DOWNLOAD_TTL_SECONDS.
+    """
+    if not os.path.isdir(DOWNLOAD_DIR):
+        return
+    cutoff = time.time() - DOWNLOAD_TTL_SECONDS
+    for name in os.listdir(DOWNLOAD_DIR):
+        token_dir = os.path.join(DOWNLOAD_DIR, name)
+        try:
+            if os.path.getmtime(token_dir) < cutoff:
+                shutil.rmtree(token_dir, ignore_errors=True)
+        except OSError:
+            pass
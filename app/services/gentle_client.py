@@ -0,0 +1,164 @@
+import atexit
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Comma separated list of Gentle instances, requests go to the least busy one
+GENTLE_URLS = [
+    url.strip()
+    for url in os.getenv("GENTLE_URLS", "http://localhost:8765/transcriptions").split(",")
+    if url.strip()
+]
+GENTLE_CONNECT_TIMEOUT = float(os.getenv("GENTLE_CONNECT_TIMEOUT", "5"))
+GENTLE_READ_TIMEOUT = float(os.getenv("GENTLE_READ_TIMEOUT", "300"))
+GENTLE_RETRIES = int(os.getenv("GENTLE_RETRIES", "2"))
+# Keep-alive connections per instance, also the size of the async executor
+GENTLE_POOL_SIZE = int(os.getenv("GENTLE_POOL_SIZE", "8"))
+# An instance that refused a connection is skipped for this long
+GENTLE_COOLDOWN_SECONDS = float(os.getenv("GENTLE_COOLDOWN_SECONDS", "10"))
+
+# Errors worth retrying on another instance. Only failures before Gentle took the
+# upload are retried: a read timeout means it is still aligning, resubmitting
+# would queue the same work again and multiply the wait
+_RETRY_STATUS = {502, 503, 504}
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class GentleClient:
+    """
+    Keep-alive client for one or more Gentle servers.
+
+    Audio and transcript are uploaded from memory. Each call goes to the
+    instance with the fewest requests in flight (round robin between equals),
+    and connection errors or 502/503/504 are retried on the next instance.
+    A read timeout is not retried.
+    """
+
+    def __init__(self, urls=None, pool_size=GENTLE_POOL_SIZE, retries=GENTLE_RETRIES,
+                 timeout=(GENTLE_CONNECT_TIMEOUT, GENTLE_READ_TIMEOUT)):
+        self.urls = list(urls or GENTLE_URLS)
+        if not self.urls:
+            raise ValueError("GentleClient needs at least one URL")
+        self.retries = retries
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.urls), pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._in_flight = {url: 0 for url in self.urls}
+        self._down_until = {url: 0.0 for url in self.urls}
+        self._round_robin = itertools.count()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=pool_size * len(self.urls), thread_name_prefix="gentle")
+
+    def _acquire(self, exclude):
+        with self._lock:
+            now = time.time()
+            candidates = [url for url in self.urls if url not in exclude and self._down_until[url] <= now]
+            if not candidates:
+                # Everything is cooling down or already tried, take any untried one
+                candidates = [url for url in self.urls if url not in exclude] or self.urls
+            start = next(self._round_robin)
+            ordered = candidates[start % len(candidates):] + candidates[:start % len(candidates)]
+            url = min(ordered, key=lambda u: self._in_flight[u])
+            self._in_flight[url] += 1
+            return url
+
+    def _release(self, url, failed=False):
+        with self._lock:
+            self._in_flight[url] -= 1
+            if failed:
+                self._down_until[url] = time.time() + GENTLE_COOLDOWN_SECONDS
+
+    def align(self, audio, transcript, filename="audio.wav", mimetype="audio/wav"):
+        """
+        Args:
+            audio (bytes): Encoded audio (wav, mp3, ... anything Gentle's ffmpeg reads).
+            transcript (str): Lyrics to align.
+            filename (str): Upload file name, its extension tells Gentle the format.
+            mimetype (str): Upload content type.
+
+        Returns:
+            tuple: (alignment JSON dict, None) or (None, error message)
+        """
+        files = {
+            "audio": (filename, audio, mimetype),
+            "transcript": ("transcript.txt", transcript.encode("utf-8"), "text/plain"),
+        }
+        tried = []
+        error = None
+        for _ in range(self.retries + 1):
+            url = self._acquire(tried)
+            tried.append(url)
+            response = None
+            failed = False
+            try:
+                response = self.session.post(url, files=files, params={"async": "false"}, timeout=self.timeout)
+                if response.status_code in _RETRY_STATUS:
+                    failed = True
+                    error = f"Gentle server {url} returned {response.status_code}"
+                    continue
+                response.raise_for_status()
+                return response.json(), None
+            except requests.ReadTimeout as e:
+                return None, f"Gentle server {url} timed out: {e}"
+            except requests.ConnectionError as e:
+                # Includes ConnectTimeout
+                failed = True
+                error = f"Gentle server {url} unreachable: {e}"
+            except Exception as e:
+                # In response text để debug nếu lỗi JSON
+                err_text = response.text[:200] if response is not None else ""
+                return None, f"Gentle server align failed: {e} | Response: {err_text}"
+            finally:
+                self._release(url, failed)
+        return None, f"Gentle server align failed: {error}"
+
+    def submit(self, audio, transcript, filename="audio.wav", mimetype="audio/wav"):
+        """
+        Non-blocking align().
+
+        Returns:
+            concurrent.futures.Future: Resolves to align()'s (result, error) tuple.
+        """
+        return self._executor.submit(self.align, audio, transcript, filename, mimetype)
+
+    def stats(self):
+        with self._lock:
+            now = time.time()
+            return [
+                {"url": url, "in_flight": self._in_flight[url], "down": self._down_until[url] > now}
+                for url in self.urls
+            ]
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+
+def get_gentle_client(urls=None):
+    """
+    Shared client for a set of Gentle URLs (GENTLE_URLS by default).
+    """
+    key = tuple(urls or GENTLE_URLS)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = GentleClient(list(key))
+            _clients[key] = client
+        return client
+
+
+@atexit.register
+def _close_clients():
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from app.utils.logger import get_logger
+
+log = get_logger("Jobs")
+
+KARAOKE_JOB_WORKERS = int(os.getenv("KARAOKE_JOB_WORKERS", "2"))
+KARAOKE_JOB_QUEUE = int(os.getenv("KARAOKE_JOB_QUEUE", "32"))
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "3600"))
+
+
+class Job:
+    """
+    State of one background job. Mutated only by the JobManager under its lock.
+    """
+
+    def __init__(self, job_id, total_stages):
+        self.id = job_id
+        self.status = "queued"
+        self.stage = 0
+        self.stage_name = None
+        self.total_stages = total_stages
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.result = None
+        self.error = None
+        self.status_code = None
+
+    def to_dict(self):
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "stage_name": self.stage_name,
+            "total_stages": self.total_stages,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+        if self.status == "succeeded":
+            data["result"] = self.result
+        if self.status == "failed":
+            data["error"] = self.error
+            data["status_code"] = self.status_code
+        return data
+
+
+class JobManager:
+    """
+    Runs jobs on a bounded thread pool and keeps their progress in memory.
+    Finished jobs are dropped JOB_TTL_SECONDS after they complete.
+    """
+
+    def __init__(self, max_workers=KARAOKE_JOB_WORKERS, max_pending=KARAOKE_JOB_QUEUE, ttl=JOB_TTL_SECONDS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._max_pending = max_pending
+        self._ttl = ttl
+        self._jobs = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, total_stages=0, initial_stage=0, **kwargs):
+        """
+        Queue fn(*args, progress=callback, **kwargs) in the background.
+
+        Args:
+            fn (callable): Job body, must accept a progress(step, stage_name) keyword.
+            total_stages (int): Number of stages reported for the job.
+            initial_stage (int): Stages already completed before submission.
+
+        Returns:
+            Job | None: The queued job, or None if the queue is full.
+        """
+        with self._lock:
+            self._purge_locked()
+            if self._pending >= self._max_pending:
+                return None
+            job = Job(uuid.uuid4().hex, total_stages)
+            job.stage = initial_stage
+            self._jobs[job.id] = job
+            self._pending += 1
+
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        def progress(step, stage_name):
+            with self._lock:
+                job.stage = step
+                job.stage_name = stage_name
+                job.updated_at = time.time()
+
+        with self._lock:
+            job.status = "running"
+            job.updated_at = time.time()
+
+        try:
+            result = fn(*args, progress=progress, **kwargs)
+            with self._lock:
+                job.result = result
+                job.status = "succeeded"
+        except Exception as e:
+            log.error("Job failed", job_id=job.id, error=str(e))
+            with self._lock:
+                job.error = str(e)
+                job.status_code = getattr(e, "status_code", 500)
+                job.status = "failed"
+        finally:
+            with self._lock:
+                job.updated_at = time.time()
+                self._pending -= 1
+
+    def snapshot(self, job_id):
+        """
+        Returns:
+            dict | None: Serializable job state, None if unknown or expired.
+        """
+        with self._lock:
+            self._purge_locked()
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job else None
+
+    def _purge_locked(self):
+        cutoff = time.time() - self._ttl
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.status in ("succeeded", "failed") and job.updated_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+job_manager = JobManager()
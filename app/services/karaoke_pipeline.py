@@ -0,0 +1,194 @@
+import base64
+import os
+import concurrent.futures
+from app.services.vocal_separater import spleeter_separate_decoded, zip_audio_files
+from app.services.download_store import publish, DOWNLOAD_TTL_SECONDS
+from app.services.aplitude_processor import detect_words, compute_amplitude
+from app.services.amplitude_pyramid import get_amplitude_pyramid
+from app.services.text_align_forcer import align_timestamps_with_amplitude
+from app.utils.decoded_audio import DecodedAudio
+from app.utils.logger import get_logger
+
+log = get_logger("Karaoke")
+
+# Stage names reported to clients, numbered like the [Step N] log lines
+KARAOKE_STAGES = [
+    "Extracting audio file and timestamp lyrics",
+    "Converting timestamp lyrics",
+    "Saving audio file",
+    "Splitting sounds using Spleeter",
+    "Processing amplitude and detecting first word",
+    "Aligning timestamps with amplitude",
+    "Packaging the result files",
+    "Cleaning up temporary files",
+    "Returning results",
+]
+
+# How stems are handed back to the client
+DELIVERY_MODES = {"base64", "stream", "urls"}
+
+# align_timestamps_with_amplitude mode, "global" corrects drift over the whole track
+KARAOKE_ALIGN_MODE = os.getenv("KARAOKE_ALIGN_MODE", "global")
+
+
+class KaraokeProcessingError(Exception):
+    """
+    A pipeline step failed; status_code is the HTTP status to report.
+    """
+
+    def __init__(self, message, status_code=500):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _report(progress, step):
+    if progress is not None:
+        progress(step, KARAOKE_STAGES[step - 1])
+
+
+def run_karaoke_pipeline(workspace, temp_audio_path, timestamp_lyrics, progress=None, delivery="base64"):
+    """
+    Run steps 4-9 of the karaoke process on an upload saved in a workspace.
+
+    The pipeline owns the workspace: it is removed when the pipeline fails or
+    finishes, except for delivery="stream" where the caller removes it after
+    streaming the stems.
+
+    Args:
+        workspace (Workspace): Private scratch directory of this request.
+        temp_audio_path (str): Path of the saved upload inside the workspace.
+        timestamp_lyrics (list): Parsed timestamp lyrics.
+        progress (callable | None): Called as progress(step, stage_name) when a step starts.
+        delivery (str): How stems are returned:
+            - "base64": zip embedded in the payload as "zip_file" (original format)
+            - "urls": short-lived download links in "stems"
+            - "stream": stem paths in "stems"; the workspace is NOT removed, the
+              caller streams the files and then calls workspace.cleanup()
+
+    Returns:
+        dict: {"adjusted_timestamp", "computed_amplitude"} plus "zip_file" or "stems".
+
+    Raises:
+        KaraokeProcessingError: When a step fails.
+    """
+    try:
+        payload = _run_steps(workspace, temp_audio_path, timestamp_lyrics, progress, delivery)
+    except BaseException:
+        workspace.cleanup()
+        raise
+
+    if delivery != "stream":
+        log.debug("[Step 8] Cleaning up temporary files")
+        _report(progress, 8)
+        # Step 7: Clean up temporary files
+        workspace.cleanup()
+
+    log.debug("[Step 9] Returning results")
+    _report(progress, 9)
+
+    return payload
+
+
+def analyse_track(workspace, temp_audio_path, timestamp_lyrics, progress=None):
+    """
+    Steps 4-6: separate stems, compute amplitude, detect the first word and align
+    the lyrics. Shared by the HTTP endpoint and the offline batch command.
+
+    Args:
+        workspace (Workspace): Scratch directory, stems are written inside it.
+        temp_audio_path (str): Path of the audio file.
+        timestamp_lyrics (list): TimestampLyric objects (or client dicts, see coerce_timestamp_lyrics).
+        progress (callable | None): Called as progress(step, stage_name) when a step starts.
+
+    Returns:
+        tuple: (analysis dict {"adjusted_timestamp", "computed_amplitude", "audio_hash"},
+            stems dict {stem: .mp3 path}). adjusted_timestamp entries are
+            {"timestamp": seconds, "lyric"} plus "confidence" in global mode.
+
+    Raises:
+        KaraokeProcessingError: When a step fails.
+    """
+    # Decoded once here (the stem cache keys on the decoded samples) and shared by
+    # the amplitude and mp3 stages; the pyramid is keyed on the file bytes
+    audio = DecodedAudio.from_file(temp_audio_path)
+
+    log.debug("[Step 4] Splitting sounds using Spleeter")
+    _report(progress, 4)
+    # Step 2: Split sounds using Spleeter
+    output_dir = workspace.subdir("spleeter_output")
+
+    result, stem_audio = spleeter_separate_decoded(audio, "2", output_dir)
+
+    if not result or "vocals" not in result:
+        log.error("[Step 4] Failed to process audio")
+        raise KaraokeProcessingError("Failed to process audio", 500)
+
+    vocals_path = result["vocals"]
+    log.debug("[Step 4] Vocals separated", path=vocals_path)
+
+    log.debug("[Step 5] Processing amplitude and detecting words in parallel")
+    _report(progress, 5)
+    # Step 3 & 4: Process amplitude and detect first word in parallel
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        future_amplitude = executor.submit(compute_amplitude, audio, 100)
+        # Every voiced segment, the global alignment matches lines against all of them
+        future_words = executor.submit(detect_words, stem_audio["vocals"])
+        # Zoomable waveform for the player, served later by GET /amplitude/<audio_hash>
+        future_pyramid = executor.submit(get_amplitude_pyramid, audio)
+
+        computed_amplitude = future_amplitude.result()
+        word_segments = future_words.result()
+        audio_hash, _ = future_pyramid.result()
+
+    first_word_segment = word_segments[0] if word_segments else None
+    if not first_word_segment:
+        log.warning("[Step 5] No valid word detected in vocals")
+        raise KaraokeProcessingError("No valid word detected in vocals", 400)
+
+    log.debug("[Step 6] Aligning timestamps of lyrics with amplitude", mode=KARAOKE_ALIGN_MODE)
+    _report(progress, 6)
+    # Step 5: Align the first timestamp of lyrics with amplitude
+    adjusted_timestamp = align_timestamps_with_amplitude(
+        first_word_segment=first_word_segment,
+        timestamp_lyrics=timestamp_lyrics,  # Pass the parsed list
+        allow_difference=0.10,
+        word_segments=word_segments,
+        mode=KARAOKE_ALIGN_MODE
+    )
+
+    analysis = {
+        "adjusted_timestamp": [tl.to_dict() for tl in adjusted_timestamp],
+        "computed_amplitude": computed_amplitude,
+        "audio_hash": audio_hash,
+    }
+    return analysis, result
+
+
+def _run_steps(workspace, temp_audio_path, timestamp_lyrics, progress, delivery):
+    payload, result = analyse_track(workspace, temp_audio_path, timestamp_lyrics, progress)
+
+    log.debug("[Step 7] Packaging the result files")
+    _report(progress, 7)
+
+    if delivery == "stream":
+        # Files are streamed straight from the workspace by the caller
+        payload["stems"] = result
+    elif delivery == "urls":
+        payload["stems"] = {
+            stem: publish(path, f"{stem}.mp3") for stem, path in result.items()
+        }
+        payload["expires_in"] = DOWNLOAD_TTL_SECONDS
+    else:
+        # Step 6: Zip the result files
+        zip_path = os.path.join(workspace.path, "karaoke_result.zip")
+        zip_audio_files(result, zip_path)
+
+        # Ensure zip_path is valid
+        if not os.path.exists(zip_path):
+            log.error("[Step 7] Failed to create zip file")
+            raise KaraokeProcessingError("Failed to create zip file", 500)
+
+        with open(zip_path, "rb") as f:
+            payload["zip_file"] = base64.b64encode(f.read()).decode('utf-8')
+
+    return payload
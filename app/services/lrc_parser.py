@@ -0,0 +1,260 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+# [mm:ss], [mm:ss.xx], [mm:ss:xx] and [mm:ss.xxx] time tags
+_TIME = r"(\d+):(\d{1,2})(?:[.:](\d{1,3}))?"
+_TIME_TAG_RE = re.compile(r"^" + _TIME + r"$")
+# Common case: one time tag followed by the text
+_SIMPLE_LINE_RE = re.compile(r"^\[" + _TIME + r"\]([^\[]*)$")
+# All leading [...] tags of a line and the text after them
+_LINE_RE = re.compile(r"^((?:\[[^\]]*\]\s*)+)(.*)$")
+_TAG_RE = re.compile(r"\[([^\]]*)\]")
+_META_RE = re.compile(r"^([A-Za-z#]+)\s*:(.*)$")
+# Enhanced LRC word tags: <mm:ss.xx>word
+_WORD_TAG_RE = re.compile(r"<" + _TIME + r">")
+
+
+@dataclass
+class LrcWord:
+    start: float
+    end: float
+    text: str
+
+
+@dataclass
+class LrcLine:
+    start: float
+    end: float
+    text: str
+    words: List[LrcWord] = field(default_factory=list)
+
+
+@dataclass
+class LrcDocument:
+    lines: List[LrcLine]
+    metadata: Dict[str, str]
+    offset_ms: int = 0
+
+    def to_entries(self):
+        """
+        [{start, end, line}] in seconds, the format parse_lrc_entries() returns.
+        """
+        return [{"start": round(line.start, 2), "end": round(line.end, 2), "line": line.text} for line in self.lines]
+
+    def to_dict(self):
+        return {
+            "metadata": self.metadata,
+            "offset_ms": self.offset_ms,
+            "lines": [
+                {
+                    "start": round(line.start, 3),
+                    "end": round(line.end, 3),
+                    "text": line.text,
+                    "words": [
+                        {"start": round(w.start, 3), "end": round(w.end, 3), "text": w.text} for w in line.words
+                    ],
+                }
+                for line in self.lines
+            ],
+        }
+
+
+def _seconds(minutes, seconds, fraction):
+    value = int(minutes) * 60 + int(seconds)
+    if fraction:
+        # .5 -> 0.5, .05 -> 0.05, .005 -> 0.005
+        value += int(fraction) / (10 ** len(fraction))
+    return value
+
+
+def _parse_words(text):
+    """
+    Split an enhanced LRC line into (plain text, [(start, word)]).
+    """
+    parts = _WORD_TAG_RE.split(text)
+    # parts: [before, m, s, f, word, m, s, f, word, ...]
+    words = []
+    for i in range(1, len(parts), 4):
+        word = parts[i + 3].strip()
+        if word:
+            words.append((_seconds(parts[i], parts[i + 1], parts[i + 2]), word))
+    plain = " ".join(" ".join([parts[0]] + parts[4::4]).split())
+    return plain, words
+
+
+def parse_lrc(lrc_text, apply_offset=True):
+    """
+    Parse LRC / enhanced LRC in one pass over the lines, without touching disk.
+
+    Supports several time tags per line ([00:12.00][01:30.00]chorus), enhanced
+    word tags (<00:12.30>word), [offset:+/-ms] and any [key:value] metadata.
+
+    Args:
+        lrc_text (str): LRC content.
+        apply_offset (bool): Shift times by the offset tag (a positive offset
+            shows lyrics sooner).
+
+    Returns:
+        LrcDocument: Lines sorted by start. A line ends where the next starts,
+            the last line ends at its own start.
+    """
+    metadata = {}
+    raw_lines = []  # (start, order, text, words)
+    order = 0
+    for line in lrc_text.splitlines():
+        line = line.strip()
+        if not line.startswith("["):
+            continue
+        simple = _SIMPLE_LINE_RE.match(line)
+        if simple is not None:
+            minutes, seconds, fraction, text = simple.groups()
+            if "<" in text:
+                text, words = _parse_words(text)
+            else:
+                text, words = text.strip(), []
+            raw_lines.append((_seconds(minutes, seconds, fraction), order, text, words))
+            order += 1
+            continue
+        match = _LINE_RE.match(line)
+        if match is None:
+            continue
+        tags, text = match.groups()
+        times = []
+        for tag in _TAG_RE.findall(tags):
+            time_match = _TIME_TAG_RE.match(tag.strip())
+            if time_match:
+                times.append(_seconds(*time_match.groups()))
+                continue
+            meta_match = _META_RE.match(tag.strip())
+            if meta_match:
+                metadata[meta_match.group(1).lower()] = meta_match.group(2).strip()
+        if not times:
+            continue
+
+        if "<" in text:
+            text, words = _parse_words(text)
+        else:
+            text, words = text.strip(), []
+        for start in times:
+            # A repeated line reuses the word timing of its first occurrence
+            shift = start - times[0]
+            raw_lines.append((start, order, text, [(t + shift, w) for t, w in words]))
+            order += 1
+
+    offset_ms = 0
+    try:
+        offset_ms = int(metadata.get("offset", "0").replace("+", "") or 0)
+    except ValueError:
+        pass
+    shift = -offset_ms / 1000.0 if apply_offset else 0.0
+
+    raw_lines.sort(key=lambda item: (item[0], item[1]))
+    lines = []
+    for i, (start, _, text, words) in enumerate(raw_lines):
+        start = max(0.0, start + shift)
+        end = max(0.0, raw_lines[i + 1][0] + shift) if i + 1 < len(raw_lines) else start
+        line_words = []
+        for j, (word_start, word) in enumerate(words):
+            word_start = max(0.0, word_start + shift)
+            word_end = max(0.0, words[j + 1][0] + shift) if j + 1 < len(words) else max(end, word_start)
+            line_words.append(LrcWord(word_start, word_end, word))
+        lines.append(LrcLine(start, end, text, line_words))
+    return LrcDocument(lines, metadata, offset_ms)
+
+
+def format_timestamp(seconds):
+    """
+    Seconds -> "mm:ss.xx".
+    """
+    centiseconds = int(round(max(0.0, seconds) * 100))
+    minutes, centiseconds = divmod(centiseconds, 6000)
+    return f"{minutes:02d}:{centiseconds // 100:02d}.{centiseconds % 100:02d}"
+
+
+def to_lrc(lines, metadata=None, enhanced=False, offset_applied=True):
+    """
+    Write LRC text.
+
+    Args:
+        lines (list): LrcLine objects, or dicts {start, text, words} in seconds.
+        metadata (dict | None): [key:value] header tags, e.g. {"ti": ..., "ar": ...}.
+        enhanced (bool): Add <mm:ss.xx> word tags when words are present.
+        offset_applied (bool): The times already include the offset tag (what
+            parse_lrc returns by default), so [offset:] is not written again.
+
+    Returns:
+        str
+    """
+    metadata = dict(metadata or {})
+    if offset_applied:
+        metadata.pop("offset", None)
+    out = [f"[{key}:{value}]" for key, value in metadata.items()]
+    for line in lines:
+        if isinstance(line, dict):
+            start, text, words = line["start"], line.get("text", ""), line.get("words") or []
+            words = [(w["start"], w["text"]) for w in words]
+        else:
+            start, text, words = line.start, line.text, [(w.start, w.text) for w in line.words]
+        if enhanced and words:
+            text = " ".join(f"<{format_timestamp(t)}>{word}" for t, word in words)
+        out.append(f"[{format_timestamp(start)}]{text}")
+    return "\n".join(out) + "\n"
+
+
+def split_words_by_lyrics(words, lyrics):
+    """
+    Group aligned words into the lyric lines they came from, by word count.
+
+    Args:
+        words (list): Word dicts in lyric order, with a "text" key.
+        lyrics (str | None): Lyrics the words were aligned from.
+
+    Returns:
+        list: (line text, words) pairs. The text is the lyric line; words left
+            over when the counts differ form a last line of their own.
+    """
+    lyric_lines = [line.strip() for line in (lyrics or "").splitlines() if line.strip()]
+    groups = []
+    position = 0
+    for line in lyric_lines:
+        chunk = words[position:position + len(line.split())]
+        position += len(line.split())
+        if chunk:
+            groups.append((line, chunk))
+    if position < len(words):
+        rest = words[position:]
+        groups.append((" ".join(w["text"] for w in rest), rest))
+    return groups
+
+
+def alignment_to_lrc(alignment, lyrics=None, metadata=None, enhanced=True):
+    """
+    LRC export of a normalized alignment ({"words", "lines"} in ms, see aligners).
+
+    Words are attached to the line they start in. Word-only alignments (MFA)
+    are split into lines following the lyrics, by word count.
+
+    Args:
+        alignment (dict): Normalized alignment.
+        lyrics (str | None): Lyrics used for the alignment, needed for word-only results.
+        metadata (dict | None): Header tags.
+        enhanced (bool): Write <mm:ss.xx> word tags.
+
+    Returns:
+        str
+    """
+    words = [{"start": w["start"] / 1000.0, "text": w["text"]} for w in alignment.get("words", [])]
+    lines = [{"start": l["start"] / 1000.0, "text": l["text"], "words": []} for l in alignment.get("lines", [])]
+
+    if not lines and words:
+        for text, chunk in split_words_by_lyrics(words, lyrics):
+            lines.append({"start": chunk[0]["start"], "text": text, "words": chunk})
+    elif lines and words:
+        line_index = 0
+        for word in words:
+            while line_index + 1 < len(lines) and word["start"] >= lines[line_index + 1]["start"]:
+                line_index += 1
+            lines[line_index]["words"].append(word)
+
+    return to_lrc(lines, metadata, enhanced)
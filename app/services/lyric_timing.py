@@ -0,0 +1,105 @@
+import math
+
+import numpy as np
+
+
+def parse_timestamp(value):
+    """
+    Seconds from a number, "ss.xx", "mm:ss.xx" or "hh:mm:ss.xx".
+
+    Raises:
+        ValueError: When the value is not a timestamp, or is negative, nan or infinite.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        parts = [value]
+    elif isinstance(value, str):
+        parts = value.strip().split(":")
+    else:
+        raise ValueError(f"Invalid timestamp: {value!r}")
+    seconds = 0.0
+    try:
+        for part in parts:
+            part = float(part)
+            if not math.isfinite(part) or math.copysign(1.0, part) < 0:
+                raise ValueError
+            seconds = seconds * 60 + part
+    except (OverflowError, ValueError):
+        raise ValueError(f"Invalid timestamp: {value!r}") from None
+    if not math.isfinite(seconds):
+        raise ValueError(f"Invalid timestamp: {value!r}")
+    return seconds
+
+
+class TimestampLyric:
+    """
+    One lyric line, timestamp is its start in seconds.
+    """
+    __slots__ = ("timestamp", "lyric", "confidence")
+
+    def __init__(self, timestamp, lyric, confidence=None):
+        self.timestamp = parse_timestamp(timestamp)
+        self.lyric = lyric
+        self.confidence = confidence
+
+    def to_dict(self):
+        entry = {"timestamp": round(self.timestamp, 3), "lyric": self.lyric}
+        if self.confidence is not None:
+            entry["confidence"] = self.confidence
+        return entry
+
+    def __eq__(self, other):
+        if not isinstance(other, TimestampLyric):
+            return NotImplemented
+        return (self.timestamp, self.lyric, self.confidence) == (other.timestamp, other.lyric, other.confidence)
+
+    def __repr__(self):
+        return f"TimestampLyric(timestamp={self.timestamp!r}, lyric={self.lyric!r}, confidence={self.confidence!r})"
+
+
+def coerce_timestamp_lyrics(items):
+    """
+    Client timestamp lyrics to TimestampLyric objects.
+
+    Accepts TimestampLyric objects, dicts ({"timestamp" | "start" | "time",
+    "lyric" | "line" | "text"}) and [timestamp, lyric] pairs.
+
+    Raises:
+        ValueError: When the list or one of its items is malformed.
+    """
+    if not isinstance(items, list):
+        raise ValueError("Timestamp lyrics must be a list")
+    lines = []
+    for i, item in enumerate(items):
+        if isinstance(item, TimestampLyric):
+            lines.append(item)
+            continue
+        try:
+            if isinstance(item, dict):
+                timestamp = item.get("timestamp", item.get("start", item.get("time")))
+                lyric = item.get("lyric", item.get("line", item.get("text", "")))
+            else:
+                timestamp, lyric = item
+            lines.append(TimestampLyric(timestamp, lyric if isinstance(lyric, str) else str(lyric)))
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid timestamp lyric at index {i}") from None
+    return lines
+
+
+def timestamps_array(timestamp_lyrics):
+    """
+    Start times of the lines as a float64 array in seconds.
+    """
+    return np.fromiter((tl.timestamp for tl in timestamp_lyrics), dtype=np.float64, count=len(timestamp_lyrics))
+
+
+def with_timestamps(timestamp_lyrics, starts, confidence=None):
+    """
+    New lines with the starts (and confidences) replaced, lyrics kept.
+    Starts shifted before the beginning of the track are clamped to 0.
+    """
+    starts = np.maximum(np.asarray(starts, dtype=np.float64), 0.0).round(3).tolist()
+    if confidence is None:
+        confidence = [None] * len(starts)
+    else:
+        confidence = np.asarray(confidence, dtype=np.float64).round(3).tolist()
+    return [TimestampLyric(start, tl.lyric, conf) for tl, start, conf in zip(timestamp_lyrics, starts, confidence)]
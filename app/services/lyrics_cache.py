@@ -0,0 +1,233 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from app.utils.logger import get_logger
+
+log = get_logger("Lyrics")
+
+LYRICS_CACHE_PATH = os.getenv("LYRICS_CACHE_PATH", "./cache/lyrics.sqlite3")
+LYRICS_CACHE_TTL_SECONDS = int(os.getenv("LYRICS_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+# "Not found" answers are remembered for a shorter time, the song may be added later
+LYRICS_CACHE_MISS_TTL_SECONDS = int(os.getenv("LYRICS_CACHE_MISS_TTL_SECONDS", "3600"))
+LYRICS_CACHE_MEMORY_ITEMS = int(os.getenv("LYRICS_CACHE_MEMORY_ITEMS", "512"))
+# Songs kept on disk, least recently used are dropped past this
+LYRICS_CACHE_MAX_SONGS = int(os.getenv("LYRICS_CACHE_MAX_SONGS", "20000"))
+
+# The disk bound is checked every this many stores, not on each one
+PRUNE_EVERY = 64
+
+# Version of the cached lyrics payloads, bump when scrape_lyrics() output changes.
+# A cache file written with another version is emptied when opened.
+# 2: DOM-free extraction, keeps <i>/<b>/<span> text and whole annotated lines
+LYRICS_FORMAT_VERSION = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS queries (
+    query TEXT PRIMARY KEY,
+    song_id INTEGER,
+    error TEXT,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS songs (
+    song_id INTEGER PRIMARY KEY,
+    payload TEXT NOT NULL,
+    expires REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS songs_accessed ON songs (accessed);
+"""
+
+
+class LyricsCache:
+    """
+    Two level cache: normalized query -> Genius song id -> lyrics payload.
+
+    Several spellings of a query share one song entry. Both levels have a TTL
+    and an in-memory LRU in front of a sqlite file, so entries survive restarts
+    and are shared by the worker processes of one host.
+    """
+
+    def __init__(self, path=LYRICS_CACHE_PATH, ttl=LYRICS_CACHE_TTL_SECONDS,
+                 miss_ttl=LYRICS_CACHE_MISS_TTL_SECONDS, memory_items=LYRICS_CACHE_MEMORY_ITEMS,
+                 max_songs=LYRICS_CACHE_MAX_SONGS, format_version=LYRICS_FORMAT_VERSION):
+        self.path = path
+        self.format_version = format_version
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self.memory_items = memory_items
+        self.max_songs = max_songs
+        self._queries = OrderedDict()  # query -> (expires, song_id, error)
+        self._songs = OrderedDict()  # song_id -> (expires, payload)
+        self._lock = threading.Lock()
+        self._db = None
+        self._stores_since_prune = 0
+        self._stats = {
+            "query_hits": 0, "song_hits": 0, "memory_hits": 0,
+            "query_misses": 0, "song_misses": 0, "stores": 0,
+        }
+
+    def _connect_locked(self):
+        if self._db is None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(_SCHEMA)
+            version = self._db.execute("PRAGMA user_version").fetchone()[0]
+            if version != self.format_version:
+                # Written by an older scraper, its payloads must not be served
+                removed = self._db.execute("DELETE FROM songs").rowcount
+                self._db.execute("DELETE FROM queries")
+                if removed:
+                    log.info("Lyrics cache format changed, cleared it", old=version, new=self.format_version, songs=removed)
+                self._db.execute(f"PRAGMA user_version = {int(self.format_version)}")
+        return self._db
+
+    def _execute_locked(self, sql, params=()):
+        try:
+            return self._connect_locked().execute(sql, params)
+        except sqlite3.Error as e:
+            # The cache is an optimisation, a broken store must not fail the request
+            log.error("Lyrics cache error", error=str(e))
+            return None
+
+    def _remember_locked(self, entries, key, value):
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.memory_items:
+            entries.popitem(last=False)
+
+    def get_query(self, query):
+        """
+        Returns:
+            tuple | None: (song_id, error) for a known query, song_id is None for
+                a remembered "not found"; None when the query is unknown or expired.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._queries.get(query)
+            if entry is not None and entry[0] > now:
+                self._queries.move_to_end(query)
+                self._stats["query_hits"] += 1
+                self._stats["memory_hits"] += 1
+                return entry[1], entry[2]
+            cursor = self._execute_locked(
+                "SELECT expires, song_id, error FROM queries WHERE query = ?", (query,)
+            )
+            row = cursor.fetchone() if cursor is not None else None
+            if row is None or row[0] <= now:
+                self._queries.pop(query, None)
+                self._stats["query_misses"] += 1
+                return None
+            self._remember_locked(self._queries, query, row)
+            self._stats["query_hits"] += 1
+            return row[1], row[2]
+
+    def put_query(self, query, song_id, error=None):
+        """
+        Remember what a query resolved to; song_id None stores a "not found" with error.
+        """
+        expires = time.time() + (self.ttl if song_id is not None else self.miss_ttl)
+        with self._lock:
+            self._remember_locked(self._queries, query, (expires, song_id, error))
+            self._execute_locked(
+                "INSERT OR REPLACE INTO queries (query, song_id, error, expires) VALUES (?, ?, ?, ?)",
+                (query, song_id, error, expires),
+            )
+
+    def get_song(self, song_id):
+        """
+        Returns:
+            dict | None: Cached lyrics payload of a Genius song id.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._songs.get(song_id)
+            if entry is not None and entry[0] > now:
+                self._songs.move_to_end(song_id)
+                self._stats["song_hits"] += 1
+                self._stats["memory_hits"] += 1
+                return entry[1]
+            cursor = self._execute_locked("SELECT expires, payload FROM songs WHERE song_id = ?", (song_id,))
+            row = cursor.fetchone() if cursor is not None else None
+            if row is None or row[0] <= now:
+                self._songs.pop(song_id, None)
+                self._stats["song_misses"] += 1
+                return None
+            payload = json.loads(row[1])
+            self._remember_locked(self._songs, song_id, (row[0], payload))
+            # Bump the access time used for LRU ordering on disk
+            self._execute_locked("UPDATE songs SET accessed = ? WHERE song_id = ?", (now, song_id))
+            self._stats["song_hits"] += 1
+            return payload
+
+    def put_song(self, song_id, payload):
+        now = time.time()
+        expires = now + self.ttl
+        with self._lock:
+            self._remember_locked(self._songs, song_id, (expires, payload))
+            self._execute_locked(
+                "INSERT OR REPLACE INTO songs (song_id, payload, expires, accessed) VALUES (?, ?, ?, ?)",
+                (song_id, json.dumps(payload, ensure_ascii=False), expires, now),
+            )
+            self._stats["stores"] += 1
+            self._stores_since_prune += 1
+            if self._stores_since_prune >= PRUNE_EVERY:
+                self._stores_since_prune = 0
+                self._prune_locked(now)
+
+    def _prune_locked(self, now):
+        self._execute_locked("DELETE FROM queries WHERE expires <= ?", (now,))
+        self._execute_locked("DELETE FROM songs WHERE expires <= ?", (now,))
+        self._execute_locked(
+            "DELETE FROM songs WHERE song_id IN ("
+            "SELECT song_id FROM songs ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.max_songs,),
+        )
+
+    def iter_titles(self):
+        """
+        (song_id, title, artist) of every unexpired song on disk, most recently
+        used last. Only the two fields are read, not the lyrics payloads.
+        """
+        with self._lock:
+            cursor = self._execute_locked(
+                "SELECT song_id, json_extract(payload, '$.title'), json_extract(payload, '$.artist') "
+                "FROM songs WHERE expires > ? ORDER BY accessed",
+                (time.time(),),
+            )
+            rows = cursor.fetchall() if cursor is not None else []
+        return [(song_id, title, artist or "") for song_id, title, artist in rows if title]
+
+    def clear(self):
+        """
+        Drop every entry. Returns the number of songs removed from disk.
+        """
+        with self._lock:
+            self._queries.clear()
+            self._songs.clear()
+            cursor = self._execute_locked("SELECT COUNT(*) FROM songs")
+            removed = cursor.fetchone()[0] if cursor is not None else 0
+            self._execute_locked("DELETE FROM queries")
+            self._execute_locked("DELETE FROM songs")
+            return removed
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_queries"] = len(self._queries)
+            stats["memory_songs"] = len(self._songs)
+            cursor = self._execute_locked("SELECT (SELECT COUNT(*) FROM queries), (SELECT COUNT(*) FROM songs)")
+            row = cursor.fetchone() if cursor is not None else (0, 0)
+        stats["queries"], stats["songs"] = row
+        lookups = stats["query_hits"] + stats["query_misses"]
+        stats["hit_ratio"] = stats["query_hits"] / lookups if lookups else 0.0
+        return stats
+
+
+lyrics_cache = LyricsCache()
@@ -0,0 +1,214 @@
+import hashlib
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from app.utils.logger import get_logger
+
+log = get_logger("MFA")
+
+# Warm directories (MFA's --temporary_directory) live here, one per model/dictionary pair
+MFA_WORK_ROOT = os.path.abspath(os.getenv("MFA_WORK_ROOT", "./cache/mfa"))
+# A batch starts once MFA_BATCH_MAX requests are waiting or the first one waited this long
+MFA_BATCH_WINDOW_SECONDS = float(os.getenv("MFA_BATCH_WINDOW_SECONDS", "2"))
+MFA_BATCH_MAX = int(os.getenv("MFA_BATCH_MAX", "8"))
+MFA_JOBS = int(os.getenv("MFA_JOBS", str(os.cpu_count() or 1)))
+MFA_RUN_TIMEOUT = int(os.getenv("MFA_RUN_TIMEOUT", "1800"))
+MFA_REQUEST_TIMEOUT = int(os.getenv("MFA_REQUEST_TIMEOUT", "2400"))
+
+_runtimes = {}
+_runtimes_lock = threading.Lock()
+
+
+class _Request:
+    __slots__ = ("id", "lyrics", "audio_path", "textgrid_path", "future")
+
+    def __init__(self, lyrics, audio_path, textgrid_path):
+        self.id = uuid.uuid4().hex[:12]
+        self.lyrics = lyrics
+        self.audio_path = audio_path
+        self.textgrid_path = textgrid_path
+        self.future = Future()
+
+
+class MfaRuntime:
+    """
+    Runs `mfa align` for one acoustic model + dictionary pair.
+
+    The temporary directory is kept between runs (no --clean), so MFA reuses
+    its extracted model and compiled dictionary. Requests that arrive within
+    the batch window are aligned together: each becomes one speaker of a single
+    corpus, and one `mfa align` call produces every request's TextGrid.
+    """
+
+    def __init__(self, acoustic_model_path, dictionary_path, mfa_bin="mfa"):
+        self.acoustic_model_path = acoustic_model_path
+        self.dictionary_path = dictionary_path
+        self.mfa_bin = mfa_bin
+        key = hashlib.sha1(f"{acoustic_model_path}|{dictionary_path}".encode("utf-8")).hexdigest()[:16]
+        self.work_dir = os.path.join(MFA_WORK_ROOT, key)
+        self.temp_dir = os.path.join(self.work_dir, "mfa_temp")
+        os.makedirs(self.temp_dir, exist_ok=True)
+        self.batches = 0
+        self.requests = 0
+        self.last_run_seconds = None
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="mfa-runtime", daemon=True)
+        self._thread.start()
+
+    def align(self, lyrics, audio_path, textgrid_path, timeout=MFA_REQUEST_TIMEOUT):
+        """
+        Args:
+            lyrics (str): Transcript of the audio.
+            audio_path (str): wav file to align, it is copied into the batch corpus.
+            textgrid_path (str): Where to write this request's TextGrid.
+
+        Returns:
+            tuple: (textgrid_path, None) or (None, error message)
+        """
+        request = _Request(lyrics, audio_path, textgrid_path)
+        self._queue.put(request)
+        try:
+            return request.future.result(timeout=timeout)
+        except FutureTimeoutError:
+            return None, "MFA align timed out"
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + MFA_BATCH_WINDOW_SECONDS
+        while len(batch) < MFA_BATCH_MAX:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            try:
+                results = self._run_batch(batch)
+            except Exception as e:
+                results = {request.id: (None, f"MFA align failed: {e}") for request in batch}
+            for request in batch:
+                request.future.set_result(results.get(request.id, (None, "MFA align failed")))
+
+    def _run_batch(self, batch):
+        batch_id = uuid.uuid4().hex[:12]
+        # Corpus name doubles as MFA's per-corpus subdirectory of temp_dir
+        corpus_name = f"corpus_{batch_id}"
+        corpus_dir = os.path.join(self.work_dir, corpus_name)
+        output_dir = os.path.join(self.work_dir, f"aligned_{batch_id}")
+        results = {}
+        try:
+            # A request that can't be staged fails alone, the rest of the batch still runs
+            staged = []
+            for request in batch:
+                speaker_dir = os.path.join(corpus_dir, request.id)
+                try:
+                    os.makedirs(speaker_dir, exist_ok=True)
+                    _link_or_copy(request.audio_path, os.path.join(speaker_dir, f"{request.id}.wav"))
+                    with open(os.path.join(speaker_dir, f"{request.id}.lab"), "w", encoding="utf-8") as f:
+                        f.write(request.lyrics)
+                except OSError as e:
+                    log.warning("Could not stage request", request=request.id, error=str(e))
+                    shutil.rmtree(speaker_dir, ignore_errors=True)
+                    results[request.id] = (None, f"MFA align failed: {e}")
+                    continue
+                staged.append(request)
+            if not staged:
+                return results
+            batch = staged
+
+            cmd = [
+                self.mfa_bin, "align",
+                corpus_dir,
+                self.dictionary_path,
+                self.acoustic_model_path,
+                output_dir,
+                "--temporary_directory", self.temp_dir,
+                "-j", str(MFA_JOBS),
+            ]
+            started = time.perf_counter()
+            try:
+                subprocess.run(cmd, capture_output=True, text=True, check=True, timeout=MFA_RUN_TIMEOUT)
+            except subprocess.CalledProcessError as e:
+                error = f"MFA align failed: {e.stderr}"
+                results.update({request.id: (None, error) for request in batch})
+                return results
+            except subprocess.TimeoutExpired:
+                results.update({request.id: (None, "MFA align timed out") for request in batch})
+                return results
+            self.last_run_seconds = time.perf_counter() - started
+            self.batches += 1
+            self.requests += len(batch)
+            log.info("Aligned in one run", requests=len(batch), seconds=round(self.last_run_seconds, 1))
+
+            for request in batch:
+                produced = _find_textgrid(output_dir, request.id)
+                if produced is None:
+                    results[request.id] = (None, "TextGrid not found after alignment")
+                    continue
+                os.makedirs(os.path.dirname(os.path.abspath(request.textgrid_path)), exist_ok=True)
+                shutil.move(produced, request.textgrid_path)
+                results[request.id] = (request.textgrid_path, None)
+            return results
+        finally:
+            # Keep the model/dictionary caches, drop everything specific to this batch
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+            shutil.rmtree(output_dir, ignore_errors=True)
+            shutil.rmtree(os.path.join(self.temp_dir, corpus_name), ignore_errors=True)
+
+    def stats(self):
+        return {
+            "work_dir": self.work_dir,
+            "batches": self.batches,
+            "requests": self.requests,
+            "avg_batch": round(self.requests / self.batches, 2) if self.batches else 0,
+            "queued": self._queue.qsize(),
+            "last_run_seconds": round(self.last_run_seconds, 3) if self.last_run_seconds is not None else None,
+        }
+
+
+def _link_or_copy(source, destination):
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+def _find_textgrid(output_dir, name):
+    # MFA keeps the speaker directories in its output, older versions flatten them
+    for path in (
+        os.path.join(output_dir, name, f"{name}.TextGrid"),
+        os.path.join(output_dir, f"{name}.TextGrid"),
+    ):
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def get_mfa_runtime(acoustic_model_path, dictionary_path, mfa_bin="mfa"):
+    """
+    Shared runtime for a model/dictionary pair, started on first use.
+    """
+    key = (acoustic_model_path, dictionary_path, mfa_bin)
+    with _runtimes_lock:
+        runtime = _runtimes.get(key)
+        if runtime is None:
+            runtime = MfaRuntime(acoustic_model_path, dictionary_path, mfa_bin)
+            _runtimes[key] = runtime
+        return runtime
+
+
+def mfa_runtime_stats():
+    with _runtimes_lock:
+        return [runtime.stats() for runtime in _runtimes.values()]
@@ -0,0 +1,219 @@
+import gc
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from app.utils.logger import get_logger
+
+log = get_logger("Models")
+
+# Resident models are evicted least recently used first once their summed size
+# goes over this budget. Sizes are measured as the RSS (plus CUDA allocation)
+# growth while loading, so they are an estimate. Loads run one at a time so
+# that one load's growth is not counted in another's.
+MODEL_MEMORY_BUDGET_MB = int(os.getenv("MODEL_MEMORY_BUDGET_MB", "2048"))
+
+# Models are preloaded through WARMUP_BACKENDS, e.g. "whisperx:en,whisperx_align:en"
+ModelKey = namedtuple("ModelKey", ["name", "device", "compute_type", "language"])
+
+
+class _Entry:
+    __slots__ = ("model", "size_bytes", "load_seconds", "loaded_at", "last_used", "hits")
+
+    def __init__(self, model, size_bytes, load_seconds):
+        self.model = model
+        self.size_bytes = size_bytes
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+        self.hits = 0
+
+
+def _memory_bytes():
+    """
+    Resident set size of this process, plus CUDA memory if torch is in use.
+    """
+    total = 0
+    try:
+        with open("/proc/self/statm") as f:
+            total = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        try:
+            if torch.cuda.is_available():
+                total += torch.cuda.memory_allocated()
+        except Exception:
+            pass
+    return total
+
+
+def _release_memory():
+    gc.collect()
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        try:
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except Exception:
+            pass
+
+
+class ModelRegistry:
+    """
+    Loads each model at most once and keeps the resident set under a memory budget.
+
+    Concurrent requests for a model that is not loaded yet wait on a per-key lock,
+    so only the first one runs the loader. Loads of different keys are serialized
+    by a registry-wide lock for the size measurement; hits never wait on it.
+
+    Components holding on to a model (e.g. a batcher thread) register with
+    add_eviction_listener() and drop their reference when it is evicted, so the
+    memory is actually freed.
+    """
+
+    def __init__(self, budget_mb=MODEL_MEMORY_BUDGET_MB):
+        self.budget_bytes = budget_mb * 1024 * 1024
+        self._entries = OrderedDict()
+        self._load_locks = {}
+        self._measure_lock = threading.Lock()
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._load_seconds = 0.0
+
+    def get(self, key, loader):
+        """
+        Args:
+            key (ModelKey): Identity of the model.
+            loader (callable): Called without arguments to load the model on a miss.
+
+        Returns:
+            The loaded model.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                return self._touch(key, entry)
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            # Another thread may have finished loading while we waited
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    return self._touch(key, entry)
+                self._misses += 1
+
+            with self._measure_lock:
+                before = _memory_bytes()
+                started = time.perf_counter()
+                model = loader()
+                load_seconds = time.perf_counter() - started
+                size_bytes = max(0, _memory_bytes() - before)
+
+            with self._lock:
+                self._entries[key] = _Entry(model, size_bytes, load_seconds)
+                self._load_seconds += load_seconds
+                self._load_locks.pop(key, None)
+                evicted = self._evict_over_budget(keep=key)
+
+        log.info("Loaded model", name=key.name, device=key.device, compute_type=key.compute_type,
+                 language=key.language, seconds=round(load_seconds, 1), mb=round(size_bytes / (1024 * 1024)))
+        if evicted:
+            for evicted_key in evicted:
+                log.info("Evicted model", name=evicted_key.name, language=evicted_key.language)
+            self._evicted(evicted)
+        return model
+
+    def add_eviction_listener(self, callback):
+        """
+        Call callback(key) whenever a model leaves the registry.
+        """
+        with self._lock:
+            if callback not in self._listeners:
+                self._listeners.append(callback)
+
+    def _evicted(self, keys):
+        with self._lock:
+            listeners = list(self._listeners)
+        for key in keys:
+            for callback in listeners:
+                try:
+                    callback(key)
+                except Exception as e:
+                    log.error("Eviction listener failed", name=key.name, error=str(e))
+        _release_memory()
+
+    def _touch(self, key, entry):
+        self._entries.move_to_end(key)
+        entry.last_used = time.time()
+        entry.hits += 1
+        self._hits += 1
+        return entry.model
+
+    def _evict_over_budget(self, keep):
+        evicted = []
+        total = sum(entry.size_bytes for entry in self._entries.values())
+        for key in list(self._entries):
+            if total <= self.budget_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self._entries.pop(key).size_bytes
+            self._evictions += 1
+            evicted.append(key)
+        return evicted
+
+    def evict(self, key):
+        with self._lock:
+            removed = self._entries.pop(key, None) is not None
+            if removed:
+                self._evictions += 1
+        if removed:
+            self._evicted([key])
+        return removed
+
+    def clear(self):
+        with self._lock:
+            keys = list(self._entries)
+            self._entries.clear()
+        self._evicted(keys)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Budget, resident size, counters and one row per resident model.
+        """
+        with self._lock:
+            models = [
+                {
+                    "name": key.name,
+                    "device": key.device,
+                    "compute_type": key.compute_type,
+                    "language": key.language,
+                    "size_mb": round(entry.size_bytes / (1024 * 1024), 1),
+                    "load_seconds": round(entry.load_seconds, 3),
+                    "loaded_at": entry.loaded_at,
+                    "last_used": entry.last_used,
+                    "hits": entry.hits,
+                }
+                for key, entry in self._entries.items()
+            ]
+            return {
+                "budget_mb": round(self.budget_bytes / (1024 * 1024), 1),
+                "resident_mb": round(sum(m["size_mb"] for m in models), 1),
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "load_seconds": round(self._load_seconds, 3),
+                "models": models,
+            }
+
+
+model_registry = ModelRegistry()
@@ -0,0 +1,198 @@
+import atexit
+import json
+import os
+import queue
+import select
+import subprocess
+import threading
+
+SPLEETER_POOL_SIZE = int(os.getenv("SPLEETER_POOL_SIZE", "1"))
+SPLEETER_QUEUE_SIZE = int(os.getenv("SPLEETER_QUEUE_SIZE", "16"))
+SPLEETER_QUEUE_TIMEOUT = float(os.getenv("SPLEETER_QUEUE_TIMEOUT", "600"))
+SPLEETER_STARTUP_TIMEOUT = float(os.getenv("SPLEETER_STARTUP_TIMEOUT", "300"))
+SPLEETER_REQUEST_TIMEOUT = float(os.getenv("SPLEETER_REQUEST_TIMEOUT", "600"))
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "spleeter_worker.py")
+
+
+class SeparatorWorker:
+    """
+    One resident spleeter process talking JSON lines over stdin/stdout.
+    The process is started immediately, readiness is awaited on first use.
+    """
+
+    def __init__(self, python_bin):
+        self.process = subprocess.Popen(
+            [python_bin, WORKER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+        )
+        self.ready = False
+
+    def _read_line(self, timeout):
+        readable, _, _ = select.select([self.process.stdout], [], [], timeout)
+        if not readable:
+            raise TimeoutError(f"Spleeter worker did not answer within {timeout:.0f}s")
+        line = self.process.stdout.readline()
+        if not line:
+            raise RuntimeError(f"Spleeter worker exited (code {self.process.poll()})")
+        return json.loads(line)
+
+    def _ensure_ready(self):
+        if not self.ready:
+            self._read_line(SPLEETER_STARTUP_TIMEOUT)
+            self.ready = True
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def separate(self, input_path, stems, output_dir):
+        self._ensure_ready()
+        request = {
+            "input_path": os.path.abspath(input_path),
+            "stems": str(stems),
+            "output_dir": os.path.abspath(output_dir),
+        }
+        self.process.stdin.write(json.dumps(request) + "\n")
+        self.process.stdin.flush()
+        response = self._read_line(SPLEETER_REQUEST_TIMEOUT)
+        if not response.get("ok"):
+            return False, response.get("error", "Unknown spleeter worker error")
+        return True, None
+
+    def close(self):
+        if self.process.poll() is None:
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=5)
+            except Exception:
+                self.process.kill()
+
+
+class SeparatorPool:
+    """
+    Fixed-size pool of resident spleeter workers with a bounded wait queue.
+    Each worker pays the TensorFlow import and model load once, not per song.
+
+    Every slot always goes back to the queue. A slot whose worker died or
+    could not be started holds None and is respawned by the next caller.
+    """
+
+    def __init__(self, python_bin, size=SPLEETER_POOL_SIZE, max_queue=SPLEETER_QUEUE_SIZE,
+                 queue_timeout=SPLEETER_QUEUE_TIMEOUT):
+        self.python_bin = python_bin
+        self.size = max(1, size)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._closed = False
+        for _ in range(self.size):
+            worker, _ = self._spawn()
+            self._idle.put(worker)
+
+    def _spawn(self):
+        """
+        Start a worker, the only place workers are created.
+
+        Returns:
+            tuple: (worker, error), worker is None when the process failed to start.
+        """
+        try:
+            return SeparatorWorker(self.python_bin), None
+        except Exception as e:
+            return None, f"Could not start spleeter worker: {e}"
+
+    def separate(self, input_path, stems, output_dir, timeout=None):
+        """
+        Run one separation on the next free worker.
+
+        Args:
+            input_path (str): Path to the audio file.
+            stems (str): Stem count ("2", "4" or "5").
+            output_dir (str): Directory for the spleeter output tree.
+            timeout (float | None): Seconds to wait for a free worker, defaults to
+                the pool's queue_timeout (None there waits without limit).
+
+        Returns:
+            tuple: (ok, error) where error is None on success.
+        """
+        with self._lock:
+            if self._closed:
+                return False, "Separator pool is shut down"
+            if self._waiting >= self.max_queue:
+                return False, "Separator queue is full"
+            self._waiting += 1
+
+        try:
+            worker = self._idle.get(timeout=self.queue_timeout if timeout is None else timeout)
+        except queue.Empty:
+            return False, "Timed out waiting for a separator worker"
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+        try:
+            if worker is None or not worker.alive():
+                if worker is not None:
+                    worker.close()
+                worker, error = self._spawn()
+                if worker is None:
+                    return False, error
+            try:
+                return worker.separate(input_path, stems, output_dir)
+            except Exception as e:
+                # The worker's state is unknown after a protocol failure, drop it
+                worker.close()
+                worker = None
+                return False, f"Spleeter worker failed: {e}"
+        finally:
+            if worker is not None and not worker.alive():
+                worker.close()
+                worker = None
+            self._idle.put(worker)
+
+    def stats(self):
+        with self._lock:
+            waiting = self._waiting
+        return {"size": self.size, "idle": self._idle.qsize(), "waiting": waiting}
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if worker is not None:
+                worker.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_separator_pool(python_bin):
+    """
+    Return the process-wide separator pool, starting its workers on first call.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SeparatorPool(python_bin)
+            atexit.register(_pool.shutdown)
+        return _pool
+
+
+def set_separator_pool(pool):
+    """
+    Use pool (anything with separate() and stats(), e.g. a proxy to a pool
+    shared by several processes) instead of starting workers in this process.
+    """
+    global _pool
+    with _pool_lock:
+        _pool = pool
@@ -1,14 +1,43 @@
 from difflib import SequenceMatcher
 import re
-from bs4 import BeautifulSoup, Tag
+from html.parser import HTMLParser
 import urllib.parse
 import requests
 import os
+import json
+import threading
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from app.services.lyrics_cache import lyrics_cache, LYRICS_CACHE_MAX_SONGS
+from app.services.title_index import TitleIndex
+from app.utils.logger import get_logger
 
 load_dotenv()
 
+log = get_logger("Lyrics")
+
 GENIUS_TOKEN = os.getenv("GENIUS_TOKEN")  
+# Point this at a local stub server to run without Genius
+GENIUS_API_URL = os.getenv("GENIUS_API_URL", "https://api.genius.com").rstrip("/")
+GENIUS_CONNECT_TIMEOUT = float(os.getenv("GENIUS_CONNECT_TIMEOUT", "3"))
+GENIUS_READ_TIMEOUT = float(os.getenv("GENIUS_READ_TIMEOUT", "10"))
+GENIUS_RETRIES = int(os.getenv("GENIUS_RETRIES", "2"))
+GENIUS_POOL_SIZE = int(os.getenv("GENIUS_POOL_SIZE", "8"))
+
+# JSON lines of known songs, see _load_catalog()
+TITLE_INDEX_CATALOG = os.getenv("TITLE_INDEX_CATALOG", "")
+# A local match is used without asking Genius only above this similarity and
+# when it beats the next title by TITLE_INDEX_MARGIN
+TITLE_INDEX_MIN_SIMILARITY = float(os.getenv("TITLE_INDEX_MIN_SIMILARITY", "0.9"))
+TITLE_INDEX_MARGIN = float(os.getenv("TITLE_INDEX_MARGIN", "0.05"))
+# Fields fetch_song_lyrics() needs from a search hit
+GENIUS_RESULT_KEYS = ("id", "url", "full_title", "artist_names", "song_art_image_url")
+
+_session = None
+_session_lock = threading.Lock()
+_title_index = None
+_title_index_lock = threading.Lock()
 
 STOP_WORDS = {'by', 'the', 'a', 'an', 'of', '-', '–', 'x', 'ft', 'feat', 'and', '&'}
 
@@ -33,52 +62,288 @@ def calculate_similarity(query, title):
     overall_similarity = SequenceMatcher(None, query_cleaned, title_cleaned).ratio()
     return max(query_match_ratio, overall_similarity)
 
-def fetch_lyrics_from_genius(query):
-    reduced_query = reduce_title(query)
-    cleaned_query = clean_text(reduced_query)
+def title_similarity(query, full_title):
+    """
+    Symmetric similarity of a query and a "<title> by <artist>" string, with
+    or without the artist part. Unlike calculate_similarity() a query that only
+    shares a word with the title ("glass") does not score 1.
+    """
+    query_cleaned = clean_text(query)
+    if not query_cleaned:
+        return 0
+    candidates = {clean_text(full_title), clean_text(full_title.rsplit(" by ", 1)[0])}
+    return max(SequenceMatcher(None, query_cleaned, candidate).ratio() for candidate in candidates)
+
+def _get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            # read=0: a read timeout already cost GENIUS_READ_TIMEOUT, retrying it
+            # inline would hold the request for several times that
+            adapter = HTTPAdapter(pool_maxsize=GENIUS_POOL_SIZE, max_retries=Retry(
+                total=GENIUS_RETRIES, read=0, backoff_factor=0.3,
+                status_forcelist=(502, 503, 504), allowed_methods=frozenset({"GET"}),
+            ))
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers["User-Agent"] = "music_player_backend"
+            _session = session
+        return _session
+
+def _get(url, **kwargs):
+    return _get_session().get(url, timeout=(GENIUS_CONNECT_TIMEOUT, GENIUS_READ_TIMEOUT), **kwargs)
+
+def normalize_query(query):
+    """
+    Cache key of a /lyrics query, the text that is sent to the Genius search.
+    """
+    return clean_text(reduce_title(query))
+
+def search_genius(cleaned_query):
+    """
+    Returns:
+        tuple: (hits, None) or (None, error message) when the search failed.
+    """
     encoded_query = urllib.parse.quote(cleaned_query)
-    search_url = f"https://api.genius.com/search?q={encoded_query}"
+    search_url = f"{GENIUS_API_URL}/search?q={encoded_query}"
     headers = {"Authorization": f"Bearer {GENIUS_TOKEN}"}
-    response = requests.get(search_url, headers=headers)
+    try:
+        response = _get(search_url, headers=headers)
+    except requests.RequestException as e:
+        log.warning("Genius search failed", error=str(e))
+        return None, "Failed to fetch lyrics (Genius unreachable)"
     if response.status_code != 200:
         return None, f"Failed to fetch lyrics (status {response.status_code})"
-    hits = response.json().get("response", {}).get("hits", [])
-    if not hits:
-        return None, "Lyrics not found"
-    result = hits[0]["result"]
-    song_url = result["url"]
-    title = result["full_title"]
-    artist = result["artist_names"]
-    song_art_image_url = result["song_art_image_url"]
-    similarity_ratio = calculate_similarity(cleaned_query, title)
-    if similarity_ratio < 0.7:
-        return None, "No matching song found"
-    # Scrape lyrics
-    page = requests.get(song_url)
-    soup = BeautifulSoup(page.text, "html.parser")
-    lyrics_elements = soup.find_all("div", attrs={"data-lyrics-container": "true"})
-    lyrics = []
-    for div in lyrics_elements:
-        if isinstance(div, Tag):
-            for content in div.contents:
-                if isinstance(content, str):
-                    lyrics.append(content.strip())
-                elif isinstance(content, Tag) and content.name == "br":
-                    lyrics.append("\n")
-                elif isinstance(content, Tag) and content.name == "a":
-                    a_text = content.get_text(separator="\n", strip=True)
-                    lyrics.append(a_text)
-                    lyrics.append("\n")
-    lyrics = " ".join(lyrics).strip()
-    filtered_lyrics = "\n".join([
-        line for line in lyrics.split("\n")
-        if not line.startswith("[") and line.strip()
-    ])
+    return response.json().get("response", {}).get("hits", []), None
+
+_CONTAINER_MARKER = 'data-lyrics-container="true"'
+_DIV_TAG_RE = re.compile(r"<div\b|</div\s*>", re.IGNORECASE)
+
+class _LyricsParser(HTMLParser):
+    """
+    Collects lyric lines from lyrics container fragments: <br> and container
+    ends break lines, [Section] headers and data-exclude-from-selection
+    blocks (ads, annotations UI) are dropped.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.lines = []
+        self._parts = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if self._skip_depth:
+            if tag == "div":
+                self._skip_depth += 1
+        elif tag == "br":
+            self.break_line()
+        elif tag == "div" and ("data-exclude-from-selection", "true") in attrs:
+            self._skip_depth = 1
+
+    def handle_endtag(self, tag):
+        if self._skip_depth and tag == "div":
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._parts.append(data)
+
+    def break_line(self):
+        line = " ".join("".join(self._parts).split())
+        self._parts.clear()
+        if line and not line.startswith("["):
+            self.lines.append(line)
+
+def _lyrics_fragments(html):
+    """
+    Yield the lyrics container <div>s of a page as slices, without parsing the
+    rest of it.
+    """
+    position = html.find(_CONTAINER_MARKER)
+    while position != -1:
+        start = html.rfind("<div", 0, position)
+        depth = 0
+        end = len(html)
+        for match in _DIV_TAG_RE.finditer(html, start):
+            depth += -1 if match.group().startswith("</") else 1
+            if depth == 0:
+                end = match.end()
+                break
+        yield html[start:end]
+        position = html.find(_CONTAINER_MARKER, end)
+
+def scrape_lyrics(html):
+    """
+    Lyrics text of a Genius song page, section headers ([Chorus], ...) removed.
+    """
+    parser = _LyricsParser()
+    for fragment in _lyrics_fragments(html):
+        parser.feed(fragment)
+        parser.break_line()
+    parser.close()
+    return "\n".join(parser.lines)
+
+def fetch_song_lyrics(result):
+    """
+    Lyrics payload of a Genius search hit, from the cache or by scraping its page.
+
+    Returns:
+        tuple: (payload, None) or (None, error message)
+    """
+    song_id = result["id"]
+    payload = lyrics_cache.get_song(song_id)
+    if payload is not None:
+        return payload, None
+    try:
+        page = _get(result["url"])
+    except requests.RequestException as e:
+        log.warning("Genius page failed", url=result["url"], error=str(e))
+        return None, "Failed to fetch lyrics (Genius unreachable)"
+    if page.status_code != 200:
+        return None, f"Failed to fetch lyrics (status {page.status_code})"
+    filtered_lyrics = scrape_lyrics(page.text)
     if not filtered_lyrics:
         return None, "Lyrics not found"
-    return {
+    payload = {
         'lyrics': filtered_lyrics,
-        'title': title,
-        'artist': artist,
-        'song_art_image_url': song_art_image_url
-    }, None
\ No newline at end of file
+        'title': result["full_title"],
+        'artist': result["artist_names"],
+        'song_art_image_url': result["song_art_image_url"]
+    }
+    lyrics_cache.put_song(song_id, payload)
+    return payload, None
+
+def _load_catalog(index, path):
+    """
+    Index a catalog file: JSON lines of Genius search hits
+    ({"id", "full_title", "artist_names", "url", "song_art_image_url"}) or
+    plain {"title", "artist"} entries.
+    """
+    added = 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            artist = item.get("artist_names") or item.get("artist") or ""
+            full_title = item.get("full_title")
+            if not full_title:
+                full_title = f"{item.get('title', '')} by {artist}" if artist else item.get("title", "")
+            # Enough to fetch the lyrics directly, no search needed
+            result = item if all(key in item for key in GENIUS_RESULT_KEYS) else None
+            index.add(full_title, artist, item.get("id"), result, pinned=True)
+            added += 1
+    return added
+
+def get_title_index():
+    """
+    Local title index, built on first use from TITLE_INDEX_CATALOG and the
+    songs already in the lyrics cache; Genius search hits are added as they come.
+    """
+    global _title_index
+    with _title_index_lock:
+        if _title_index is None:
+            # Catalog entries stay, songs learnt from Genius are bounded like the lyrics cache
+            index = TitleIndex(clean_text, title_similarity, max_entries=LYRICS_CACHE_MAX_SONGS)
+            if TITLE_INDEX_CATALOG:
+                try:
+                    _load_catalog(index, TITLE_INDEX_CATALOG)
+                except (OSError, ValueError) as e:
+                    log.error("Error loading title catalog", path=TITLE_INDEX_CATALOG, error=str(e))
+            for song_id, title, artist in lyrics_cache.iter_titles():
+                index.add(title, artist, song_id)
+            log.info("Title index ready", titles=len(index))
+            _title_index = index
+        return _title_index
+
+def reset_title_index():
+    """
+    Forget the title index, it is rebuilt from the catalog and the lyrics
+    cache on next use (e.g. after the cache was cleared).
+    """
+    global _title_index
+    with _title_index_lock:
+        _title_index = None
+
+def resolve_locally(cleaned_query):
+    """
+    Answer a query from the title index without searching Genius: from the
+    lyrics cache, or from the song page when only its search hit is known.
+
+    Returns:
+        tuple: (payload, song_id) or (None, None) when Genius must be searched.
+    """
+    _, entry = get_title_index().best_match(cleaned_query, TITLE_INDEX_MIN_SIMILARITY, TITLE_INDEX_MARGIN)
+    if entry is None or entry.song_id is None:
+        return None, None
+    payload = lyrics_cache.get_song(entry.song_id)
+    if payload is None and entry.result is not None:
+        payload, _ = fetch_song_lyrics(entry.result)
+    if payload is None:
+        return None, None
+    return payload, entry.song_id
+
+def fetch_lyrics_from_genius(query):
+    cleaned_query = normalize_query(query)
+
+    # Known query: no outbound request when the song is cached too
+    cached = lyrics_cache.get_query(cleaned_query)
+    if cached is not None:
+        song_id, error = cached
+        if song_id is None:
+            return None, error
+        payload = lyrics_cache.get_song(song_id)
+        if payload is not None:
+            return payload, None
+
+    # New spelling of a known song
+    payload, song_id = resolve_locally(cleaned_query)
+    if payload is not None:
+        lyrics_cache.put_query(cleaned_query, song_id)
+        return payload, None
+
+    hits, error = search_genius(cleaned_query)
+    if error:
+        return None, error
+    if not hits:
+        lyrics_cache.put_query(cleaned_query, None, "Lyrics not found")
+        return None, "Lyrics not found"
+
+    # Best scoring hit rather than Genius' first one. On a tie the title closest
+    # to the query wins ("castle of glass" over "Castle of Glass (Remix)"),
+    # then Genius' order
+    index = get_title_index()
+    best_key, result = (0, 0), None
+    for hit in hits:
+        hit_result = hit["result"]
+        index.add(hit_result["full_title"], hit_result.get("artist_names", ""), hit_result["id"], hit_result)
+        key = (
+            calculate_similarity(cleaned_query, hit_result["full_title"]),
+            SequenceMatcher(None, cleaned_query, clean_text(hit_result.get("title", ""))).ratio(),
+        )
+        if key > best_key:
+            best_key, result = key, hit_result
+    best_ratio = best_key[0]
+    if best_ratio < 0.7:
+        lyrics_cache.put_query(cleaned_query, None, "No matching song found")
+        return None, "No matching song found"
+
+    payload, error = fetch_song_lyrics(result)
+    if error:
+        return None, error
+    lyrics_cache.put_query(cleaned_query, result["id"])
+    return payload, None
+
+def search_titles(query, limit=10):
+    """
+    Ranked local title matches of a query.
+
+    Returns:
+        list: [{"id", "full_title", "artist", "similarity"}]
+    """
+    return [
+        dict(entry.to_dict(), similarity=round(similarity, 3))
+        for similarity, entry in get_title_index().search(normalize_query(query), limit=limit)
+    ]
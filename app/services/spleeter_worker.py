@@ -0,0 +1,70 @@
+"""
+Resident Spleeter worker.
+
+Run with the env2 interpreter (the one that has spleeter/TensorFlow installed):
+
+    env2/bin/python app/services/spleeter_worker.py
+
+This file must not import anything from the Flask app, env2 only has spleeter.
+
+Protocol (one JSON object per line):
+    stdout on start-up:  {"ready": true}
+    stdin request:       {"input_path": "...", "stems": "2", "output_dir": "..."}
+    stdout response:     {"ok": true} or {"ok": false, "error": "..."}
+
+Output files follow the spleeter CLI layout: <output_dir>/<input basename>/<stem>.wav
+"""
+import json
+import os
+import sys
+
+SAMPLE_RATE = 44100
+
+
+def main():
+    # Keep a private handle on the real stdout for the protocol, then point fd 1
+    # at stderr so spleeter/TensorFlow logging cannot corrupt the response stream
+    protocol_out = os.fdopen(os.dup(sys.stdout.fileno()), "w", buffering=1)
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    import numpy as np
+    from spleeter.separator import Separator
+
+    separators = {}
+
+    def get_separator(stems):
+        if stems not in separators:
+            separator = Separator(f"spleeter:{stems}stems", multiprocess=False)
+            # Run one second of silence through the model so the graph is built
+            # and the weights are loaded now rather than on the first song
+            separator.separate(np.zeros((SAMPLE_RATE, 2), dtype=np.float32))
+            separators[stems] = separator
+        return separators[stems]
+
+    preload = [s.strip() for s in os.getenv("SPLEETER_PRELOAD", "2").split(",") if s.strip()]
+    for stems in preload:
+        get_separator(stems)
+
+    protocol_out.write(json.dumps({"ready": True}) + "\n")
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+            stems = str(request["stems"])
+            if stems not in {"2", "4", "5"}:
+                raise ValueError(f"Unsupported stem count: {stems}")
+            get_separator(stems).separate_to_file(
+                request["input_path"],
+                request["output_dir"],
+                synchronous=True,
+            )
+            response = {"ok": True}
+        except Exception as e:
+            response = {"ok": False, "error": str(e)}
+        protocol_out.write(json.dumps(response) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import json
+import os
+import secrets
+import shutil
+import threading
+
+from app.utils.decoded_audio import as_decoded
+from app.utils.logger import get_logger
+
+log = get_logger("Stems")
+
+STEM_CACHE_DIR = os.getenv("STEM_CACHE_DIR", "./cache/stems")
+STEM_CACHE_MAX_BYTES = int(os.getenv("STEM_CACHE_MAX_MB", "2048")) * 1024 * 1024
+
+MANIFEST_NAME = "manifest.json"
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+
+def audio_content_hash(source):
+    """
+    Hash the decoded PCM of an audio file, so re-encoded or renamed uploads of
+    the same track share one cache entry.
+
+    Args:
+        source (str | DecodedAudio): Path to the audio file, or its decoded audio.
+
+    Returns:
+        str: Hex digest of the decoded samples and sample rate.
+    """
+    return as_decoded(source).content_hash()
+
+
+def _entry_dir(audio_hash, stems):
+    return os.path.join(STEM_CACHE_DIR, f"{audio_hash}_{stems}stems")
+
+
+def lookup(audio_hash, stems, output_dir):
+    """
+    Copy cached stems for (audio_hash, stems) into output_dir.
+
+    Args:
+        audio_hash (str): Result of audio_content_hash().
+        stems (str): Stem count ("2", "4" or "5").
+        output_dir (str): Directory the caller owns and will clean up.
+
+    Returns:
+        dict | None: {"vocals": "path/to/vocals.mp3", ...} or None on a miss.
+    """
+    entry_dir = _entry_dir(audio_hash, stems)
+    manifest_path = os.path.join(entry_dir, MANIFEST_NAME)
+
+    with _lock:
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            # Bump the access time used for LRU ordering
+            os.utime(manifest_path, None)
+        except (OSError, ValueError):
+            _stats["misses"] += 1
+            return None
+
+    os.makedirs(output_dir, exist_ok=True)
+    result_dict = {}
+    try:
+        for stem, file_name in manifest.items():
+            random_id = secrets.token_hex(4)
+            target_path = os.path.join(output_dir, f"{stem}_{random_id}.mp3")
+            shutil.copyfile(os.path.join(entry_dir, file_name), target_path)
+            result_dict[stem] = target_path
+    except OSError:
+        # Entry was evicted or damaged while copying, recompute instead
+        with _lock:
+            _stats["misses"] += 1
+        return None
+
+    with _lock:
+        _stats["hits"] += 1
+    return result_dict
+
+
+def store(audio_hash, stems, result_dict):
+    """
+    Save separated stems into the cache and evict old entries if over budget.
+
+    Args:
+        audio_hash (str): Result of audio_content_hash().
+        stems (str): Stem count ("2", "4" or "5").
+        result_dict (dict): Output of spleeter_separate().
+    """
+    entry_dir = _entry_dir(audio_hash, stems)
+    tmp_dir = f"{entry_dir}.tmp-{secrets.token_hex(4)}"
+
+    try:
+        os.makedirs(tmp_dir, exist_ok=True)
+        manifest = {}
+        for stem, file_path in result_dict.items():
+            if not file_path or not os.path.exists(file_path):
+                continue
+            file_name = f"{stem}.mp3"
+            shutil.copyfile(file_path, os.path.join(tmp_dir, file_name))
+            manifest[stem] = file_name
+
+        with open(os.path.join(tmp_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+
+        with _lock:
+            if os.path.exists(entry_dir):
+                # Another request already stored the same track
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                return
+            os.rename(tmp_dir, entry_dir)
+            _stats["stores"] += 1
+            _evict_locked()
+    except OSError as e:
+        log.error("Error storing stems in cache", error=str(e))
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            try:
+                total += os.path.getsize(os.path.join(root, file))
+            except OSError:
+                pass
+    return total
+
+
+def _list_entries():
+    entries = []
+    if not os.path.isdir(STEM_CACHE_DIR):
+        return entries
+    for name in os.listdir(STEM_CACHE_DIR):
+        entry_dir = os.path.join(STEM_CACHE_DIR, name)
+        manifest_path = os.path.join(entry_dir, MANIFEST_NAME)
+        if ".tmp-" in name or not os.path.exists(manifest_path):
+            continue
+        entries.append((os.path.getmtime(manifest_path), _dir_size(entry_dir), entry_dir))
+    return entries
+
+
+def _evict_locked():
+    entries = _list_entries()
+    total = sum(size for _, size, _ in entries)
+    # Least recently used first
+    for _, size, entry_dir in sorted(entries):
+        if total <= STEM_CACHE_MAX_BYTES:
+            break
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        total -= size
+        _stats["evictions"] += 1
+
+
+def cache_stats():
+    """
+    Returns:
+        dict: Hit/miss/store/eviction counters plus current entry count and size.
+    """
+    with _lock:
+        entries = _list_entries()
+        stats = dict(_stats)
+    stats["entries"] = len(entries)
+    stats["bytes"] = sum(size for _, size, _ in entries)
+    stats["max_bytes"] = STEM_CACHE_MAX_BYTES
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
+
+
+def clear():
+    """
+    Remove every cached entry and reset the counters.
+    """
+    with _lock:
+        shutil.rmtree(STEM_CACHE_DIR, ignore_errors=True)
+        for key in _stats:
+            _stats[key] = 0
@@ -3,55 +3,84 @@ import tempfile
 import subprocess
 import numpy as np
 from pydub import AudioSegment
-import requests
-import whisperx
-import torch
 import gc
 import tempfile
 import os
-from aeneas.executetask import ExecuteTask
-from aeneas.task import Task
 from werkzeug.datastructures import FileStorage
 import re
 import json
 import unidecode
-from dataclasses import dataclass
-from typing import List, Tuple
+from typing import List, Optional, Tuple
+from app.services.model_registry import ModelKey, model_registry
+from app.services.whisperx_batcher import transcribe_batched
+from app.services.gentle_client import get_gentle_client
+from app.services.mfa_runtime import get_mfa_runtime
+from app.services.lrc_parser import parse_lrc
+from app.services.timestamp_drift import fit_drift
+from app.services.lyric_timing import TimestampLyric, coerce_timestamp_lyrics, timestamps_array, with_timestamps
+from app.utils.logger import get_logger
+
+log = get_logger("Align")
+
+# torch / whisperx / aeneas are imported on first use, importing this module
+# (and so create_app()) must stay cheap.
+
+# Model được load ở lần gọi đầu tiên, model_registry giữ mỗi model một lần
+WHISPERX_MODEL_NAME = os.getenv("WHISPERX_MODEL_NAME", "tiny")
+WHISPERX_DEVICE = "cuda"
+WHISPERX_COMPUTE_TYPE = os.getenv("WHISPERX_COMPUTE_TYPE", "int8")
 
+def _resolve_device():
+    """
+    Import torch on first use and pick the whisperx device.
+    """
+    global WHISPERX_DEVICE
+    import torch
 
-torch.backends.cuda.matmul.allow_tf32 = True
-torch.backends.cudnn.allow_tf32 = True
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.backends.cudnn.allow_tf32 = True
+    WHISPERX_DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+    return WHISPERX_DEVICE
 
-# Load model sẵn khi import file (chỉ load 1 lần)
-WHISPERX_MODEL = None
-WHISPERX_ALIGN_MODEL = {}
-WHISPERX_MODEL_NAME = "tiny"
-WHISPERX_DEVICE = "cuda"
-WHISPERX_COMPUTE_TYPE = "int8"
+def whisperx_model_key(language=None):
+    """
+    Registry key of the WhisperX model for a language.
+    """
+    return ModelKey(WHISPERX_MODEL_NAME, _resolve_device(), WHISPERX_COMPUTE_TYPE, language)
 
 def get_whisperx_model(language=None):
-    global WHISPERX_MODEL
-    global WHISPERX_DEVICE 
+    """
+    WhisperX model for a language (None lets whisperx detect it), loaded once
+    per (model, device, compute type, language).
+    """
+    key = whisperx_model_key(language)
+    device = key.device
 
-    if torch.cuda.is_available():
-        WHISPERX_DEVICE = "cuda"
-    else:
-        WHISPERX_DEVICE = "cpu"
+    def load():
+        import whisperx
 
-    if WHISPERX_MODEL is None:
-        WHISPERX_MODEL = whisperx.load_model(
+        return whisperx.load_model(
             WHISPERX_MODEL_NAME,
-            WHISPERX_DEVICE,
+            device,
             compute_type=WHISPERX_COMPUTE_TYPE,
             language=language
         )
-    return WHISPERX_MODEL
+
+    return model_registry.get(key, load)
 
 def get_whisperx_align_model(language):
-    global WHISPERX_ALIGN_MODEL
-    if language not in WHISPERX_ALIGN_MODEL:
-        WHISPERX_ALIGN_MODEL[language] = whisperx.load_align_model(language_code=language, device=WHISPERX_DEVICE)
-    return WHISPERX_ALIGN_MODEL[language]
+    """
+    Returns: (align model, metadata) for a language.
+    """
+    device = _resolve_device()
+    key = ModelKey("whisperx-align", device, "default", language)
+
+    def load():
+        import whisperx
+
+        return whisperx.load_align_model(language_code=language, device=device)
+
+    return model_registry.get(key, load)
 
 def force_align_lyrics_with_mfa(lyrics: str, audio_file, acoustic_model_path, dictionary_path, mfa_bin="mfa", output_dir=None):
     """
@@ -61,8 +90,11 @@ def force_align_lyrics_with_mfa(lyrics: str, audio_file, acoustic_model_path, di
     - acoustic_model_path: path to MFA acoustic model (.zip)
     - dictionary_path: path to MFA dictionary (.dict)
     - mfa_bin: 'mfa' command or path to MFA binary
-    - output_dir: optional, where to save TextGrid result
+    - output_dir: optional, where to save TextGrid result (default: a new temp dir owned by the caller)
     Returns: path to TextGrid file or error message
+
+    Requests are queued on a shared MFA runtime that keeps its model cache warm
+    and aligns concurrent requests in one `mfa align` run.
     """
     # Tạo thư mục tạm cho dữ liệu
     with tempfile.TemporaryDirectory() as tmpdir:
@@ -71,124 +103,51 @@ def force_align_lyrics_with_mfa(lyrics: str, audio_file, acoustic_model_path, di
         input_path = os.path.join(tmpdir, "input" + original_ext)
         audio_file.save(input_path)
 
-        # Nếu là mp3 thì convert sang wav
-        if original_ext == ".mp3":
+        # MFA chỉ đọc wav, convert các định dạng khác sang wav
+        if original_ext != ".wav":
             audio = AudioSegment.from_file(input_path)
             audio_path = os.path.join(tmpdir, "audio.wav")
             audio.export(audio_path, format="wav")
         else:
             audio_path = input_path
 
-        # Lưu transcript (lab file)
-        lab_path = os.path.join(tmpdir, "audio.lab")
-        with open(lab_path, "w", encoding="utf-8") as f:
-            f.write(lyrics)
-
         # Tạo thư mục output
-        align_output = output_dir or os.path.join(tmpdir, "aligned")
+        align_output = output_dir or tempfile.mkdtemp(prefix="mfa-")
         os.makedirs(align_output, exist_ok=True)
-
-        # Gọi MFA align
-        cmd = [
-            mfa_bin, "align",
-            tmpdir,
-            dictionary_path,
-            acoustic_model_path,
-            align_output,
-            "--clean"
-        ]
-        try:
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        except subprocess.CalledProcessError as e:
-            return None, f"MFA align failed: {e.stderr}"
-
-        # Kết quả là file TextGrid
         textgrid_path = os.path.join(align_output, "audio.TextGrid")
-        if not os.path.exists(textgrid_path):
-            return None, "TextGrid not found after alignment"
-        return textgrid_path, None
+
+        runtime = get_mfa_runtime(acoustic_model_path, dictionary_path, mfa_bin)
+        return runtime.align(lyrics, audio_path, textgrid_path)
     
 
-def force_align_lyrics_with_gentle(lyrics: str, audio_file, gentle_server_url="http://localhost:8765/transcriptions"):
+def force_align_lyrics_with_gentle(lyrics: str, audio_file, gentle_server_url=None):
     """
     Force align lyrics with audio using Gentle HTTP server.
     - lyrics: string, lyrics to align
     - audio_file: Werkzeug FileStorage (from Flask request.files['audio_file'])
-    - gentle_server_url: URL of the Gentle server (default: http://localhost:8765/transcriptions)
+    - gentle_server_url: URL of one Gentle server, default: the pooled GENTLE_URLS instances
     Returns: alignment JSON (dict) or error message
     """
-
-    with tempfile.TemporaryDirectory() as tmpdir:
-        original_ext = os.path.splitext(audio_file.filename)[-1].lower()
-        input_path = os.path.join(tmpdir, "input" + original_ext)
-        audio_file.save(input_path)
-
-        audio_path = None  # Ensure audio_path is always defined
-
-        # Convert mp3 to wav if needed
-        if original_ext == ".mp3":
-            audio = AudioSegment.from_file(input_path)
-            audio_path = os.path.join(tmpdir, "audio.wav")
-            audio.export(audio_path, format="wav")
-            audio_to_send = open(audio_path, "rb")
-            audio_filename = "audio.wav"
-            audio_mimetype = "audio/wav"
-        else:
-            audio_to_send = open(input_path, "rb")
-            audio_filename = audio_file.filename
-            audio_mimetype = audio_file.mimetype or "audio/wav"
-
-        # Save lyrics to a temp file (Gentle expects a file for transcript)
-        transcript_path = os.path.join(tmpdir, "transcript.txt")
-        with open(transcript_path, "w", encoding="utf-8") as f:
-            f.write(lyrics)
-        transcript_to_send = open(transcript_path, "rb")
-
-        files = {
-            'audio': (audio_filename, audio_to_send, audio_mimetype),
-            'transcript': ('transcript.txt', transcript_to_send, 'text/plain')
-        }
-
-        response = None
-        try:
-            response = requests.post(
-                gentle_server_url,
-                files=files,
-                params={'async': 'false'}
-            )
-            response.raise_for_status()
-            return response.json(), None
-        except Exception as e:
-            # In response text để debug nếu lỗi JSON
-            try:
-                err_text = response.text if response is not None else ''
-            except Exception:
-                err_text = ''
-            return None, f"Gentle server align failed: {str(e)} | Response: {err_text[:200]}"
-        finally:
-            audio_to_send.close()
-            transcript_to_send.close()
-            try:
-                if original_ext == ".mp3" and audio_path is not None and os.path.exists(audio_path):
-                    os.remove(audio_path)
-                if os.path.exists(input_path):
-                    os.remove(input_path)
-                if os.path.exists(transcript_path):
-                    os.remove(transcript_path)
-            except Exception:
-                pass
+    # Gentle decodes mp3 itself (ffmpeg), so the upload is sent as is from memory
+    audio = audio_file.read()
+    client = get_gentle_client([gentle_server_url] if gentle_server_url else None)
+    return client.align(
+        audio,
+        lyrics,
+        filename=os.path.basename(audio_file.filename or "") or "audio.wav",
+        mimetype=audio_file.mimetype or "audio/wav",
+    )
 
 def force_align_lyrics_with_whisperx(
     audio_file,
     language="en",
-    device=WHISPERX_DEVICE,
+    device=None,
     batch_size=16,
 ):
     """
     Force align audio using WhisperX (không diarization), cho phép định nghĩa ngôn ngữ.
     """
-    import os
-    import tempfile
+    import whisperx
 
     with tempfile.TemporaryDirectory() as tmpdir:
         original_ext = os.path.splitext(audio_file.filename)[-1].lower()
@@ -198,8 +157,13 @@ def force_align_lyrics_with_whisperx(
         try:
             # 1. Dùng model đã load sẵn (có truyền language)
             model = get_whisperx_model(language=language)
+            # Resolved after loading, the model picks cuda or cpu
+            device = device or WHISPERX_DEVICE
             audio = whisperx.load_audio(input_path)
-            result = model.transcribe(audio, batch_size=batch_size, language=language)
+            # Segments are batched with other in-flight requests on the same model
+            result = transcribe_batched(
+                model, audio, language=language, model_key=whisperx_model_key(language), batch_size=batch_size
+            )
             segments = result["segments"]
 
             # 2. Dùng align model đã load sẵn
@@ -227,7 +191,9 @@ def force_align_lyrics_with_aeneas(
     - output_format: "json" or "txt" or "csv" or "smil" or "textgrid"
     Returns: alignment result (dict or str) or error message
     """
-    
+    from aeneas.executetask import ExecuteTask
+    from aeneas.task import Task
+
     with tempfile.TemporaryDirectory() as tmpdir:
         # Save audio file
         original_ext = os.path.splitext(audio_file.filename)[-1].lower()
@@ -373,11 +339,9 @@ def normalize_title(title):
     title = title.lower().replace(" ", "_")
     return title
 
-def extract_title(lrc_text):
-    ti_match = re.search(r"\[ti:\s*(.+?)\s*\]", lrc_text, re.IGNORECASE)
-    ar_match = re.search(r"\[ar:\s*(.+?)\s*\]", lrc_text, re.IGNORECASE)
-    title = normalize_title(ti_match.group(1)) if ti_match else ""
-    artist = normalize_title(ar_match.group(1)) if ar_match else ""
+def title_from_metadata(metadata):
+    title = normalize_title(metadata.get("ti", "")) if metadata.get("ti") else ""
+    artist = normalize_title(metadata.get("ar", "")) if metadata.get("ar") else ""
     if title and artist:
         return f"{title}_{artist}"
     elif title:
@@ -387,6 +351,9 @@ def extract_title(lrc_text):
     else:
         return "lyrics"
 
+def extract_title(lrc_text):
+    return title_from_metadata(parse_lrc(lrc_text).metadata)
+
 def clean_lrc_metadata(lrc_text):
     """
     Loại bỏ các dòng metadata khỏi nội dung .lrc
@@ -398,51 +365,26 @@ def clean_lrc_metadata(lrc_text):
             cleaned.append(line)
     return "\n".join(cleaned)
 
-def lrc_to_json(lrc_text, output_path):
+def lrc_to_json(lrc_text, output_path=None):
     """
-    Chuyển lyrics dạng LRC sang JSON [{start, end, line}]
+    Chuyển lyrics dạng LRC sang JSON [{start, end, line}], ghi ra output_path nếu có
     """
-    
-    file_name = extract_title(lrc_text) + ".json"
-    lrc_text = clean_lrc_metadata(lrc_text)
+    document = parse_lrc(lrc_text)
+    result = document.to_entries()
 
-    # print(lrc_text)
-
-    pattern = re.compile(r"\[(\d+):(\d+\.\d+)\](.*)")
-    
-    entries = []
-
-    for line in lrc_text.splitlines():
-        match = pattern.match(line.strip())
-
-        print(match)
-
-        if match:
-            m, s, lyric = match.groups()
-            start = int(m) * 60 + float(s)
-            entries.append({
-                "start": round(start, 2),
-                "line": lyric.strip()
-            })
-
-    # Tính end cho từng dòng (dòng cuối end = start)
-    for i in range(len(entries)):
-        if i < len(entries) - 1:
-            entries[i]["end"] = entries[i+1]["start"]
-        else:
-            entries[i]["end"] = entries[i]["start"]
-
-    # Đưa trường end lên đúng thứ tự
-    result = [{"start": e["start"], "end": e["end"], "line": e["line"]} for e in entries]
-
-    output_path = os.path.join(output_path, file_name)
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(result, f, ensure_ascii=False, indent=2)
-
-    # print(result)
+    if output_path:
+        file_name = title_from_metadata(document.metadata) + ".json"
+        with open(os.path.join(output_path, file_name), "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
 
     return result
 
+def parse_lrc_entries(lrc_text):
+    """
+    Chuyển lyrics dạng LRC sang list [{start, end, line}] (không ghi file)
+    """
+    return parse_lrc(lrc_text).to_entries()
+
 # json_result = lrc_to_json(lrc_text, ouput_path)
 # print(json.dumps(json_result, ensure_ascii=False, indent=2))
 
@@ -453,62 +395,77 @@ def lrc_to_json(lrc_text, output_path):
         + allow_distance (khoảng chênh lệch cho phép)
  '''
 
-@dataclass
-class TimestampLyric:
-    timestamp: str
-    lyric: str
+# Below this many matched lines the global fit is not trusted
+ALIGN_GLOBAL_MIN_INLIERS = 3
+
+def align_timestamps_globally(
+    word_segments: List[Tuple[float, float]],
+    timestamp_lyrics: List[TimestampLyric]
+) -> Optional[List[TimestampLyric]]:
+    """
+    Align every line with the voiced onsets of the whole track (see fit_drift).
+
+    Returns:
+        list | None: Adjusted lines with a per-line confidence, or None when
+            too few lines match an onset to trust the fit.
+    """
+    line_starts = timestamps_array(timestamp_lyrics)
+    # Lines may come unsorted, the fit expects them in time order
+    order = np.argsort(line_starts, kind="stable")
+    fit = fit_drift(line_starts[order], [start for start, _ in word_segments])
+    if fit is None or fit.inliers < min(ALIGN_GLOBAL_MIN_INLIERS, len(timestamp_lyrics)):
+        return None
+    log.debug("Global fit", **fit.summary())
+
+    starts = np.empty_like(fit.starts)
+    starts[order] = fit.starts
+    confidence = np.empty_like(fit.confidence)
+    confidence[order] = fit.confidence
+    return with_timestamps(timestamp_lyrics, starts, confidence)
 
 def align_timestamps_with_amplitude(
     first_word_segment: Tuple[float, float], 
     timestamp_lyrics: List[TimestampLyric],  
-    allow_difference: float 
+    allow_difference: float,
+    word_segments: Optional[List[Tuple[float, float]]] = None,
+    mode: str = "first"
 ) -> List[TimestampLyric]:
     """
     Align the first timestamp of lyrics with the first detected word segment.
+
+    mode="first" shifts every line by the first line / first word difference.
+    With mode="global" and word_segments (detect_words() output) every line is
+    matched against the whole track instead, which also corrects drift after
+    the first verse; it falls back to the first-line shift when the fit fails.
+
+    timestamp_lyrics may also be client dicts ({"timestamp", "lyric"}), see
+    coerce_timestamp_lyrics(). Returned timestamps are seconds.
     """
     try:
-        adjusted_timestamps: List[TimestampLyric] = []
+        timestamp_lyrics = coerce_timestamp_lyrics(timestamp_lyrics)
 
         if not timestamp_lyrics or not first_word_segment:
-            print("[Debug] No timestamp_lyrics or first_word_segment provided.")
-            return [TimestampLyric(timestamp=tl.timestamp, lyric=tl.lyric) for tl in timestamp_lyrics]
-
-        # Extract the first timestamp and lyric
-        first_timestamp = timestamp_lyrics[0].timestamp
-        first_lyric = timestamp_lyrics[0].lyric
-        print(f"[Debug] First timestamp: {first_timestamp}, First lyric: {first_lyric}")
+            log.debug("No timestamp_lyrics or first_word_segment provided")
+            return with_timestamps(timestamp_lyrics, timestamps_array(timestamp_lyrics))
 
-        # Convert timestamp to seconds
-        timestamp_seconds = float(first_timestamp.split(':')[0]) * 60 + float(first_timestamp.split(':')[1])
-        print(f"[Debug] First timestamp in seconds: {timestamp_seconds}")
+        if mode == "global" and word_segments:
+            globally_adjusted = align_timestamps_globally(word_segments, timestamp_lyrics)
+            if globally_adjusted is not None:
+                return globally_adjusted
+            log.debug("Global fit failed, shifting by the first word")
 
-        # Extract the start time of the first detected word
+        starts = timestamps_array(timestamp_lyrics)
         first_word_start = first_word_segment[0]
-        print(f"[Debug] First word start: {first_word_start}")
-
-        # Calculate the difference
-        difference = first_word_start - timestamp_seconds
-        # print(f"[Debug] Difference: {difference}")
+        difference = first_word_start - starts[0]
 
         if abs(difference) <= allow_difference:
-            print("[Debug] Difference is within allowable range.")
-            adjusted_timestamps.append(TimestampLyric(timestamp=f"{timestamp_seconds:.2f}", lyric=first_lyric))
-            adjusted_timestamps.extend(
-                [TimestampLyric(timestamp=f"{float(tl.timestamp.split(':')[0]) * 60 + float(tl.timestamp.split(':')[1]):.2f}", lyric=tl.lyric) for tl in timestamp_lyrics[1:]]
-            )
+            log.debug("Difference is within allowable range", difference=round(difference, 3))
         else:
-            print("[Debug] Adjusting all timestamps based on the detected word start time.")
-            adjusted_timestamps.append(TimestampLyric(timestamp=f"{first_word_start:.2f}", lyric=first_lyric))
-            for tl in timestamp_lyrics[1:]:
-                original_seconds = float(tl.timestamp.split(':')[0]) * 60 + float(tl.timestamp.split(':')[1])
-                adjusted_seconds = original_seconds + difference
-                print(f"[Debug] Original seconds: {original_seconds}, Adjusted seconds: {adjusted_seconds}, Lyric: {tl.lyric}")
-                adjusted_timestamps.append(TimestampLyric(timestamp=f"{adjusted_seconds:.2f}", lyric=tl.lyric))
-
-        print(f"[Debug] Adjusted timestamps: {adjusted_timestamps}")
-
-        return adjusted_timestamps
+            log.debug("Shifting all timestamps to the detected word start",
+                      first_word_start=round(first_word_start, 3), difference=round(difference, 3))
+            starts += difference
+        return with_timestamps(timestamp_lyrics, starts)
 
     except Exception as e:
-        print(f"[Error] Failed to align timestamps: {str(e)}")
-        return []
\ No newline at end of file
+        log.error("Failed to align timestamps", error=str(e))
+        return []
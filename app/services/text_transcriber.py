@@ -1,12 +1,14 @@
-from vosk import Model, KaldiRecognizer
 import wave
 import json
 import tempfile
 from pydub import AudioSegment
 import os
-import openai
+
+# vosk / openai are imported inside the functions that use them, so loading
+# this module at app startup stays cheap.
 
 # Tải model một lần khi khởi động server
+# from vosk import Model, KaldiRecognizer
 # vosk_model = Model("vosk-model-en-us-0.22")
 
 # def transcribe_audio_with_vosk(audio_file):
@@ -52,6 +54,8 @@ def transcribe_audio_with_openai(audio_file, api_key):
     - audio_file: Flask FileStorage
     - api_key: OpenAI API key string
     """
+    import openai
+
     openai.api_key = api_key
 
     # Lưu file tạm
@@ -0,0 +1,180 @@
+import os
+from dataclasses import dataclass
+
+import numpy as np
+
+# A line start within this many seconds of a voiced onset counts as a match
+DRIFT_MATCH_TOLERANCE = float(os.getenv("DRIFT_MATCH_TOLERANCE", "0.35"))
+# Tempo mismatch searched around 1.0 (0.05 = +/-5%), in DRIFT_SCALE_STEPS steps
+DRIFT_MAX_SCALE_DEVIATION = float(os.getenv("DRIFT_MAX_SCALE_DEVIATION", "0.05"))
+DRIFT_SCALE_STEPS = 41
+# Largest constant shift searched (intro edits, silence added before the song)
+DRIFT_MAX_OFFSET_SECONDS = float(os.getenv("DRIFT_MAX_OFFSET_SECONDS", "30"))
+# Refit rounds, each one keeps only the lines close to the previous fit
+DRIFT_REFIT_ROUNDS = 3
+# Smallest gap kept between two corrected line starts, so starts stay strictly increasing
+DRIFT_MIN_LINE_GAP = 0.01
+
+
+@dataclass
+class DriftFit:
+    """
+    audio_time = scale * lrc_time + offset, plus the per-line result.
+
+    starts are the corrected line starts: the matched onset when a line has one
+    within tolerance of the fit, the fitted time otherwise. confidence is in
+    [0, 1], 0 for lines without a matching onset.
+    """
+    offset: float
+    scale: float
+    inliers: int
+    starts: np.ndarray
+    confidence: np.ndarray
+
+    def summary(self):
+        return {
+            "offset": round(self.offset, 3),
+            "scale": round(self.scale, 5),
+            "inliers": self.inliers,
+            "lines": len(self.starts),
+        }
+
+
+def _nearest(onsets, times):
+    """
+    Index of and distance to the nearest onset for every time (onsets sorted).
+    """
+    right = np.clip(np.searchsorted(onsets, times), 1, len(onsets) - 1)
+    left = right - 1
+    use_left = np.abs(times - onsets[left]) <= np.abs(onsets[right] - times)
+    index = np.where(use_left, left, right)
+    return index, onsets[index] - times
+
+
+def _pairs(line_starts, onsets, max_offset, max_deviation):
+    """
+    (line index, onset index) of every onset that could match a line, i.e. within
+    max_offset of it at any scale searched. Sorted by line, then by onset.
+    """
+    reach = max_offset + max_deviation * line_starts
+    lo = np.searchsorted(onsets, line_starts - reach, side="left")
+    hi = np.searchsorted(onsets, line_starts + reach, side="right")
+    counts = hi - lo
+    line_ids = np.repeat(np.arange(len(line_starts)), counts)
+    # Position inside each line's run, added to that line's first onset
+    run_start = np.repeat(np.cumsum(counts) - counts, counts)
+    onset_ids = np.repeat(lo, counts) + np.arange(counts.sum()) - run_start
+    return line_ids, onset_ids
+
+
+def _vote(line_starts, onsets, tolerance, max_offset, max_deviation, steps):
+    """
+    Hough-style search: every (line, onset) pair votes for the offset that
+    would put the line on the onset, for each candidate scale. The (scale,
+    offset) with most votes wins, ties go to the scale closest to 1.
+    """
+    line_ids, onset_ids = _pairs(line_starts, onsets, max_offset, max_deviation)
+    if len(line_ids) == 0:
+        return 1.0, 0.0, 0
+    pair_lines = line_starts[line_ids]
+    pair_onsets = onsets[onset_ids]
+    new_line = np.ones(len(line_ids), dtype=bool)
+    new_line[1:] = line_ids[1:] != line_ids[:-1]
+
+    scales = 1.0 + np.linspace(-max_deviation, max_deviation, steps)
+    # Closest to 1.0 first so a strict > keeps it on ties
+    scales = scales[np.argsort(np.abs(scales - 1.0), kind="stable")]
+
+    best_votes, best_scale, best_offset = 0, 1.0, 0.0
+    # Smallest offset of any pair at any scale, so bins are never negative
+    low = float((pair_onsets - scales.max() * pair_lines).min())
+    for scale in scales:
+        offsets = pair_onsets - scale * pair_lines
+        bins = ((offsets - low) * (1.0 / tolerance)).astype(np.int32)
+        # A line votes once per bin even when several onsets fall in it
+        # (offsets increase along a line's run, so duplicates are neighbours)
+        first = new_line.copy()
+        first[1:] |= bins[1:] != bins[:-1]
+        votes = np.bincount(bins[first])
+        # Adjacent bins together, so a cluster split on a bin edge still wins
+        if len(votes) > 1:
+            votes = votes[:-1] + votes[1:]
+        peak = int(np.argmax(votes))
+        if votes[peak] > best_votes:
+            best_votes = int(votes[peak])
+            best_scale = float(scale)
+            best_offset = float(low + (peak + 1) * tolerance)
+    return best_scale, best_offset, best_votes
+
+
+def fit_drift(line_starts, onsets, tolerance=DRIFT_MATCH_TOLERANCE, max_offset=DRIFT_MAX_OFFSET_SECONDS,
+              max_deviation=DRIFT_MAX_SCALE_DEVIATION, steps=DRIFT_SCALE_STEPS):
+    """
+    Fit LRC line starts to voiced onsets over the whole track.
+
+    A coarse vote over (scale, offset) candidates finds the dominant alignment
+    even when the intro differs, then a least squares fit on the matched lines
+    refines it. Each line is finally snapped to its matched onset, keeping the
+    line order.
+
+    Args:
+        line_starts (array-like): LRC line start times in seconds, sorted.
+        onsets (array-like): Voiced onset times in seconds (detect_words() starts).
+        tolerance (float): Max distance (seconds) between a line and its onset.
+        max_offset (float): Largest constant shift searched, in seconds.
+        max_deviation (float): Largest tempo mismatch searched (0.05 = 5%).
+        steps (int): Number of scales tried in the coarse search.
+
+    Returns:
+        DriftFit | None: None when there are no lines or no onsets.
+    """
+    lines = np.asarray(line_starts, dtype=np.float64)
+    onsets = np.sort(np.asarray(onsets, dtype=np.float64))
+    if len(lines) == 0 or len(onsets) == 0:
+        return None
+    if len(onsets) == 1:
+        onsets = np.repeat(onsets, 2)
+
+    if len(lines) > 1:
+        scale, offset, _ = _vote(lines, onsets, tolerance, max_offset, max_deviation, steps)
+    else:
+        scale, offset = 1.0, float(onsets[0] - lines[0])
+
+    # Refine on matched lines; the window shrinks from 2x tolerance to tolerance
+    for round_index in range(DRIFT_REFIT_ROUNDS):
+        window = tolerance * (2.0 - round_index / max(1, DRIFT_REFIT_ROUNDS - 1))
+        fitted = scale * lines + offset
+        index, residual = _nearest(onsets, fitted)
+        matched = np.abs(residual) <= window
+        if matched.sum() >= 3 and np.ptp(lines[matched]) > 0:
+            new_scale, new_offset = np.polyfit(lines[matched], onsets[index[matched]], 1)
+            if abs(new_scale - 1.0) <= max_deviation:
+                scale, offset = float(new_scale), float(new_offset)
+                continue
+        if matched.any():
+            # Too few matches for a slope, keep the scale and take the median shift
+            offset += float(np.median(residual[matched]))
+
+    fitted = scale * lines + offset
+    index, residual = _nearest(onsets, fitted)
+    matched = np.abs(residual) <= tolerance
+    starts = np.where(matched, onsets[index], fitted)
+    # Two lines may grab the same onset; the later one keeps its fitted time
+    clash = np.zeros(len(starts), dtype=bool)
+    clash[1:] = starts[1:] <= starts[:-1]
+    starts = np.maximum(np.where(clash, fitted, starts), 0.0)
+    # A fitted time can still land before the previous start, push it just past it
+    for i in range(1, len(starts)):
+        if starts[i] < starts[i - 1] + DRIFT_MIN_LINE_GAP:
+            starts[i] = starts[i - 1] + DRIFT_MIN_LINE_GAP
+            clash[i] = True
+    matched &= ~clash
+
+    confidence = np.where(matched, np.exp(-(residual / tolerance) ** 2), 0.0)
+    return DriftFit(
+        offset=offset,
+        scale=scale,
+        inliers=int(matched.sum()),
+        starts=starts,
+        confidence=confidence,
+    )
@@ -0,0 +1,159 @@
+from operator import itemgetter
+
+import msgpack
+import numpy as np
+
+MSGPACK_MIMETYPE = "application/x-msgpack"
+FORMAT_VERSION = 1
+
+# Confidence is shipped as uint8 = round(confidence * CONFIDENCE_SCALE), NO_CONFIDENCE (255) when the backend has none
+NO_CONFIDENCE = 255
+CONFIDENCE_SCALE = 254
+
+
+_START = itemgetter("start")
+_END = itemgetter("end")
+_TEXT = itemgetter("text")
+
+
+def _columns(items, string_index):
+    """
+    Normalized entries to (int32 starts, int32 ends, int32 text ids, uint8 confidences).
+    New texts are added to string_index.
+    """
+    n = len(items)
+    starts = np.fromiter(map(_START, items), dtype=np.int32, count=n)
+    ends = np.fromiter(map(_END, items), dtype=np.int32, count=n)
+    texts = list(map(_TEXT, items))
+    # Only unique texts go through the Python loop
+    for text in dict.fromkeys(texts):
+        string_index.setdefault(text, len(string_index))
+    text_ids = np.fromiter(map(string_index.__getitem__, texts), dtype=np.int32, count=n)
+    # None becomes nan
+    confidences = np.array([item.get("confidence") for item in items], dtype=np.float64)
+    conf = np.where(
+        np.isnan(confidences), NO_CONFIDENCE,
+        np.rint(np.clip(np.nan_to_num(confidences), 0.0, 1.0) * CONFIDENCE_SCALE)
+    ).astype(np.uint8)
+    return starts, ends, text_ids, conf
+
+
+class CompactTimings:
+    """
+    Word and line timings as parallel arrays.
+
+    Times are int32 milliseconds, texts are indices into one string table (a
+    word repeated across the song is stored once), and line_word[i] is the
+    index of the first word of line i, so words of line i are
+    line_word[i]:line_word[i + 1].
+    """
+
+    def __init__(self, strings, word_start, word_end, word_text, word_conf,
+                 line_start, line_end, line_text, line_conf, line_word, meta=None):
+        self.strings = strings
+        self.word_start = word_start
+        self.word_end = word_end
+        self.word_text = word_text
+        self.word_conf = word_conf
+        self.line_start = line_start
+        self.line_end = line_end
+        self.line_text = line_text
+        self.line_conf = line_conf
+        self.line_word = line_word
+        self.meta = meta or {}
+
+    @classmethod
+    def from_alignment(cls, alignment, meta_keys=("backend", "confidence", "cached")):
+        """
+        Args:
+            alignment (dict): Normalized alignment, {"words": [...], "lines": [...]}
+                with {start, end, text, confidence} entries in ms.
+            meta_keys (tuple): Scalar fields copied along.
+
+        Returns:
+            CompactTimings
+        """
+        words = alignment.get("words", [])
+        lines = alignment.get("lines", [])
+        string_index = {}
+        word_start, word_end, word_text, word_conf = _columns(words, string_index)
+        line_start, line_end, line_text, line_conf = _columns(lines, string_index)
+        # Index of the first word of each line
+        line_word = np.searchsorted(word_start, line_start, side="left").astype(np.int32)
+
+        meta = {key: alignment[key] for key in meta_keys if key in alignment}
+        return cls(
+            list(string_index), word_start, word_end, word_text, word_conf,
+            line_start, line_end, line_text, line_conf, line_word, meta,
+        )
+
+    def to_dict(self):
+        """
+        Parallel arrays as plain lists, for JSON clients that want the compact layout.
+        """
+        return dict(
+            self.meta,
+            v=FORMAT_VERSION,
+            strings=self.strings,
+            word_start=self.word_start.tolist(),
+            word_end=self.word_end.tolist(),
+            word_text=self.word_text.tolist(),
+            word_conf=self.word_conf.tolist(),
+            line_start=self.line_start.tolist(),
+            line_end=self.line_end.tolist(),
+            line_text=self.line_text.tolist(),
+            line_conf=self.line_conf.tolist(),
+            line_word=self.line_word.tolist(),
+        )
+
+    def pack(self):
+        """
+        msgpack map whose arrays are little-endian binary blobs.
+
+        Returns:
+            bytes
+        """
+        return msgpack.packb(dict(
+            self.meta,
+            v=FORMAT_VERSION,
+            strings=self.strings,
+            word_start=self.word_start.astype("<i4").tobytes(),
+            word_end=self.word_end.astype("<i4").tobytes(),
+            word_text=self.word_text.astype("<i4").tobytes(),
+            word_conf=self.word_conf.tobytes(),
+            line_start=self.line_start.astype("<i4").tobytes(),
+            line_end=self.line_end.astype("<i4").tobytes(),
+            line_text=self.line_text.astype("<i4").tobytes(),
+            line_conf=self.line_conf.tobytes(),
+            line_word=self.line_word.astype("<i4").tobytes(),
+        ), use_bin_type=True)
+
+    @classmethod
+    def unpack(cls, data):
+        payload = msgpack.unpackb(data, raw=False)
+        arrays = {
+            key: np.frombuffer(payload.pop(key), dtype="<i4")
+            for key in ("word_start", "word_end", "word_text", "line_start", "line_end", "line_text", "line_word")
+        }
+        word_conf = np.frombuffer(payload.pop("word_conf"), dtype=np.uint8)
+        line_conf = np.frombuffer(payload.pop("line_conf"), dtype=np.uint8)
+        strings = payload.pop("strings")
+        payload.pop("v", None)
+        return cls(strings, word_conf=word_conf, line_conf=line_conf, meta=payload, **arrays)
+
+    def to_alignment(self):
+        """
+        Back to the normalized {"words": [...], "lines": [...]} layout.
+        """
+        def confidence(value):
+            return None if value == NO_CONFIDENCE else float(value) / CONFIDENCE_SCALE
+
+        words = [
+            {"start": int(s), "end": int(e), "text": self.strings[t], "confidence": confidence(c)}
+            for s, e, t, c in zip(self.word_start, self.word_end, self.word_text, self.word_conf)
+        ]
+        lines = [
+            {"start": int(s), "end": int(e), "text": self.strings[t], "confidence": confidence(c)}
+            for s, e, t, c in zip(self.line_start, self.line_end, self.line_text, self.line_conf)
+        ]
+        return dict(self.meta, words=words, lines=lines)
@@ -0,0 +1,147 @@
+import threading
+from collections import Counter, OrderedDict
+
+# A trigram in more than this share of the titles (and at least
+# MIN_COMMON_POSTINGS of them) does not select candidates
+COMMON_POSTINGS_RATIO = 0.02
+MIN_COMMON_POSTINGS = 200
+
+
+class TitleEntry:
+    """
+    result is the Genius search hit of the song (id, url, full_title, ...)
+    when it is known, enough to fetch its lyrics without searching again.
+    """
+    __slots__ = ("song_id", "full_title", "artist", "result", "text")
+
+    def __init__(self, song_id, full_title, artist, result, text):
+        self.song_id = song_id
+        self.full_title = full_title
+        self.artist = artist
+        self.result = result
+        self.text = text
+
+    def to_dict(self):
+        return {"id": self.song_id, "full_title": self.full_title, "artist": self.artist}
+
+
+def _trigrams(text):
+    grams = set()
+    for word in text.split():
+        padded = f" {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TitleIndex:
+    """
+    In-memory trigram index over "<title> by <artist>" strings.
+
+    Trigrams find candidates that share spelling with the query (typos and
+    word order do not matter), then only the best of them are scored with the
+    caller's similarity function.
+
+    Args:
+        normalize (callable): Text -> normalized text, applied to titles and queries.
+        score (callable): (query, full_title) -> similarity in [0, 1].
+        candidates (int): Entries scored per search.
+        max_entries (int | None): Bound on entries added with pinned=False, the
+            least recently added are dropped past it. Pinned entries (a catalog)
+            are never dropped.
+    """
+
+    def __init__(self, normalize, score, candidates=50, max_entries=None):
+        self.normalize = normalize
+        self.score = score
+        self.candidates = candidates
+        self.max_entries = max_entries
+        self._entries = {}  # key -> TitleEntry
+        self._postings = {}  # trigram -> set of keys
+        self._unpinned = OrderedDict()  # key -> None, oldest first
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, full_title, artist="", song_id=None, result=None, pinned=False):
+        """
+        Index a song. Entries are keyed by song_id, or by their text without one;
+        adding the same key again updates it.
+        """
+        text = self.normalize(full_title)
+        if not text:
+            return
+        key = song_id if song_id is not None else text
+        entry = TitleEntry(song_id, full_title, artist, result, text)
+        with self._lock:
+            if not pinned and (key in self._unpinned or key not in self._entries):
+                self._unpinned[key] = None
+                self._unpinned.move_to_end(key)
+            previous = self._entries.get(key)
+            if previous is not None:
+                if previous.text == text:
+                    # Keep a known search hit when the update has none
+                    entry.result = result or previous.result
+                    self._entries[key] = entry
+                    return
+                self._unindex_locked(key, previous)
+            self._entries[key] = entry
+            for gram in _trigrams(text):
+                self._postings.setdefault(gram, set()).add(key)
+            if self.max_entries is not None:
+                while len(self._unpinned) > self.max_entries:
+                    oldest, _ = self._unpinned.popitem(last=False)
+                    self._unindex_locked(oldest, self._entries.pop(oldest))
+
+    def _unindex_locked(self, key, entry):
+        for gram in _trigrams(entry.text):
+            keys = self._postings.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[gram]
+
+    def search(self, query, limit=5):
+        """
+        Returns:
+            list: (similarity, TitleEntry) pairs, best first.
+        """
+        grams = _trigrams(self.normalize(query))
+        if not grams:
+            return []
+        with self._lock:
+            postings = sorted(
+                (self._postings[gram] for gram in grams if self._postings.get(gram)), key=len
+            )
+            # Trigrams shared by a large part of the index ("the", " lo") say little
+            # and cost the most, they are only counted when nothing rarer matched
+            common = max(MIN_COMMON_POSTINGS, len(self._entries) * COMMON_POSTINGS_RATIO)
+            rare = [keys for keys in postings if len(keys) <= common] or postings[:2]
+            counts = Counter()
+            for keys in rare:
+                counts.update(keys)
+            entries = [self._entries[key] for key, _ in counts.most_common(self.candidates)]
+        ranked = sorted(
+            ((self.score(query, entry.full_title), entry) for entry in entries),
+            key=lambda item: item[0],
+            reverse=True,
+        )
+        return ranked[:limit]
+
+    def best_match(self, query, min_similarity, margin):
+        """
+        The best entry when it scores at least min_similarity and beats the
+        runner-up by margin (an ambiguous query is left to Genius).
+
+        Returns:
+            tuple: (similarity, TitleEntry) or (0, None)
+        """
+        ranked = self.search(query, limit=5)
+        if not ranked or ranked[0][0] < min_similarity:
+            return 0, None
+        best_score, best = ranked[0]
+        # The same title indexed twice (catalog and Genius) is not a rival
+        runner_up = next((score for score, entry in ranked[1:] if entry.text != best.text), 0)
+        if best_score - runner_up < margin:
+            return 0, None
+        return best_score, best
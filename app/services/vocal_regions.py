@@ -0,0 +1,165 @@
+import bisect
+import os
+
+import numpy as np
+import soundfile as sf
+
+from app.services.aplitude_processor import detect_words
+from app.services.vocal_separater import spleeter_separate_decoded
+from app.utils.decoded_audio import DecodedAudio
+from app.utils.logger import get_logger
+
+log = get_logger("Align")
+
+# Padding kept around each voiced region, and gaps shorter than this are not cut
+ALIGN_VOCALS_PAD_SECONDS = float(os.getenv("ALIGN_VOCALS_PAD_SECONDS", "0.25"))
+ALIGN_VOCALS_MERGE_GAP_SECONDS = float(os.getenv("ALIGN_VOCALS_MERGE_GAP_SECONDS", "1.5"))
+# Silence inserted between concatenated regions so aligners see a pause there
+ALIGN_VOCALS_JOIN_SECONDS = 0.3
+# Every aligner works on 16 kHz mono internally
+ALIGN_VOCALS_SR = 16000
+
+TIME_KEYS = ("start", "end", "begin")
+
+
+def voiced_regions(segments, duration, pad=ALIGN_VOCALS_PAD_SECONDS, merge_gap=ALIGN_VOCALS_MERGE_GAP_SECONDS):
+    """
+    Turn detect_words() segments into padded, merged regions worth aligning.
+
+    Args:
+        segments (list): (start, end) seconds from detect_words().
+        duration (float): Length of the audio in seconds.
+
+    Returns:
+        list: (start, end) seconds, sorted and non-overlapping.
+    """
+    regions = []
+    for start, end in segments:
+        start = max(0.0, start - pad)
+        end = min(duration, end + pad)
+        if regions and start - regions[-1][1] < merge_gap:
+            regions[-1][1] = max(regions[-1][1], end)
+        else:
+            regions.append([start, end])
+    return [tuple(region) for region in regions]
+
+
+class VoicedTimeline:
+    """
+    Maps times in the concatenated voiced audio back to the original track.
+    """
+
+    def __init__(self, regions, join_seconds=ALIGN_VOCALS_JOIN_SECONDS, duration=None):
+        self.regions = regions
+        self.duration = duration
+        self._out_starts = []
+        self._src_starts = []
+        self._lengths = []
+        out = 0.0
+        for start, end in regions:
+            self._out_starts.append(out)
+            self._src_starts.append(start)
+            self._lengths.append(end - start)
+            out += end - start + join_seconds
+        self.voiced_seconds = sum(self._lengths)
+
+    def to_original(self, t):
+        """
+        Args:
+            t (float): Seconds in the voiced audio.
+
+        Returns:
+            float: Seconds in the original track. Times inside an inserted
+            silence are clamped to the end of the region before it.
+        """
+        if not self.regions:
+            return t
+        i = max(0, bisect.bisect_right(self._out_starts, t) - 1)
+        offset = min(max(0.0, t - self._out_starts[i]), self._lengths[i])
+        return self._src_starts[i] + offset
+
+    def remap(self, result, scale=1.0):
+        """
+        Rewrite every "start" / "end" / "begin" value of an aligner result.
+
+        Args:
+            result (dict | list): Aligner output (Gentle, WhisperX, Aeneas json, TextGrid json).
+            scale (float): Units per second of the time values, 1000 for milliseconds.
+
+        Returns:
+            dict | list: A copy with times on the original track.
+        """
+        if isinstance(result, list):
+            return [self.remap(item, scale) for item in result]
+        if not isinstance(result, dict):
+            return result
+        remapped = {}
+        for key, value in result.items():
+            if key in TIME_KEYS and not isinstance(value, bool) and isinstance(value, (int, float, str)):
+                remapped[key] = self._remap_value(value, scale)
+            else:
+                remapped[key] = self.remap(value, scale)
+        return remapped
+
+    def _remap_value(self, value, scale):
+        try:
+            t = float(value) / scale
+        except ValueError:
+            return value
+        mapped = self.to_original(t) * scale
+        if isinstance(value, str):
+            # Aeneas writes times as strings like "12.340"
+            return f"{mapped:.3f}"
+        if isinstance(value, int):
+            return int(round(mapped))
+        return round(mapped, 3)
+
+    def to_dict(self):
+        return {
+            "regions": [[round(start, 3), round(end, 3)] for start, end in self.regions],
+            "voiced_seconds": round(self.voiced_seconds, 3),
+            "original_seconds": round(self.duration, 3) if self.duration is not None else None,
+        }
+
+
+def prepare_vocals_for_alignment(source, workspace, threshold=0.02, min_duration=0.2):
+    """
+    Separate (or reuse cached) vocals of an upload and keep only the voiced regions.
+
+    Args:
+        source (str | DecodedAudio): The uploaded mix saved in the workspace, or its
+            decoded audio (its content hash is reused as the stem cache key).
+        workspace (Workspace): Scratch directory of the request.
+        threshold (float): detect_words() amplitude threshold on the vocal stem.
+        min_duration (float): detect_words() minimum segment length.
+
+    Returns:
+        tuple: (path of the voiced 16 kHz wav, VoicedTimeline, None),
+            or (None, None, error message).
+    """
+    stems, stem_audio = spleeter_separate_decoded(source, "2", workspace.subdir("stems"))
+    if not stems or "vocals" not in stems:
+        return None, None, "Vocal separation failed"
+
+    vocals = stem_audio.get("vocals") or DecodedAudio.from_file(stems["vocals"])
+    duration = vocals.duration
+    regions = voiced_regions(detect_words(vocals, threshold=threshold, min_duration=min_duration), duration)
+    if not regions:
+        # Nothing crossed the threshold, align the whole vocal stem
+        regions = [(0.0, duration)]
+
+    y = vocals.mono(sr=ALIGN_VOCALS_SR)
+    join = np.zeros(int(ALIGN_VOCALS_JOIN_SECONDS * ALIGN_VOCALS_SR), dtype=y.dtype)
+    pieces = []
+    for start, end in regions:
+        if pieces:
+            pieces.append(join)
+        pieces.append(y[int(start * ALIGN_VOCALS_SR):int(end * ALIGN_VOCALS_SR)])
+
+    voiced_path = os.path.join(workspace.path, "voiced.wav")
+    sf.write(voiced_path, np.concatenate(pieces), ALIGN_VOCALS_SR, subtype="PCM_16")
+
+    timeline = VoicedTimeline(regions, duration=duration)
+    log.info("Vocals only", voiced_seconds=round(timeline.voiced_seconds, 1),
+             duration=round(duration, 1), regions=len(regions))
+    return voiced_path, timeline, None
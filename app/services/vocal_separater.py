@@ -3,13 +3,79 @@ import subprocess
 import tempfile
 import zipfile
 import secrets
+import time
 from pydub import AudioSegment
+from app.services import stem_cache
+from app.services.separator_pool import get_separator_pool
+from app.utils.decoded_audio import DecodedAudio, as_decoded
+from app.utils.logger import get_logger
 
-env2_python = "/home/cao-le/Flutter Projects/music_player_app/backend/env2/bin/python"
+log = get_logger("Stems")
+
+env2_python = os.getenv("SPLEETER_PYTHON", "/home/cao-le/Flutter Projects/music_player_app/backend/env2/bin/python")
+
+# Route separations through resident workers instead of one subprocess per song
+SPLEETER_USE_POOL = os.getenv("SPLEETER_USE_POOL", "1") == "1"
+
+STEM_NAMES = {
+    "2": ["vocals", "accompaniment"],
+    "4": ["vocals", "drums", "bass", "other"],
+    "5": ["vocals", "drums", "bass", "piano", "other"],
+}
+
+class _StreamBuffer:
+    """
+    Write-only sink for zipfile. It has no tell()/seek(), so zipfile switches to
+    streaming mode (data descriptors) and never needs to rewind.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def stream_zip_files(entries, chunk_size=64 * 1024):
+    """
+    Build a zip archive on the fly, yielding it chunk by chunk.
+    Entries are stored without compression since stems are already mp3.
+
+    Args:
+        entries (list): (arcname, source) pairs, source is a file path or bytes.
+        chunk_size (int): Read size used when copying files into the archive.
+
+    Yields:
+        bytes: Consecutive pieces of the zip archive.
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as zipf:
+        for arcname, source in entries:
+            info = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            if isinstance(source, bytes):
+                zipf.writestr(info, source)
+            else:
+                info.file_size = os.path.getsize(source)
+                with open(source, 'rb') as src, zipf.open(info, 'w') as dest:
+                    for chunk in iter(lambda: src.read(chunk_size), b''):
+                        dest.write(chunk)
+                        yield buffer.drain()
+            yield buffer.drain()
+    yield buffer.drain()
 
 def zip_audio_files(result_dict, output_zip_path):
     """
     Zip audio files into a single archive.
+    Files are stored uncompressed, deflating mp3 only costs CPU.
     
     Args:
         result_dict (dict): Dictionary containing file paths (e.g., {"vocals": "path/to/vocals.mp3"}).
@@ -19,77 +85,135 @@ def zip_audio_files(result_dict, output_zip_path):
         str: Path to the created zip file.
     """
     try:
-        with zipfile.ZipFile(output_zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        with zipfile.ZipFile(output_zip_path, 'w', zipfile.ZIP_STORED) as zipf:
             for key, file_path in result_dict.items():
                 if os.path.exists(file_path):
                     zipf.write(file_path, os.path.basename(file_path))
         return output_zip_path
     except Exception as e:
-        print(f"Error creating zip file: {e}")
+        log.error("Error creating zip file", error=str(e))
         return None
 
-def convert_to_mp3(wav_path, output_dir):
+def convert_to_mp3(source, output_dir):
     """
-    Convert a .wav file to .mp3 format.
-    
+    Encode audio to .mp3 format.
+
     Args:
-        wav_path (str): Path to the .wav file.
+        source (str | DecodedAudio): Path to a .wav file, or already decoded audio
+            (in which case nothing is decoded again).
         output_dir (str): Directory to save the .mp3 file.
-    
+
     Returns:
         str: Path to the converted .mp3 file.
     """
+    audio = as_decoded(source)
     try:
         random_id = secrets.token_hex(4)  # Generates 8 characters (4 bytes in hex)
-        base_name = os.path.basename(wav_path).replace(".wav", "")
+        base_name = os.path.splitext(os.path.basename(audio.path or "audio"))[0]
         mp3_file_name = f"{base_name}_{random_id}.mp3"
         mp3_path = os.path.join(output_dir, mp3_file_name)
 
-        audio = AudioSegment.from_wav(wav_path)
-        audio.export(mp3_path, format="mp3")
+        segment = AudioSegment(
+            data=audio.to_pcm16(),
+            sample_width=2,
+            frame_rate=audio.sr,
+            channels=audio.channels,
+        )
+        segment.export(mp3_path, format="mp3")
         return mp3_path
     except Exception as e:
-        print(f"Error converting {wav_path} to mp3: {e}")
+        log.error("Error converting to mp3", path=audio.path, error=str(e))
         return None
 
-def spleeter_separate(input_path, stems, output_dir):
-    result = subprocess.run([
-        env2_python, "-m", "spleeter", "separate", "-p", f"spleeter:{stems}stems", "-o", output_dir, input_path
-    ], capture_output=True, text=True)
-    
-    if result.returncode != 0:
-        print("Spleeter failed:", result.stderr)
-        return None
+def spleeter_separate(source, stems, output_dir, use_cache=True):
+    """
+    Separate an audio file into stems, reusing cached stems when the same
+    decoded audio has already been separated with the same stem count.
 
-    base_name = os.path.splitext(os.path.basename(input_path))[0]
-    vocals_path = os.path.join(output_dir, base_name, "vocals.wav")
-    accompaniment_path = os.path.join(output_dir, base_name, "accompaniment.wav")
-    drums_path = os.path.join(output_dir, base_name, "drums.wav") if stems == "4" else ""
-    bass_path = os.path.join(output_dir, base_name, "bass.wav") if stems == "4" else ""
-    other_path = os.path.join(output_dir, base_name, "other.wav") if stems == "5" else ""
+    Args:
+        source (str | DecodedAudio): Path to the audio file, or its decoded audio.
+        stems (str): Stem count ("2", "4" or "5").
+        output_dir (str): Directory to write the .mp3 stems into.
+        use_cache (bool): Look up / store results in the stem cache.
 
-    result_dict = {}
+    Returns:
+        dict: Stem name -> .mp3 path, or None on failure.
+    """
+    result_dict, _ = spleeter_separate_decoded(source, stems, output_dir, use_cache)
+    return result_dict
+
+def spleeter_separate_decoded(source, stems, output_dir, use_cache=True):
+    """
+    Same as spleeter_separate() but also returns the decoded stems, so callers
+    can analyse them (e.g. detect_first_word on vocals) without decoding again.
+
+    Args:
+        source (str | DecodedAudio): Path to the audio file, or its decoded audio.
+            The decoded samples are only read to compute the stem cache key.
+        stems (str): Stem count ("2", "4" or "5").
+        output_dir (str): Directory to write the .mp3 stems into.
+        use_cache (bool): Look up / store results in the stem cache.
 
-    # Convert .wav files to .mp3 and update result_dict
-    if os.path.exists(vocals_path):
-        result_dict["vocals"] = convert_to_mp3(vocals_path, output_dir)
+    Returns:
+        tuple: ({stem: .mp3 path}, {stem: DecodedAudio}), or (None, None) on failure.
+    """
+    audio = as_decoded(source)
 
-    if os.path.exists(accompaniment_path):
-        result_dict["accompaniment"] = convert_to_mp3(accompaniment_path, output_dir)
+    audio_hash = None
+    if use_cache:
+        try:
+            audio_hash = audio.content_hash()
+        except Exception as e:
+            log.warning("Error hashing for stem cache", path=audio.path, error=str(e))
 
-    if os.path.exists(drums_path):
-        result_dict["drums"] = convert_to_mp3(drums_path, output_dir)
+    if audio_hash:
+        cached = stem_cache.lookup(audio_hash, stems, output_dir)
+        if cached:
+            # Cached stems are only decoded if a caller actually reads them
+            return cached, {stem: DecodedAudio.from_file(path) for stem, path in cached.items()}
 
-    if os.path.exists(bass_path):
-        result_dict["bass"] = convert_to_mp3(bass_path, output_dir)
+    result_dict, stem_audio = _run_spleeter(audio.path, stems, output_dir)
+
+    if result_dict and audio_hash:
+        stem_cache.store(audio_hash, stems, result_dict)
+
+    return result_dict, stem_audio
+
+def _run_spleeter(input_path, stems, output_dir):
+    if SPLEETER_USE_POOL:
+        ok, error = get_separator_pool(env2_python).separate(input_path, stems, output_dir)
+        if not ok:
+            log.error("Spleeter failed", error=error)
+            return None, None
+    else:
+        result = subprocess.run([
+            env2_python, "-m", "spleeter", "separate", "-p", f"spleeter:{stems}stems", "-o", output_dir, input_path
+        ], capture_output=True, text=True)
+
+        if result.returncode != 0:
+            log.error("Spleeter failed", error=result.stderr)
+            return None, None
+
+    base_name = os.path.splitext(os.path.basename(input_path))[0]
+
+    result_dict = {}
+    stem_audio = {}
+
+    # Read each stem .wav once, encode it to .mp3 and keep the samples for analysis
+    for stem in STEM_NAMES.get(str(stems), STEM_NAMES["2"]):
+        wav_path = os.path.join(output_dir, base_name, f"{stem}.wav")
+        if not os.path.exists(wav_path):
+            continue
+        decoded = DecodedAudio.from_file(wav_path)
+        mp3_path = convert_to_mp3(decoded, output_dir)
+        if mp3_path:
+            result_dict[stem] = mp3_path
+            stem_audio[stem] = decoded
 
-    if os.path.exists(other_path):
-        result_dict["other"] = convert_to_mp3(other_path, output_dir)
-    
     if result_dict:
-        return result_dict
+        return result_dict, stem_audio
     else:
-        print("No output files found.")
-        return None
+        log.error("No output files found")
+        return None, None
 
-# spleeter_separate("/home/cao-le/Music/castle_of_glass.mp3", ".")
\ No newline at end of file
+# spleeter_separate("/home/cao-le/Music/castle_of_glass.mp3", ".")
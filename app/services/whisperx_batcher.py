@@ -0,0 +1,271 @@
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from app.services.model_registry import model_registry
+
+# Largest batch sent to the model, and how long the first segment waits for
+# segments of other requests before its batch runs
+WHISPERX_BATCH_SIZE = int(os.getenv("WHISPERX_BATCH_SIZE", "16"))
+WHISPERX_BATCH_WINDOW_MS = int(os.getenv("WHISPERX_BATCH_WINDOW_MS", "25"))
+# A model's batcher thread exits after this long without work
+WHISPERX_BATCHER_IDLE_SECONDS = int(os.getenv("WHISPERX_BATCHER_IDLE_SECONDS", "60"))
+
+SAMPLE_RATE = 16000
+
+_batchers = {}  # ModelKey -> WhisperxBatcher
+_batchers_lock = threading.Lock()
+
+# Queued by retire_batcher(), the batcher thread exits once it reaches it
+_STOP = object()
+
+
+class _Pending:
+    __slots__ = ("features", "future")
+
+    def __init__(self, features):
+        self.features = features
+        self.future = Future()
+
+
+def _stack(features):
+    torch = sys.modules.get("torch")
+    if torch is not None and isinstance(features[0], torch.Tensor):
+        return torch.stack(features)
+    return np.stack(features)
+
+
+class WhisperxBatcher:
+    """
+    Runs the decoder of one WhisperX model on segments of many requests at once.
+
+    Each request submits the log-mel features of its VAD segments. The batcher
+    thread takes the first waiting segment, waits up to the batch window for more
+    (from any request) until batch_size is reached, runs them in a single
+    model._forward() call and resolves every segment's future with its text.
+
+    The thread holds the model until it retires, when idle or when the registry
+    evicts the model (segments queued before that are still decoded).
+    """
+
+    def __init__(self, key, model, batch_size=WHISPERX_BATCH_SIZE,
+                 window_ms=WHISPERX_BATCH_WINDOW_MS, idle_seconds=WHISPERX_BATCHER_IDLE_SECONDS):
+        self.key = key
+        self.model = model
+        self.batch_size = max(1, batch_size)
+        self.window = window_ms / 1000.0
+        self.idle_seconds = idle_seconds
+        self.batches = 0
+        self.segments = 0
+        self._queue = queue.Queue()
+        self._closed = False
+        self._stopping = False
+        self._thread = threading.Thread(target=self._loop, name="whisperx-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, features):
+        """
+        Args:
+            features (list): Log-mel features of each segment (model.preprocess output).
+
+        Returns:
+            list[Future]: One future per segment, resolving to its text.
+        """
+        items = [_Pending(f) for f in features]
+        for item in items:
+            self._queue.put(item)
+        return [item.future for item in items]
+
+    def retire(self):
+        """
+        Stop after the segments already queued. Called with _batchers_lock held.
+        """
+        if not self._closed:
+            self._closed = True
+            self._queue.put(_STOP)
+
+    def _collect(self):
+        try:
+            item = self._queue.get(timeout=self.idle_seconds)
+        except queue.Empty:
+            return None
+        if item is _STOP:
+            self._stopping = True
+            return []
+        batch = [item]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._stopping = True
+                break
+            batch.append(item)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                # Idle: retire unless a request slipped in while we timed out
+                with _batchers_lock:
+                    if self._queue.empty():
+                        self._closed = True
+                        if _batchers.get(self.key) is self:
+                            del _batchers[self.key]
+                        self.model = None
+                        return
+                continue
+            if batch:
+                self._run(batch)
+            if self._stopping:
+                # Nothing is queued after _STOP, submit_segments() skips closed batchers
+                self.model = None
+                return
+
+    def _run(self, batch):
+        try:
+            texts = self.model._forward({"inputs": _stack([item.features for item in batch])})["text"]
+            if isinstance(texts, str):
+                texts = [texts]
+            for item, text in zip(batch, texts):
+                item.future.set_result(text)
+        except Exception as e:
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(e)
+        self.batches += 1
+        self.segments += len(batch)
+
+
+def submit_segments(key, model, features):
+    """
+    Queue segment features on the batcher of a model, started on first use.
+
+    Lookup and enqueue happen under one lock, so an idle batcher never retires
+    with segments still queued.
+
+    Args:
+        key (ModelKey): Registry key of the model, batchers are shared per key.
+        model: The loaded WhisperX pipeline.
+        features (list): Log-mel features of each segment.
+
+    Returns:
+        list[Future]: One future per segment, resolving to its text.
+    """
+    with _batchers_lock:
+        batcher = _batchers.get(key)
+        if batcher is None or batcher._closed:
+            batcher = WhisperxBatcher(key, model)
+            _batchers[key] = batcher
+        return batcher.submit(features)
+
+
+def retire_batcher(key):
+    """
+    Let the batcher of an evicted model finish its queue and release the model.
+    """
+    with _batchers_lock:
+        batcher = _batchers.pop(key, None)
+        if batcher is not None:
+            batcher.retire()
+
+
+model_registry.add_eviction_listener(retire_batcher)
+
+
+def _vad_segments(model, audio, chunk_size):
+    """
+    Same VAD + merge step as FasterWhisperPipeline.transcribe().
+    """
+    import torch
+
+    vad_model = model.vad_model
+    if hasattr(vad_model, "merge_chunks") and hasattr(vad_model, "preprocess_audio"):
+        # whisperx >= 3.3
+        waveform = vad_model.preprocess_audio(audio)
+        merge_chunks = vad_model.merge_chunks
+    else:
+        from whisperx.vad import merge_chunks
+
+        waveform = torch.from_numpy(audio).unsqueeze(0)
+    segments = vad_model({"waveform": waveform, "sample_rate": SAMPLE_RATE})
+    return merge_chunks(
+        segments,
+        chunk_size,
+        onset=model._vad_params["vad_onset"],
+        offset=model._vad_params["vad_offset"],
+    )
+
+
+def _can_batch(model, language):
+    tokenizer = getattr(model, "tokenizer", None)
+    return (
+        language is not None
+        and tokenizer is not None
+        and getattr(tokenizer, "language_code", language) == language
+        and not getattr(model, "suppress_numerals", False)
+        and hasattr(model, "preprocess")
+        and hasattr(model, "_forward")
+        and hasattr(model, "vad_model")
+    )
+
+
+def transcribe_batched(model, audio, language, model_key, batch_size=WHISPERX_BATCH_SIZE, chunk_size=30):
+    """
+    Drop-in for model.transcribe(audio, batch_size=..., language=...) whose
+    segments share decoder batches with other in-flight requests on the same
+    model_key (the model's ModelKey in the registry).
+
+    Falls back to model.transcribe() when the model has no fixed language
+    (detection happens per request) or this whisperx version does not expose
+    the pipeline steps used here.
+
+    Returns:
+        dict: {"segments": [{"text", "start", "end"}], "language": language}
+    """
+    if not _can_batch(model, language):
+        return model.transcribe(audio, batch_size=batch_size, language=language)
+    try:
+        vad_segments = _vad_segments(model, audio, chunk_size)
+    except (AttributeError, ImportError, KeyError, TypeError):
+        return model.transcribe(audio, batch_size=batch_size, language=language)
+
+    features = []
+    for segment in vad_segments:
+        f1 = int(segment["start"] * SAMPLE_RATE)
+        f2 = int(segment["end"] * SAMPLE_RATE)
+        features.append(model.preprocess({"inputs": audio[f1:f2]})["inputs"])
+
+    futures = submit_segments(model_key, model, features) if features else []
+    segments = []
+    for segment, future in zip(vad_segments, futures):
+        segments.append({
+            "text": future.result(),
+            "start": round(segment["start"], 3),
+            "end": round(segment["end"], 3),
+        })
+    return {"segments": segments, "language": language}
+
+
+def batcher_stats():
+    with _batchers_lock:
+        return [
+            {
+                "name": key.name,
+                "language": key.language,
+                "batches": b.batches,
+                "segments": b.segments,
+                "avg_batch": round(b.segments / b.batches, 2) if b.batches else 0,
+                "queued": b._queue.qsize(),
+            }
+            for key, b in _batchers.items()
+        ]
@@ -0,0 +1,143 @@
+import hashlib
+import threading
+
+import librosa
+import numpy as np
+
+
+class DecodedAudio:
+    """
+    PCM samples of one audio file, decoded at most once and shared across the
+    pipeline stages (stem cache hashing, amplitude, word detection, mp3 export).
+
+    Samples are kept at the native sample rate with shape (channels, n) or (n,).
+    Mono and resampled views are computed lazily and cached per sample rate.
+    """
+
+    def __init__(self, path=None, samples=None, sr=None):
+        if path is None and samples is None:
+            raise ValueError("DecodedAudio needs a path or samples")
+        self.path = path
+        self._samples = samples
+        self._sr = sr
+        self._views = {}
+        self._hash = None
+        self._source_hash = None
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Wrap a file without decoding it yet, decoding happens on first access.
+        """
+        return cls(path=path)
+
+    def _decode(self):
+        with self._lock:
+            if self._samples is None:
+                self._samples, self._sr = librosa.load(self.path, sr=None, mono=False)
+        return self._samples
+
+    @property
+    def is_decoded(self):
+        return self._samples is not None
+
+    @property
+    def samples(self):
+        return self._decode()
+
+    @property
+    def sr(self):
+        self._decode()
+        return self._sr
+
+    @property
+    def channels(self):
+        samples = self.samples
+        return 1 if samples.ndim == 1 else samples.shape[0]
+
+    @property
+    def duration(self):
+        return self.samples.shape[-1] / self.sr
+
+    def mono(self, sr=None):
+        """
+        Mono float32 view, optionally resampled. Equivalent to
+        librosa.load(path, sr=sr) without decoding the file again.
+
+        Args:
+            sr (int | None): Target sample rate, None keeps the native rate.
+
+        Returns:
+            np.ndarray: 1-D float32 samples.
+        """
+        with self._lock:
+            native_sr = self.sr
+            key = native_sr if sr is None else sr
+            if key not in self._views:
+                if native_sr not in self._views:
+                    self._views[native_sr] = librosa.to_mono(self.samples)
+                if key != native_sr:
+                    self._views[key] = librosa.resample(
+                        self._views[native_sr], orig_sr=native_sr, target_sr=key
+                    )
+            return self._views[key]
+
+    def content_hash(self):
+        """
+        SHA-256 of the decoded samples and sample rate, stable across
+        container/tag changes of the same recording.
+        """
+        with self._lock:
+            if self._hash is None:
+                samples = self.samples
+                digest = hashlib.sha256()
+                digest.update(f"{self.sr}:{samples.shape}".encode("utf-8"))
+                digest.update(np.ascontiguousarray(samples).tobytes())
+                self._hash = digest.hexdigest()
+            return self._hash
+
+    def source_hash(self):
+        """
+        Cache key of this audio: SHA-256 of the source file's bytes when there
+        is a file (streamed, nothing is decoded), else content_hash().
+        """
+        with self._lock:
+            if self._source_hash is None:
+                if isinstance(self.path, str):
+                    self._source_hash = file_hash(self.path)
+                else:
+                    self._source_hash = self.content_hash()
+            return self._source_hash
+
+    def to_pcm16(self):
+        """
+        Interleaved 16-bit PCM bytes, e.g. for pydub.AudioSegment(data=...).
+        """
+        samples = self.samples
+        if samples.ndim > 1:
+            samples = samples.T
+        pcm = np.clip(samples, -1.0, 1.0) * 32767
+        return np.ascontiguousarray(pcm.astype(np.int16)).tobytes()
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """
+    SHA-256 of a file's raw bytes, read in chunks. Cheap cache key for an
+    upload that has not been (and may never need to be) decoded.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def as_decoded(source):
+    """
+    Accept a DecodedAudio or anything librosa.load() understands (path,
+    file-like object such as a Flask FileStorage) and return a DecodedAudio.
+    """
+    if isinstance(source, DecodedAudio):
+        return source
+    return DecodedAudio.from_file(source)
@@ -0,0 +1,87 @@
+import json
+import logging
+import os
+import sys
+
+# DEBUG, INFO, WARNING or ERROR
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "text": [Tag] message key=value, "json": one JSON object per line
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+
+_ROOT = "app"
+
+
+class _Formatter(logging.Formatter):
+    def format(self, record):
+        tag = record.name[len(_ROOT) + 1:] or _ROOT
+        fields = getattr(record, "fields", None) or {}
+        if LOG_FORMAT == "json":
+            entry = {
+                "time": round(record.created, 3),
+                "level": record.levelname.lower(),
+                "tag": tag,
+                "msg": record.getMessage(),
+            }
+            entry.update(fields)
+            if record.exc_info:
+                entry["exc"] = self.formatException(record.exc_info)
+            return json.dumps(entry, ensure_ascii=False, default=str)
+
+        text = f"[{tag}] {record.getMessage()}"
+        if fields:
+            text += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_info:
+            text += "\n" + self.formatException(record.exc_info)
+        return text
+
+
+def _configure():
+    root = logging.getLogger(_ROOT)
+    if root.handlers:
+        return root
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(_Formatter())
+    root.addHandler(handler)
+    root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+    root.propagate = False
+    return root
+
+
+class StructuredLogger:
+    """
+    Level-gated logger taking key=value fields: log.info("Aligned", lines=42).
+
+    Nothing is formatted when the level is disabled, so debug calls on hot
+    paths only cost a level check.
+    """
+    __slots__ = ("_logger",)
+
+    def __init__(self, logger):
+        self._logger = logger
+
+    def enabled(self, level):
+        return self._logger.isEnabledFor(level)
+
+    def _log(self, level, msg, fields, exc_info=False):
+        if self._logger.isEnabledFor(level):
+            self._logger.log(level, msg, extra={"fields": fields}, exc_info=exc_info)
+
+    def debug(self, msg, **fields):
+        self._log(logging.DEBUG, msg, fields)
+
+    def info(self, msg, **fields):
+        self._log(logging.INFO, msg, fields)
+
+    def warning(self, msg, **fields):
+        self._log(logging.WARNING, msg, fields)
+
+    def error(self, msg, exc_info=False, **fields):
+        self._log(logging.ERROR, msg, fields, exc_info)
+
+
+def get_logger(tag):
+    """
+    Logger printing as "[<tag>] ...", e.g. get_logger("Karaoke").
+    """
+    _configure()
+    return StructuredLogger(logging.getLogger(f"{_ROOT}.{tag}"))
@@ -0,0 +1,146 @@
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from app.utils.logger import get_logger
+
+log = get_logger("Startup")
+
+# Packages that must not be imported while the app boots, they are loaded by
+# the blueprints on first use or by warm_up()
+HEAVY_MODULES = (
+    "torch", "whisperx", "tensorflow", "spleeter", "aeneas", "vosk", "openai",
+    "numba", "scipy", "sklearn", "transformers",
+)
+
+# Comma separated, e.g. "whisperx:en,whisperx_align:en,aeneas,spleeter"
+WARMUP_BACKENDS = os.getenv("WARMUP_BACKENDS", "")
+# 1 blocks create_app() until warm-up is done, default warms up in the background
+WARMUP_BLOCKING = os.getenv("WARMUP_BLOCKING", "0") == "1"
+
+
+class StartupReport:
+    """
+    What create_app() imported and how long each step took.
+    """
+
+    def __init__(self):
+        self._started = time.perf_counter()
+        self._modules_before = len(sys.modules)
+        self.steps = []
+        self.warmup = []
+        self.seconds = None
+
+    @contextmanager
+    def step(self, name):
+        modules_before = len(sys.modules)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append({
+                "name": name,
+                "seconds": round(time.perf_counter() - started, 4),
+                "modules": len(sys.modules) - modules_before,
+            })
+
+    def finish(self):
+        self.seconds = round(time.perf_counter() - self._started, 4)
+        return self
+
+    def heavy_modules(self):
+        return sorted(name for name in HEAVY_MODULES if name in sys.modules)
+
+    def to_dict(self):
+        return {
+            "seconds": self.seconds,
+            "modules_imported": len(sys.modules) - self._modules_before,
+            "heavy_modules": self.heavy_modules(),
+            "steps": list(self.steps),
+            "warmup": list(self.warmup),
+        }
+
+    def log(self):
+        report = self.to_dict()
+        log.info("App ready", seconds=report["seconds"], modules_imported=report["modules_imported"])
+        for step in sorted(report["steps"], key=lambda s: s["seconds"], reverse=True):
+            log.info("Step", name=step["name"], seconds=step["seconds"], modules=step["modules"])
+        if report["heavy_modules"]:
+            log.warning("Heavy modules loaded at startup", modules=",".join(report["heavy_modules"]))
+
+
+def _warm_whisperx(language=None):
+    from app.services.text_align_forcer import get_whisperx_model
+
+    get_whisperx_model(language=language)
+
+
+def _warm_whisperx_align(language="en"):
+    from app.services.text_align_forcer import get_whisperx_align_model
+
+    get_whisperx_align_model(language)
+
+
+def _warm_aeneas(_=None):
+    import aeneas.executetask  # noqa: F401
+
+
+def _warm_spleeter(_=None):
+    from app.services.separator_pool import get_separator_pool
+    from app.services.vocal_separater import env2_python
+
+    get_separator_pool(env2_python)
+
+
+WARMERS = {
+    "whisperx": _warm_whisperx,
+    "whisperx_align": _warm_whisperx_align,
+    "aeneas": _warm_aeneas,
+    "spleeter": _warm_spleeter,
+}
+
+
+def _run_warmup(names, report):
+    for name in names:
+        backend, _, arg = name.partition(":")
+        warmer = WARMERS.get(backend)
+        if warmer is None:
+            log.warning("Unknown warm-up backend", name=name)
+            continue
+        started = time.perf_counter()
+        try:
+            warmer(arg or None)
+            status = "ok"
+        except Exception as e:
+            status = f"failed: {e}"
+        seconds = round(time.perf_counter() - started, 3)
+        report.warmup.append({"name": name, "seconds": seconds, "status": status})
+        log.info("Warm-up", name=name, status=status, seconds=seconds)
+
+
+def warm_up(names=None, report=None, blocking=None):
+    """
+    Load heavy backends ahead of the first request.
+
+    Args:
+        names (list[str] | None): Backends to load ("whisperx[:<lang>]", "whisperx_align:<lang>",
+            "aeneas", "spleeter"), defaults to WARMUP_BACKENDS.
+        report (StartupReport | None): Report to record warm-up timings in.
+        blocking (bool | None): Wait for the warm-up, defaults to WARMUP_BLOCKING.
+
+    Returns:
+        threading.Thread | None: The background warm-up thread, if one was started.
+    """
+    if names is None:
+        names = [name.strip() for name in WARMUP_BACKENDS.split(",") if name.strip()]
+    if not names:
+        return None
+    report = report or StartupReport()
+    if WARMUP_BLOCKING if blocking is None else blocking:
+        _run_warmup(names, report)
+        return None
+    thread = threading.Thread(target=_run_warmup, args=(names, report), name="backend-warmup", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,178 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from werkzeug.utils import secure_filename
+
+from app.utils.logger import get_logger
+
+log = get_logger("Workspace")
+
+# Point this at a tmpfs mount (e.g. /dev/shm/music_player) to keep scratch audio in RAM
+WORKSPACE_ROOT = os.path.abspath(os.getenv("WORKSPACE_ROOT", "./temp/workspaces"))
+# Workspaces older than this are removed even if their owner process looks alive
+WORKSPACE_MAX_AGE_SECONDS = int(os.getenv("WORKSPACE_MAX_AGE_SECONDS", str(6 * 3600)))
+WORKSPACE_JANITOR_INTERVAL = int(os.getenv("WORKSPACE_JANITOR_INTERVAL", "300"))
+
+OWNER_FILE = ".owner"
+
+_active = set()
+_active_lock = threading.Lock()
+_janitor = None
+
+
+class Workspace:
+    """
+    Private scratch directory for one request.
+
+    Used as a context manager it is removed on exit, success or failure, unless
+    detach() handed it over to someone else (a background job or a streaming
+    response) who then calls cleanup() when done.
+    """
+
+    def __init__(self, root=WORKSPACE_ROOT):
+        os.makedirs(root, exist_ok=True)
+        self.path = tempfile.mkdtemp(prefix="ws-", dir=root)
+        with open(os.path.join(self.path, OWNER_FILE), "w") as f:
+            f.write(str(os.getpid()))
+        self._detached = False
+        self._cleaned = False
+        with _active_lock:
+            _active.add(self.path)
+
+    def file_path(self, filename, default="upload"):
+        """
+        Path inside the workspace for an untrusted (e.g. uploaded) file name.
+        """
+        return os.path.join(self.path, secure_filename(filename or "") or default)
+
+    def subdir(self, name):
+        path = os.path.join(self.path, name)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def size_bytes(self):
+        return _dir_size(self.path)
+
+    def detach(self):
+        """
+        Keep the workspace alive past the with-block, the new owner must call cleanup().
+        """
+        self._detached = True
+        return self
+
+    def cleanup(self):
+        # Safe to call more than once and from several threads, only the first call removes
+        with _active_lock:
+            if self._cleaned:
+                return
+            self._cleaned = True
+        size = self.size_bytes()
+        shutil.rmtree(self.path, ignore_errors=True)
+        with _active_lock:
+            _active.discard(self.path)
+        log.debug("Removed", path=self.path, mb=round(size / (1024 * 1024), 1))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None or not self._detached:
+            self.cleanup()
+        return False
+
+
+def create_workspace():
+    start_janitor()
+    return Workspace()
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            try:
+                total += os.path.getsize(os.path.join(root, file))
+            except OSError:
+                pass
+    return total
+
+
+def _owner_alive(path):
+    try:
+        with open(os.path.join(path, OWNER_FILE)) as f:
+            pid = int(f.read().strip())
+        os.kill(pid, 0)
+    except (OSError, ValueError):
+        return False
+    return True
+
+
+def workspace_usage():
+    """
+    Returns:
+        dict: Number of workspaces on disk, how many this process owns, and total bytes.
+    """
+    names = os.listdir(WORKSPACE_ROOT) if os.path.isdir(WORKSPACE_ROOT) else []
+    with _active_lock:
+        active = len(_active)
+    return {
+        "root": WORKSPACE_ROOT,
+        "workspaces": len(names),
+        "active": active,
+        "bytes": _dir_size(WORKSPACE_ROOT) if names else 0,
+    }
+
+
+def remove_orphans():
+    """
+    Remove workspaces whose owner process is gone or that exceeded the max age.
+
+    Returns:
+        int: Number of workspaces removed.
+    """
+    if not os.path.isdir(WORKSPACE_ROOT):
+        return 0
+    now = time.time()
+    removed = 0
+    for name in os.listdir(WORKSPACE_ROOT):
+        path = os.path.join(WORKSPACE_ROOT, name)
+        try:
+            age = now - os.path.getmtime(path)
+        except OSError:
+            continue
+        with _active_lock:
+            owned_here = path in _active
+        # The grace period covers a workspace created before its owner file is written
+        orphaned = not owned_here and age > 60 and not _owner_alive(path)
+        if age > WORKSPACE_MAX_AGE_SECONDS or orphaned:
+            shutil.rmtree(path, ignore_errors=True)
+            with _active_lock:
+                _active.discard(path)
+            removed += 1
+    if removed:
+        log.info("Janitor removed orphaned workspaces", removed=removed)
+    return removed
+
+
+def _janitor_loop():
+    while True:
+        try:
+            remove_orphans()
+        except Exception as e:
+            log.error("Janitor error", error=str(e))
+        time.sleep(WORKSPACE_JANITOR_INTERVAL)
+
+
+def start_janitor():
+    """
+    Start the background orphan cleaner once per process.
+    """
+    global _janitor
+    with _active_lock:
+        if _janitor is not None:
+            return
+        _janitor = threading.Thread(target=_janitor_loop, name="workspace-janitor", daemon=True)
+        _janitor.start()
@@ -0,0 +1,225 @@
+"""
+Offline karaoke processing for a whole catalog.
+
+Runs the same steps as /karaoke_process (separation, compute_amplitude,
+detect_first_word, align_timestamps_with_amplitude) over many tracks in a
+process pool, and writes one folder per track:
+
+    <output>/<track id>/result.json
+    <output>/<track id>/vocals.mp3
+    <output>/<track id>/accompaniment.mp3
+
+Tracks whose result.json already exists are skipped, so an interrupted run
+can simply be restarted. The stem cache is shared with the API.
+
+Separation is the memory hungry step (one resident TensorFlow model per
+spleeter worker, 1-2 GB each), so it does not scale with --workers: all worker
+processes share a single pool of --separators spleeter workers (default 1),
+hosted by a manager process. --workers only sizes decoding and analysis.
+
+Usage:
+    python batch_karaoke.py --input ~/catalog --output ~/karaoke_out
+    python batch_karaoke.py --manifest tracks.jsonl --output ~/karaoke_out --workers 4 --separators 2
+
+Inputs:
+    --input DIR       every audio file in DIR with a lyrics file next to it
+                      (same name, .lrc or .json)
+    --manifest FILE   JSON lines: {"audio": "...", "lyrics": "...", "id": "optional"}
+"""
+import argparse
+import json
+import multiprocessing
+import multiprocessing.util
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing.managers import BaseManager
+
+AUDIO_EXTENSIONS = {".mp3", ".wav", ".flac", ".ogg", ".m4a"}
+LYRICS_EXTENSIONS = [".lrc", ".json"]
+RESULT_NAME = "result.json"
+
+
+def find_tracks(input_dir):
+    tracks = []
+    for name in sorted(os.listdir(input_dir)):
+        base, ext = os.path.splitext(name)
+        if ext.lower() not in AUDIO_EXTENSIONS:
+            continue
+        for lyrics_ext in LYRICS_EXTENSIONS:
+            lyrics_path = os.path.join(input_dir, base + lyrics_ext)
+            if os.path.exists(lyrics_path):
+                tracks.append({"id": base, "audio": os.path.join(input_dir, name), "lyrics": lyrics_path})
+                break
+        else:
+            print(f"[Skip] No lyrics found for {name}")
+    return tracks
+
+
+def read_manifest(manifest_path):
+    tracks = []
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            audio = os.path.join(base_dir, item["audio"])
+            tracks.append({
+                "id": item.get("id") or os.path.splitext(os.path.basename(audio))[0],
+                "audio": audio,
+                "lyrics": os.path.join(base_dir, item["lyrics"]),
+            })
+    return tracks
+
+
+def load_timestamp_lyrics(lyrics_path):
+    """
+    Read .lrc or .json ([{"timestamp": "mm:ss.xx", "lyric": "..."}]) lyrics into
+    the TimestampLyric list align_timestamps_with_amplitude expects.
+    """
+    from app.services.lyric_timing import TimestampLyric, coerce_timestamp_lyrics
+    from app.services.text_align_forcer import parse_lrc_entries
+
+    with open(lyrics_path, "r", encoding="utf-8") as f:
+        text = f.read()
+
+    if lyrics_path.lower().endswith(".lrc"):
+        return [TimestampLyric(entry["start"], entry["line"]) for entry in parse_lrc_entries(text)]
+    return coerce_timestamp_lyrics(json.loads(text))
+
+
+class SeparatorManager(BaseManager):
+    """
+    Serves one SeparatorPool to every worker process of the batch.
+    """
+
+
+_shared_pool = None
+
+
+def _start_separator_pool(size, max_queue):
+    """
+    Manager process initializer: start the shared spleeter workers.
+    """
+    global _shared_pool
+    from app.services.separator_pool import SeparatorPool
+    from app.services.vocal_separater import env2_python
+
+    # Workers queue for a separator as long as it takes, a batch has no deadline
+    _shared_pool = SeparatorPool(env2_python, size=size, max_queue=max_queue, queue_timeout=None)
+    # atexit does not run in the manager process, its finalizers do
+    multiprocessing.util.Finalize(_shared_pool, _shared_pool.shutdown, exitpriority=10)
+
+
+def _shared_separator_pool():
+    return _shared_pool
+
+
+SeparatorManager.register("separator_pool", callable=_shared_separator_pool)
+
+
+def _use_shared_separator_pool(address, authkey):
+    """
+    Worker process initializer: route separations to the manager's pool.
+    """
+    from app.services.separator_pool import set_separator_pool
+
+    manager = SeparatorManager(address=address, authkey=authkey)
+    manager.connect()
+    set_separator_pool(manager.separator_pool())
+
+
+def process_track(track, output_root):
+    """
+    Process one track in a worker process.
+
+    Returns:
+        tuple: (track id, status, message, seconds)
+    """
+    from app.services.karaoke_pipeline import analyse_track, KaraokeProcessingError
+    from app.utils.workspace import create_workspace
+
+    started = time.time()
+    track_dir = os.path.join(output_root, track["id"])
+    try:
+        timestamp_lyrics = load_timestamp_lyrics(track["lyrics"])
+        with create_workspace() as workspace:
+            # Work on a copy named after the track so spleeter output is predictable
+            audio_path = workspace.file_path(os.path.basename(track["audio"]))
+            shutil.copyfile(track["audio"], audio_path)
+            analysis, stems = analyse_track(workspace, audio_path, timestamp_lyrics)
+
+            os.makedirs(track_dir, exist_ok=True)
+            analysis["stems"] = {}
+            for stem, path in stems.items():
+                file_name = f"{stem}.mp3"
+                shutil.move(path, os.path.join(track_dir, file_name))
+                analysis["stems"][stem] = file_name
+
+        # result.json is written last and atomically, it marks the track as done
+        tmp_path = os.path.join(track_dir, RESULT_NAME + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(analysis, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(track_dir, RESULT_NAME))
+        return track["id"], "done", "", time.time() - started
+    except KaraokeProcessingError as e:
+        return track["id"], "failed", str(e), time.time() - started
+    except Exception as e:
+        return track["id"], "failed", f"{type(e).__name__}: {e}", time.time() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch karaoke processing for offline catalog preparation")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input", help="Directory of audio files with .lrc/.json lyrics next to them")
+    source.add_argument("--manifest", help="JSON lines manifest of {audio, lyrics, id}")
+    parser.add_argument("--output", required=True, help="Output directory, one folder per track")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes for decoding and analysis (default: CPU count)")
+    parser.add_argument("--separators", type=int, default=1,
+                        help="Resident spleeter workers shared by all worker processes (default: 1)")
+    parser.add_argument("--force", action="store_true", help="Reprocess tracks that already have a result.json")
+    args = parser.parse_args(argv)
+
+    tracks = find_tracks(args.input) if args.input else read_manifest(args.manifest)
+    os.makedirs(args.output, exist_ok=True)
+
+    pending = [
+        track for track in tracks
+        if args.force or not os.path.exists(os.path.join(args.output, track["id"], RESULT_NAME))
+    ]
+    workers = max(1, args.workers)
+    separators = max(1, min(args.separators, workers))
+    print(f"[Batch] {len(tracks)} tracks, {len(tracks) - len(pending)} already processed, "
+          f"{len(pending)} to go with {workers} workers and {separators} separators")
+    if not pending:
+        return 0
+
+    started = time.time()
+    failed = 0
+    authkey = bytes(multiprocessing.current_process().authkey)
+    manager = SeparatorManager(authkey=authkey)
+    manager.start(initializer=_start_separator_pool, initargs=(separators, workers))
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_use_shared_separator_pool,
+                                 initargs=(manager.address, authkey)) as executor:
+            futures = [executor.submit(process_track, track, args.output) for track in pending]
+            for done, future in enumerate(as_completed(futures), start=1):
+                track_id, status, message, seconds = future.result()
+                if status != "done":
+                    failed += 1
+                print(f"[Batch] {done}/{len(pending)} {track_id}: {status} ({seconds:.1f}s) {message}".rstrip())
+    finally:
+        manager.shutdown()
+
+    elapsed = time.time() - started
+    print(f"[Batch] Finished {len(pending) - failed} tracks, {failed} failed in {elapsed:.1f}s "
+          f"({len(pending) / elapsed * 3600:.0f} tracks/hour)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
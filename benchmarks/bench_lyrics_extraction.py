@@ -0,0 +1,72 @@
+"""
+Lyrics extraction benchmark on saved Genius pages.
+
+Compares scrape_lyrics() with the previous BeautifulSoup walk over every
+data-lyrics-container div.
+
+Usage:
+    python benchmarks/bench_lyrics_extraction.py [--repeat 50] [page.html ...]
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.song_infor_fetcher import scrape_lyrics  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "*.html")
+
+
+def scrape_lyrics_bs4(html):
+    """
+    The extraction fetch_lyrics_from_genius used before, kept as the baseline.
+    """
+    from bs4 import BeautifulSoup, Tag
+
+    soup = BeautifulSoup(html, "html.parser")
+    lyrics = []
+    for div in soup.find_all("div", attrs={"data-lyrics-container": "true"}):
+        if isinstance(div, Tag):
+            for content in div.contents:
+                if isinstance(content, str):
+                    lyrics.append(content.strip())
+                elif isinstance(content, Tag) and content.name == "br":
+                    lyrics.append("\n")
+                elif isinstance(content, Tag) and content.name == "a":
+                    lyrics.append(content.get_text(separator="\n", strip=True))
+                    lyrics.append("\n")
+    lyrics = " ".join(lyrics).strip()
+    return "\n".join(line for line in lyrics.split("\n") if not line.startswith("[") and line.strip())
+
+
+def _time(fn, html, repeat):
+    fn(html)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn(html)
+    return (time.perf_counter() - started) / repeat * 1000, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Genius lyrics extraction")
+    parser.add_argument("pages", nargs="*", help="Saved Genius pages (default: benchmarks/fixtures/*.html)")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    pages = args.pages or sorted(glob.glob(FIXTURES))
+    for path in pages:
+        with open(path, "r", encoding="utf-8") as f:
+            html = f.read()
+        new_ms, new_lyrics = _time(scrape_lyrics, html, args.repeat)
+        old_ms, old_lyrics = _time(scrape_lyrics_bs4, html, args.repeat)
+        print(f"{os.path.basename(path)} ({len(html) / 1024:.0f} KB): "
+              f"scrape_lyrics {new_ms:.2f} ms ({len(new_lyrics.splitlines())} lines), "
+              f"bs4 {old_ms:.2f} ms ({len(old_lyrics.splitlines())} lines), {old_ms / new_ms:.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+import json
+import socket
+import time
+import unittest
+
+from app.services.gentle_client import GentleClient
+from tests.stub_server import StubServer
+
+ALIGNMENT = {"transcript": "hello world", "words": [{"word": "hello", "case": "success", "start": 0.1, "end": 0.4}]}
+
+
+class StubGentle(StubServer):
+    """
+    Local stand-in for a Gentle server. POST /transcriptions answers with the
+    next of `statuses` (the last one repeats), ALIGNMENT on 200, after `delay`
+    seconds; requests are counted.
+    """
+
+    def __init__(self, statuses=(200,), delay=0.0):
+        self.statuses = list(statuses)
+        self.delay = delay
+        self.requests = 0
+        super().__init__()
+        self.url += "/transcriptions"
+
+    def respond(self, method, path, body):
+        status = self.statuses[min(self.requests, len(self.statuses) - 1)]
+        self.requests += 1
+        time.sleep(self.delay)
+        payload = json.dumps(ALIGNMENT if status == 200 else {"error": "busy"}).encode("utf-8")
+        return status, payload, "application/json"
+
+
+def _closed_port_url():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}/transcriptions"
+
+
+class GentleClientTest(unittest.TestCase):
+    def setUp(self):
+        self.stubs = []
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.close()
+        for stub in self.stubs:
+            stub.close()
+
+    def _stub(self, **kwargs):
+        stub = StubGentle(**kwargs)
+        self.stubs.append(stub)
+        return stub
+
+    def _client(self, urls, **kwargs):
+        client = GentleClient(urls, **kwargs)
+        self.clients.append(client)
+        return client
+
+    def test_align_returns_gentle_json(self):
+        stub = self._stub()
+        result, error = self._client([stub.url]).align(b"RIFF", "hello world")
+        self.assertIsNone(error)
+        self.assertEqual(result, ALIGNMENT)
+        self.assertEqual(stub.requests, 1)
+
+    def test_unavailable_status_is_retried(self):
+        stub = self._stub(statuses=(503, 200))
+        result, error = self._client([stub.url], retries=2).align(b"RIFF", "hello world")
+        self.assertIsNone(error)
+        self.assertEqual(result, ALIGNMENT)
+        self.assertEqual(stub.requests, 2)
+
+    def test_retries_are_bounded(self):
+        stub = self._stub(statuses=(503,))
+        result, error = self._client([stub.url], retries=2).align(b"RIFF", "hello world")
+        self.assertIsNone(result)
+        self.assertIn("503", error)
+        self.assertEqual(stub.requests, 3)
+
+    def test_refused_connection_is_retried_on_next_instance(self):
+        healthy = self._stub()
+        client = self._client([_closed_port_url(), healthy.url], retries=1)
+        result, error = client.align(b"RIFF", "hello world")
+        self.assertIsNone(error)
+        self.assertEqual(result, ALIGNMENT)
+        self.assertEqual(healthy.requests, 1)
+        self.assertTrue(client.stats()[0]["down"])
+
+    def test_read_timeout_is_not_retried(self):
+        slow = self._stub(delay=0.5)
+        client = self._client([slow.url], retries=2, timeout=(1, 0.1))
+        result, error = client.align(b"RIFF", "hello world")
+        self.assertIsNone(result)
+        self.assertIn("timed out", error)
+        self.assertEqual(slow.requests, 1)
+
+    def test_client_error_is_not_retried(self):
+        stub = self._stub(statuses=(400,))
+        result, error = self._client([stub.url], retries=2).align(b"RIFF", "hello world")
+        self.assertIsNone(result)
+        self.assertIn("400", error)
+        self.assertEqual(stub.requests, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+import urllib.parse
+
+from app.services import song_infor_fetcher
+from app.services.lyrics_cache import LyricsCache
+from tests.stub_server import StubServer
+
+
+class StubGenius(StubServer):
+    """
+    Local stand-in for the Genius API and song pages, counting requests.
+    Searches containing "glass" find one song, anything else finds nothing.
+    """
+
+    def __init__(self, search_delay=0.0):
+        self.search_delay = search_delay
+        self.searches = 0
+        self.pages = 0
+        super().__init__()
+
+    def respond(self, method, path, body):
+        url = urllib.parse.urlsplit(path)
+        if url.path == "/search":
+            self.searches += 1
+            time.sleep(self.search_delay)
+            query = urllib.parse.parse_qs(url.query).get("q", [""])[0]
+            hits = [{"result": self.song(42, "Castle of Glass", "Linkin Park")}] if "glass" in query else []
+            return 200, json.dumps({"response": {"hits": hits}}).encode("utf-8"), "application/json"
+        self.pages += 1
+        return 200, b'<div data-lyrics-container="true">Take me down to the river bend<br>Take me down</div>', "text/html"
+
+    def song(self, song_id, title, artist):
+        return {
+            "id": song_id,
+            "title": title,
+            "full_title": f"{title} by {artist}",
+            "artist_names": artist,
+            "url": f"{self.url}/songs/{song_id}",
+            "song_art_image_url": "",
+        }
+
+    @property
+    def requests(self):
+        return self.searches + self.pages
+
+
+class FetchLyricsCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.saved = {
+            name: getattr(song_infor_fetcher, name)
+            for name in ("GENIUS_API_URL", "GENIUS_READ_TIMEOUT", "lyrics_cache")
+        }
+        song_infor_fetcher.lyrics_cache = LyricsCache(os.path.join(self.tmpdir.name, "lyrics.sqlite3"))
+        song_infor_fetcher._session = None
+        song_infor_fetcher.reset_title_index()
+
+    def tearDown(self):
+        for name, value in self.saved.items():
+            setattr(song_infor_fetcher, name, value)
+        song_infor_fetcher._session = None
+        song_infor_fetcher.reset_title_index()
+        self.tmpdir.cleanup()
+
+    def _stub(self, **kwargs):
+        stub = StubGenius(**kwargs)
+        self.addCleanup(stub.close)
+        song_infor_fetcher.GENIUS_API_URL = stub.url
+        return stub
+
+    def test_repeated_query_makes_no_request(self):
+        stub = self._stub()
+        payload, error = song_infor_fetcher.fetch_lyrics_from_genius("Castle of Glass")
+        self.assertIsNone(error)
+        self.assertEqual(payload["title"], "Castle of Glass by Linkin Park")
+        self.assertEqual((stub.searches, stub.pages), (1, 1))
+
+        # Same query, and a spelling that normalizes to it
+        for query in ("Castle of Glass", "castle of glass!"):
+            self.assertEqual(song_infor_fetcher.fetch_lyrics_from_genius(query), (payload, None))
+        self.assertEqual(stub.requests, 2)
+
+    def test_not_found_is_remembered(self):
+        stub = self._stub()
+        for _ in range(2):
+            payload, error = song_infor_fetcher.fetch_lyrics_from_genius("no such song")
+            self.assertIsNone(payload)
+            self.assertEqual(error, "Lyrics not found")
+        self.assertEqual(stub.requests, 1)
+
+    def test_read_timeout_is_not_retried(self):
+        stub = self._stub(search_delay=0.5)
+        song_infor_fetcher.GENIUS_READ_TIMEOUT = 0.1
+        payload, error = song_infor_fetcher.fetch_lyrics_from_genius("Castle of Glass")
+        self.assertIsNone(payload)
+        self.assertIn("unreachable", error)
+        self.assertEqual(stub.searches, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
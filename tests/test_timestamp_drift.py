@@ -0,0 +1,27 @@
+import unittest
+
+import numpy as np
+
+from app.services.timestamp_drift import fit_drift
+
+
+class FitDriftTest(unittest.TestCase):
+    def test_constant_offset_snaps_to_onsets(self):
+        fit = fit_drift([10, 20, 30, 40], [11, 21, 31, 41])
+        self.assertAlmostEqual(fit.offset, 1.0, places=2)
+        self.assertAlmostEqual(fit.scale, 1.0, places=3)
+        np.testing.assert_allclose(fit.starts, [11, 21, 31, 41])
+        self.assertEqual(fit.inliers, 4)
+
+    def test_lines_sharing_an_onset_keep_increasing_starts(self):
+        fit = fit_drift([10, 10.01, 40, 70], [10.3, 40, 70])
+        self.assertAlmostEqual(fit.starts[0], 10.3)
+        self.assertGreater(fit.starts[1], fit.starts[0])
+        self.assertTrue(np.all(np.diff(fit.starts) > 0))
+        # The line that lost the onset is not counted as matched
+        self.assertEqual(fit.confidence[1], 0.0)
+        self.assertEqual(fit.inliers, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()